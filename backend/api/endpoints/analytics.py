@@ -1,61 +1,69 @@
-from fastapi import APIRouter, HTTPException, Header
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Header, Query
+from typing import List, Dict, Any, Optional, Literal
+from pydantic import BaseModel
+from datetime import datetime
 
 from models.history import ListeningHistory
-from models.song import Song
-from datetime import datetime, timedelta
-from collections import Counter
+from services.analytics import listening_stats
+from services.play_buffer import play_buffer, PlayBufferFull
 
 router = APIRouter()
 
+# Upper bound on plays accepted in one offline sync
+MAX_BATCH_EVENTS = 1000
+
+async def _buffer(*events: ListeningHistory) -> int:
+    try:
+        return await play_buffer.add(*events)
+    except PlayBufferFull:
+        # Plays can't be written right now (e.g. MongoDB is down); the PWA keeps them and retries
+        raise HTTPException(status_code=503, detail="Play events can't be recorded right now, try again later")
+
+class PlayEvent(BaseModel):
+    song_id: str
+    timestamp: Optional[datetime] = None
+
+class PlayBatch(BaseModel):
+    events: List[PlayEvent]
+
 @router.post("/track")
 async def track_play(song_id: str, x_user_id: Optional[str] = Header(None)):
     """
     Record a play event for a song.
+    Events are buffered and written in batches.
     """
     event = ListeningHistory(song_id=song_id, owner_id=x_user_id)
-    await event.insert()
+    await _buffer(event)
     return {"status": "success"}
 
+@router.post("/track/batch")
+async def track_plays(batch: PlayBatch, x_user_id: Optional[str] = Header(None)):
+    """
+    Record several play events at once, e.g. plays queued while the PWA was offline.
+    """
+    if len(batch.events) > MAX_BATCH_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_EVENTS} events per batch")
+
+    now = datetime.now()
+    events = []
+    for play in batch.events:
+        timestamp = play.timestamp or now
+        if timestamp.tzinfo is not None:
+            # History is stored in server-local naive time
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        events.append(ListeningHistory(song_id=play.song_id, owner_id=x_user_id, timestamp=min(timestamp, now)))
+
+    accepted = await _buffer(*events)
+    return {"status": "success", "accepted": accepted}
+
 @router.get("/stats")
-async def get_stats(x_user_id: Optional[str] = Header(None)):
+async def get_stats(
+    x_user_id: Optional[str] = Header(None),
+    window: Literal["7d", "30d", "all"] = "all",
+    limit: int = Query(5, ge=1, le=50)
+):
     """
     Get aggregated listening stats for the current user.
+    `window` limits top songs and totals to the last 7/30 days; `limit` sets how many top songs to return.
     """
-    # Filter history by owner_id
-    if x_user_id:
-        history = await ListeningHistory.find(ListeningHistory.owner_id == x_user_id).to_list()
-    else:
-        history = await ListeningHistory.find_all().to_list()
-    
-    # Calculate Top Songs
-    song_counts = Counter(h.song_id for h in history)
-    top_song_ids = song_counts.most_common(5)
-    
-    top_songs = []
-    for song_id, count in top_song_ids:
-        song = await Song.get(song_id)
-        if song:
-            top_songs.append({
-                "id": song_id,
-                "filename": song.filename,
-                "artist": song.artist,
-                "plays": count
-            })
-
-    # Calculate Plays per day (last 7 days, filtered by user)
-    now = datetime.now()
-    daily_stats = []
-    for i in range(6, -1, -1):
-        day = (now - timedelta(days=i)).date()
-        count = sum(1 for h in history if h.timestamp.date() == day)
-        daily_stats.append({
-            "name": day.strftime("%a"),
-            "plays": count
-        })
-
-    return {
-        "top_songs": top_songs,
-        "daily_activity": daily_stats,
-        "total_plays": len(history)
-    }
+    return await listening_stats(x_user_id, window=window, limit=limit)
@@ -1,179 +1,87 @@
 from fastapi import APIRouter, Query, HTTPException, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
-import yt_dlp
-import os
-import uuid
-import time
-import random
-from models.song import Song
+import json
+from services.external_search import external_search
+from services.imports import import_queue, ImportJob, ImportFailed, QueueFull
 
 router = APIRouter()
 
-UPLOAD_DIR = "uploaded_songs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 @router.get("/search")
 async def search_external(q: str = Query(..., min_length=1)):
     """
     Search YouTube for videos using ytmusicapi.
+    Results are cached per normalized query and concurrent identical searches share one lookup.
     """
     try:
-        from ytmusicapi import YTMusic
-        yt = YTMusic()
-        results = yt.search(q, filter="songs")
-        
-        formatted_results = []
-        for entry in results:
-            # Safe extraction of artist
-            artists = entry.get('artists', [])
-            artist_name = artists[0]['name'] if artists else "Unknown Artist"
-            
-            # Safe extraction of thumbnails
-            thumbnails = entry.get('thumbnails', [])
-            thumbnail_url = thumbnails[-1]['url'] if thumbnails else ""
-            
-            formatted_results.append({
-                "id": entry.get('videoId'),
-                "title": entry.get('title'),
-                "thumbnails": [{"url": thumbnail_url}],
-                "duration": entry.get('duration', "0:00"),
-                "channel": artist_name,
-                "link": f"https://www.youtube.com/watch?v={entry.get('videoId')}"
-            })
-            
+        formatted_results = await external_search.search(q)
         return {"results": formatted_results}
     except Exception as e:
         print(f"Search error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/search/stats")
+async def search_cache_stats():
+    """
+    Hit/miss counters for the external search cache.
+    """
+    return external_search.stats()
+
+def _parse_moods(moods: Optional[str]) -> List[str]:
+    return [m.strip() for m in moods.split(',')] if moods else []
+
+def _submit(video_url: str, x_user_id: Optional[str], moods: Optional[str]) -> ImportJob:
+    try:
+        return import_queue.submit(video_url, owner_id=x_user_id, moods=_parse_moods(moods))
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Import queue is full, please try again shortly.")
+
 @router.post("/import")
 async def import_from_youtube(video_url: str, x_user_id: Optional[str] = Header(None), moods: Optional[str] = None):
     """
     Download audio from YouTube and register it in the local library with smart client rotation.
+    Runs on the import worker pool and waits for the result; use /imports for a non-blocking job.
     """
-    file_id = str(uuid.uuid4())
-    output_template = f"{UPLOAD_DIR}/{file_id}.%(ext)s"
-    
-    cookies_content = os.getenv("YOUTUBE_COOKIES")
-    cookie_file = None
-    if cookies_content:
-        cookie_file = "cookies.txt"
-        with open(cookie_file, "w") as f:
-            f.write(cookies_content)
+    job = _submit(video_url, x_user_id, moods)
+    try:
+        return await job.wait()
+    except ImportFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.post("/imports", response_model=ImportJob, status_code=202)
+async def submit_import(video_url: str, x_user_id: Optional[str] = Header(None), moods: Optional[str] = None):
+    """
+    Queue a YouTube import and return the job immediately.
+    """
+    return _submit(video_url, x_user_id, moods)
 
-    # List of client types and stealth settings to try
-    # Expanded list to cover every possible fallback
-    # Comprehensive client rotation for cloud environments
-    if cookie_file:
-        clients_to_try = [
-            {'client': ['android'], 'ua': 'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36'},
-            {'client': ['mweb'], 'ua': 'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36'},
-            {'client': ['ios'], 'ua': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1'},
-            {'client': ['web'], 'ua': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'}
-        ]
-    else:
-        clients_to_try = [
-            {'client': ['android'], 'ua': 'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36'},
-            {'client': ['ios'], 'ua': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1'},
-            {'client': ['tv_embedded'], 'ua': 'Mozilla/5.0 (SMART-TV; Linux; Tizen 6.0) AppleWebkit/537.36 (KHTML, like Gecko) SamsungBrowser/4.0 Chrome/88.0.4324.182 TV Safari/537.36'},
-            {'client': ['android_music'], 'ua': 'com.google.android.apps.youtube.music/6.41.52 (Linux; U; Android 14; en_US; Pixel 8 Pro; Build/UQ1A.240205.004)'}
-        ]
-    
-    last_error = None
-    for attempt, config in enumerate(clients_to_try):
-        if attempt > 0:
-            time.sleep(random.uniform(3.0, 7.0))
+@router.get("/imports/{job_id}", response_model=ImportJob)
+async def get_import(job_id: str):
+    job = import_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@router.get("/imports/{job_id}/events")
+async def import_events(job_id: str):
+    """
+    Server-Sent Events stream of job status/progress until the job finishes.
+    """
+    job = import_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
 
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': output_template,
-            'noplaylist': True,
-            'quiet': True,
-            'verbose': True,
-            'force_ipv4': True,
-            'nocheckcertificate': True,
-            'rm_cachedir': True,
-            'remote_components': ['ejs:github'],
-            'extractor_args': {
-                'youtube': {
-                    'player_client': config['client'],
-                    # Use Deno (installed in Dockerfile) to solve player challenges (PO Token)
-                    'player_skip': ['web_safari', 'web_embedded_player_es6'],
-                }
-            },
-            'allow_unplayable_formats': True,
-            'referer': 'https://www.youtube.com/',
-            'http_headers': {
-                'User-Agent': config['ua'],
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-            }
-        }
-        
-        if cookie_file:
-            ydl_opts['cookiefile'] = cookie_file
-            
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=True)
-                
-                actual_filename = None
-                for f in os.listdir(UPLOAD_DIR):
-                    if f.startswith(file_id):
-                        actual_filename = f
-                        break
-                
-                if not actual_filename:
-                    continue
-                    
-                duration = info.get('duration')
-                title = info.get('title', 'Unknown External Track')
-                artist = info.get('uploader', 'Unknown Artist')
-                mood_list = [m.strip() for m in moods.split(',')] if moods else []
-                
-                new_song = Song(
-                    _id=file_id,
-                    filename=f"{title}.{actual_filename.split('.')[-1]}",
-                    original_filename=actual_filename,
-                    url=f"/api/songs/{file_id}",
-                    artist=artist,
-                    duration=duration,
-                    owner_id=x_user_id,
-                    moods=mood_list
-                )
-                await new_song.create()
-                return new_song
-                
-        except Exception as e:
-            last_error = e
-            error_msg = str(e).lower()
-            print(f"DEBUG: Attempt {attempt+1} ({config['client']}) failed: {error_msg}")
-            
-            # Special markers for bot detection and cookie issues
-            # We handle both straight (') and curly (’) quotes as both appear in different YouTube clients
-            error_markers = [
-                "sign in to confirm you're not a bot", 
-                "sign in to confirm you’re not a bot",
-                "bot detection", 
-                "confirm you're human",
-                "confirm you’re human",
-                "cookies are no longer valid", 
-                "rotated in the browser"
-            ]
-            
-            if any(marker in error_msg for marker in error_markers):
-                # If we're hit with anything that suggests login/bot, we return 401 with instructions
-                raise HTTPException(
-                    status_code=401, 
-                    detail="Import blocked: YouTube requested login OR cookies expired. Action Required: Provide fresh cookies from a real browser session. See walkthrough.md for instructions."
-                )
-            
-            continue
+    async def event_stream():
+        while True:
+            yield f"event: {job.status}\ndata: {json.dumps(jsonable_encoder(job))}\n\n"
+            if job.finished:
+                return
+            # Heartbeat every 15s keeps proxies from closing an idle stream
+            await job.wait_for_change(timeout=15)
 
-    # Final Failure Message
-    error_msg = str(last_error) if last_error else "All download methods exhausted."
-    user_hint = ""
-    if "requested format is not available" in str(error_msg).lower():
-        user_hint = " Your cookies might be expired or don't have enough permission for this specific video."
-    
-    raise HTTPException(status_code=500, detail=f"Import blocked by YouTube: {error_msg}.{user_hint} Check walkthrough.md.")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
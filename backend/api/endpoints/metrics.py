@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+from services.metrics import registry, CONTENT_TYPE
+
+router = APIRouter()
+
+@router.get("")
+async def get_metrics():
+    """
+    Prometheus scrape target: route latencies and in-flight requests, MongoDB
+    command timings per collection, yt-dlp downloads and event-loop lag.
+    Counters are per worker process.
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
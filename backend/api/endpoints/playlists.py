@@ -1,10 +1,23 @@
-from fastapi import APIRouter, HTTPException, status, Header
-from typing import List, Optional
-from models.playlist import Playlist, SongRef
+from fastapi import APIRouter, HTTPException, status, Header, Query, Request, Response, Depends
+from typing import List, Optional, Literal
+from models.playlist import Playlist, SongRef, PlaylistOperation, PlaylistDelta
 from pydantic import BaseModel
+from services.search_index import index_playlist, remove_entry
+from services.listing import ListingSchema, list_documents, dumps
+from services.library_cache import library_cache
+from services import playlists as playlist_edits
+from services import library
+from services.loaders import SongLoader, song_loader
+from services.conditional import weak_etag, not_modified, library_headers, not_modified_response
 
 router = APIRouter()
 
+playlist_listing = ListingSchema(Playlist, object_ids=True)
+
+class PlaylistVersion(BaseModel):
+    owner_id: Optional[str] = None
+    version: int = 0
+
 class CreatePlaylist(BaseModel):
     name: str
     description: str = None
@@ -17,40 +30,98 @@ async def create_playlist(playlist_data: CreatePlaylist, x_user_id: Optional[str
         owner_id=x_user_id
     )
     await playlist.insert()
+    await index_playlist(playlist)
+    await library.record_change(playlist.owner_id, "playlist", str(playlist.id))
     return playlist
 
 @router.get("", response_model=List[Playlist])
-async def get_playlists(x_user_id: Optional[str] = Header(None)):
-    if x_user_id:
-        return await Playlist.find(Playlist.owner_id == x_user_id).to_list()
-    return await Playlist.find_all().to_list()
+async def get_playlists(
+    request: Request,
+    x_user_id: Optional[str] = Header(None),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
+    """
+    List playlists oldest first, streamed from the database.
+    Supports the same `limit`/`cursor`/`fields`/`format` options as /api/songs;
+    `fields=name,description` skips the embedded song lists.
+    """
+    version = await library.current_version(x_user_id)
+    headers = library_headers(weak_etag("playlists", version))
+    if not_modified(request.headers, headers["ETag"]):
+        return not_modified_response(headers)
+    query = {"owner_id": x_user_id} if x_user_id else {}
+    return await library_cache.respond(
+        library_cache.key(x_user_id, "playlists", version, request),
+        lambda: list_documents(playlist_listing, query, limit=limit, cursor=cursor, fields=fields, format=format, headers=headers),
+    )
+
+async def _playlist_response(id: str, headers: dict) -> Response:
+    doc = await Playlist.get_motor_collection().find_one({"_id": playlist_edits.object_id(id)})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    return Response(dumps(playlist_listing.serialize(doc)), media_type="application/json", headers=headers)
 
 @router.get("/{id}", response_model=Playlist)
-async def get_playlist(id: str, x_user_id: Optional[str] = Header(None)):
-    playlist = await Playlist.get(id)
-    if not playlist:
+async def get_playlist(id: str, request: Request, x_user_id: Optional[str] = Header(None)):
+    # Check owner and version first, so a revalidation doesn't load the song list
+    summary = await Playlist.find_one(Playlist.id == playlist_edits.object_id(id)).project(PlaylistVersion)
+    if not summary:
         raise HTTPException(status_code=404, detail="Playlist not found")
     
     # Ownership Check (Optional: Allow viewing if you have the ID, but filter list)
-    if playlist.owner_id and playlist.owner_id != x_user_id:
+    if summary.owner_id and summary.owner_id != x_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to access this playlist")
-        
-    return playlist
 
-@router.post("/{id}/songs", response_model=Playlist)
-async def add_song_to_playlist(id: str, song: SongRef, x_user_id: Optional[str] = Header(None)):
-    playlist = await Playlist.get(id)
-    if not playlist:
-        raise HTTPException(status_code=404, detail="Playlist not found")
-    
-    if playlist.owner_id and playlist.owner_id != x_user_id:
-        raise HTTPException(status_code=403, detail="Not authorized to modify this playlist")
-    
-    if not any(s.id == song.id for s in playlist.songs):
-         playlist.songs.append(song)
-         await playlist.save()
-         
-    return playlist
+    headers = library_headers(weak_etag("playlist", id, summary.version))
+    if not_modified(request.headers, headers["ETag"]):
+        return not_modified_response(headers)
+    return await library_cache.respond(
+        library_cache.key(f"playlist:{id}", "playlist", summary.version),
+        lambda: _playlist_response(id, headers),
+    )
+
+@router.post("/{id}/songs", response_model=PlaylistDelta)
+async def add_song_to_playlist(
+    id: str,
+    song: SongRef,
+    position: Optional[int] = Query(None, ge=0),
+    x_user_id: Optional[str] = Header(None),
+    songs: SongLoader = Depends(song_loader)
+):
+    """
+    Add a song at `position` (default: the end) with a single atomic update.
+    Returns the new version and the applied operation rather than the whole playlist;
+    `operations` is empty if the song was already there.
+    """
+    await playlist_edits.complete_refs([song], x_user_id, songs)
+    delta = await playlist_edits.add_song(id, x_user_id, song, position)
+    if delta.operations:
+        await library.record_change(delta.owner_id, "playlist", id)
+    return delta
+
+class EditPlaylistSongs(BaseModel):
+    operations: List[PlaylistOperation]
+    expected_version: Optional[int] = None
+
+@router.patch("/{id}/songs", response_model=PlaylistDelta)
+async def edit_playlist_songs(
+    id: str,
+    edit: EditPlaylistSongs,
+    x_user_id: Optional[str] = Header(None),
+    songs: SongLoader = Depends(song_loader)
+):
+    """
+    Add, remove and move songs in one atomic update, applied in order.
+    Pass `expected_version` to get a 409 instead of editing a playlist that changed meanwhile.
+    """
+    await playlist_edits.complete_refs([op.song for op in edit.operations if op.op == "add"], x_user_id, songs)
+    delta = await playlist_edits.edit_songs(id, x_user_id, edit.operations, edit.expected_version)
+    if delta.operations:
+        await library.record_change(delta.owner_id, "playlist", id)
+    return delta
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_playlist(id: str, x_user_id: Optional[str] = Header(None)):
@@ -62,6 +133,8 @@ async def delete_playlist(id: str, x_user_id: Optional[str] = Header(None)):
         raise HTTPException(status_code=403, detail="Not authorized to delete this playlist")
         
     await playlist.delete()
+    await remove_entry("playlist", id)
+    await library.record_change(playlist.owner_id, "playlist", id, deleted=True)
 
 class UpdatePlaylist(BaseModel):
     name: Optional[str] = None
@@ -69,35 +142,16 @@ class UpdatePlaylist(BaseModel):
 
 @router.put("/{id}", response_model=Playlist)
 async def update_playlist(id: str, playlist_data: UpdatePlaylist, x_user_id: Optional[str] = Header(None)):
-    playlist = await Playlist.get(id)
-    if not playlist:
-        raise HTTPException(status_code=404, detail="Playlist not found")
-    
-    if playlist.owner_id and playlist.owner_id != x_user_id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this playlist")
-    
+    changes = playlist_data.model_dump(exclude_none=True)
+    playlist = await playlist_edits.update_details(id, x_user_id, changes)
+    if changes:
+        await library.record_change(playlist.owner_id, "playlist", id)
     if playlist_data.name is not None:
-        playlist.name = playlist_data.name
-    if playlist_data.description is not None:
-        playlist.description = playlist_data.description
-        
-    await playlist.save()
+        await index_playlist(playlist)
     return playlist
 
-@router.delete("/{id}/songs/{song_id}", response_model=Playlist)
+@router.delete("/{id}/songs/{song_id}", response_model=PlaylistDelta)
 async def remove_song_from_playlist(id: str, song_id: str, x_user_id: Optional[str] = Header(None)):
-    playlist = await Playlist.get(id)
-    if not playlist:
-        raise HTTPException(status_code=404, detail="Playlist not found")
-    
-    if playlist.owner_id and playlist.owner_id != x_user_id:
-        raise HTTPException(status_code=403, detail="Not authorized to modify this playlist")
-    
-    original_length = len(playlist.songs)
-    playlist.songs = [s for s in playlist.songs if s.id != song_id]
-    
-    if len(playlist.songs) == original_length:
-         raise HTTPException(status_code=404, detail="Song not found in playlist")
-
-    await playlist.save()
-    return playlist
+    delta = await playlist_edits.remove_song(id, x_user_id, song_id)
+    await library.record_change(delta.owner_id, "playlist", id)
+    return delta
@@ -0,0 +1,74 @@
+import sys
+from fastapi import APIRouter, Query, Header, Depends, HTTPException
+from typing import List, Optional
+from models.song import Song
+from models.history import ListeningHistory
+from services.loaders import SongLoader, song_loader
+
+router = APIRouter()
+
+# services.recommendations pulls in numpy and scipy, so startup imports it on a
+# worker thread; the handlers only use it once that has finished
+
+# Recent plays used as seeds for "Recommended for you"
+SEED_PLAYS = 50
+# The very latest of those are left out of the results
+SKIP_RECENT = 5
+
+def _recommender():
+    # None while startup is still importing it; importing here would block the loop
+    module = sys.modules.get("services.recommendations")
+    return getattr(module, "recommender", None)
+
+async def _songs(ranked: List[str], owner_id: Optional[str], limit: int, songs: SongLoader) -> List[Song]:
+    # Keep the ranking; drop songs that are gone or belong to someone else
+    found = await songs.load_many(ranked)
+    return [song for song in found if song and (not owner_id or song.owner_id == owner_id)][:limit]
+
+@router.get("", response_model=List[Song])
+async def recommended_for_you(
+    x_user_id: Optional[str] = Header(None),
+    limit: int = Query(20, ge=1, le=100),
+    songs: SongLoader = Depends(song_loader)
+):
+    """
+    Songs often played alongside what the user listened to recently, minus the last few played.
+    Empty until there is enough listening history, or while the server is starting.
+    """
+    recommender = _recommender()
+    if recommender is None:
+        return []
+    recent = await ListeningHistory.get_motor_collection().find(
+        {"owner_id": x_user_id}, {"_id": 0, "song_id": 1}
+    ).sort("timestamp", -1).limit(SEED_PLAYS).to_list(length=SEED_PLAYS)
+    seeds = list(dict.fromkeys(play["song_id"] for play in recent))
+    # The latest plays count most
+    weights = [1.0 / (rank + 1) ** 0.5 for rank in range(len(seeds))]
+    ranked = recommender.recommend(seeds, limit * 3, weights=weights, exclude=set(seeds[:SKIP_RECENT]))
+    return await _songs([song_id for song_id, _ in ranked], x_user_id, limit, songs)
+
+@router.get("/up-next/{song_id}", response_model=List[Song])
+async def up_next(
+    song_id: str,
+    x_user_id: Optional[str] = Header(None),
+    limit: int = Query(10, ge=1, le=100),
+    songs: SongLoader = Depends(song_loader)
+):
+    """
+    Songs most often played around this one, best first.
+    """
+    recommender = _recommender()
+    if recommender is None:
+        return []
+    ranked = recommender.similar(song_id, limit * 3)
+    return await _songs([song_id for song_id, _ in ranked], x_user_id, limit, songs)
+
+@router.get("/stats")
+async def recommendation_stats():
+    """
+    Size and freshness of the co-play index.
+    """
+    recommender = _recommender()
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommendations are still loading")
+    return recommender.stats()
@@ -1,41 +1,24 @@
-from fastapi import APIRouter, Query
-from typing import List, Dict, Any
-from models.song import Song
-from models.playlist import Playlist
-import re
+from fastapi import APIRouter, Query, Header, HTTPException
+from typing import Dict, Any, Optional, Literal
+from services.search_index import search_library
 
 router = APIRouter()
 
-@router.get("/", response_model=Dict[str, List[Any]])
-async def search(query: str = Query(..., min_length=1)):
+@router.get("/", response_model=Dict[str, Any])
+async def search(
+    query: str = Query(..., min_length=1),
+    x_user_id: Optional[str] = Header(None),
+    type: Literal["all", "songs", "playlists"] = "all",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
     """
     Search for songs and playlists matching the query string.
+    Every query word matches as a word prefix; results are ranked, scoped to the
+    caller's library and paginated with the returned `next_cursor`.
     """
-    if not query:
-        return {"songs": [], "playlists": []}
-
-    # Case-insensitive regex search
-    regex_pattern = {"$regex": query, "$options": "i"}
-
-    # Search Songs (filename, title, artist)
-    # Note: 'title' field might not be populated for all, focusing on filename/artist
-    songs = await Song.find(
-        {
-            "$or": [
-                {"filename": regex_pattern},
-                {"original_filename": regex_pattern},
-                {"artist": regex_pattern},
-                {"title": regex_pattern} 
-            ]
-        }
-    ).to_list()
-
-    # Search Playlists (name)
-    playlists = await Playlist.find(
-        {"name": regex_pattern}
-    ).to_list()
-
-    return {
-        "songs": songs,
-        "playlists": playlists
-    }
+    kinds = {"all": ("song", "playlist"), "songs": ("song",), "playlists": ("playlist",)}[type]
+    try:
+        return await search_library(query, owner_id=x_user_id, limit=limit, cursor=cursor, kinds=kinds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,16 +1,27 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Form
-from fastapi.responses import FileResponse
-import shutil
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Form, Query, Response, Request
 import os
 import uuid
-from typing import Optional, List
+from typing import Optional, List, Literal
+from pydantic import BaseModel
 from models.song import Song
+from models.waveform import Waveform
+from services.streaming import RangeFileResponse
+from services.storage import storage
+from services.search_index import index_song, remove_entry
+from services.listing import ListingSchema, list_documents
+from services.ingest import ingest
+from services.transcode import transcoder, choose_rendition, RENDITIONS, HLS_MEDIA_TYPES
+from services.conditional import weak_etag, not_modified, library_headers, not_modified_response
+from services import library
+from services.moods import parse_moods, mood_query, mood_counts
+from services.library_cache import library_cache
+
+# A song id always points at the same stored file
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 router = APIRouter()
 
-# Directory to store uploaded songs
-UPLOAD_DIR = "uploaded_songs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+song_listing = ListingSchema(Song)
 
 @router.post("/upload")
 async def upload_song(
@@ -24,21 +35,22 @@ async def upload_song(
     file_id = str(uuid.uuid4())
     file_extension = os.path.splitext(file.filename)[1]
     file_name = f"{file_id}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, file_name)
+    file_path = storage.path_for(file_id, file_extension)
     
-    # Save file to disk
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save file to disk (sharded by song id) and index it, off the event loop
+    await ingest.save_upload(file.file, file_path)
+    storage.register(file_id, file_path)
+    # Opus/AAC/HLS renditions are built in the background
+    transcoder.schedule(file_id, file_path)
     
-    # Extract metadata using Mutagen
-    duration = None
-    try:
-        from mutagen import File as MutagenFile
-        audio = MutagenFile(file_path)
-        if audio is not None and audio.info is not None:
-            duration = audio.info.length
-    except Exception as e:
-        print(f"Error extracting metadata: {e}")
+    # Duration from the tags (Mutagen) in the ingest process pool; the waveform's
+    # ffmpeg decode runs in the background and /waveform waits for it if asked early
+    duration = await ingest.duration(file_path)
+    analysis = None
+    if duration is None:
+        # Unreadable tags (rare): measure the decode instead, which also yields the waveform
+        analysis = await ingest.analyze(file_path)
+        duration = analysis.duration
     
     # Parse moods from comma-separated string
     mood_list = [m.strip() for m in moods.split(',')] if moods else []
@@ -54,27 +66,150 @@ async def upload_song(
         moods=mood_list
     )
     await new_song.create()
+    await index_song(new_song)
+    await library.record_change(x_user_id, "song", file_id)
+    if analysis is not None:
+        await ingest.store_waveform(file_id, analysis)
+    else:
+        ingest.schedule_waveform(file_id, file_path)
         
     return new_song
 
-@router.get("/{song_id}")
+async def _stored_file(song_id: str):
+    stored = storage.lookup(song_id)
+    if not stored:
+        # Shared blob registered by another worker: resolve through the Song
+        song = await Song.get(song_id)
+        if song and song.blob_id:
+            stored = storage.lookup(song.blob_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Song not found")
+    return stored
+
+def _blob_id(path: str) -> str:
+    # Stored files are named after their blob: <song id> for uploads, <video id> for imports
+    return os.path.splitext(os.path.basename(path))[0]
+
+@router.api_route("/{song_id}", methods=["GET", "HEAD"])
 async def get_song(song_id: str):
     # Serving remains global for efficiency/sharing, but metadata leads to this
-    for f in os.listdir(UPLOAD_DIR):
-        if f.startswith(song_id):
-            return FileResponse(os.path.join(UPLOAD_DIR, f))
-    raise HTTPException(status_code=404, detail="Song not found")
+    # Range requests get a 206 so seeking doesn't re-download the whole track
+    # Validators come from the storage index, so revalidation (304) never touches the disk
+    stored = await _stored_file(song_id)
+    return RangeFileResponse(
+        stored.path,
+        headers={"Cache-Control": AUDIO_CACHE_CONTROL},
+        size=stored.size,
+        mtime_ns=stored.mtime_ns,
+    )
+
+@router.api_route("/{song_id}/stream", methods=["GET", "HEAD"])
+async def stream_song(
+    song_id: str,
+    request: Request,
+    codecs: Optional[str] = None,
+    quality: Optional[Literal["low", "high"]] = None
+):
+    """
+    Stream a transcoded rendition picked from client hints: `codecs=opus,aac` (or the
+    Accept header) for the codec, `quality` or the Save-Data / ECT / Downlink hints for
+    the bitrate. Until the renditions are ready the original file is served.
+    """
+    stored = await _stored_file(song_id)
+    blob_id = _blob_id(stored.path)
+    name = choose_rendition(
+        codecs=codecs,
+        accept=request.headers.get("accept"),
+        save_data=request.headers.get("save-data"),
+        ect=request.headers.get("ect"),
+        downlink=request.headers.get("downlink"),
+        quality=quality,
+    )
+    headers = {
+        # What is served changes once the renditions are ready, so always revalidate
+        "Cache-Control": "no-cache",
+        "Vary": "Accept, Save-Data, ECT, Downlink",
+        # Ask Chromium browsers to send the network hints on later requests
+        "Accept-CH": "Save-Data, ECT, Downlink",
+    }
+    path = await transcoder.rendition_path(blob_id, name)
+    if path is None:
+        transcoder.schedule(blob_id, stored.path)
+        return RangeFileResponse(stored.path, headers={**headers, "X-Rendition": "original"})
+    return RangeFileResponse(path, media_type=RENDITIONS[name].media_type, headers={**headers, "X-Rendition": name})
+
+@router.api_route("/{song_id}/hls/{name:path}", methods=["GET", "HEAD"])
+async def get_hls(song_id: str, name: str):
+    """
+    HLS output for a song: `master.m3u8` lists the AAC variants, whose playlists and
+    segments are addressed relative to it. 404 while the song is still being transcoded.
+    """
+    stored = await _stored_file(song_id)
+    blob_id = _blob_id(stored.path)
+    path = await transcoder.hls_path(blob_id, name)
+    if path is None:
+        transcoder.schedule(blob_id, stored.path)
+        raise HTTPException(status_code=404, detail="Not transcoded yet")
+    media_type = HLS_MEDIA_TYPES.get(os.path.splitext(path)[1])
+    return RangeFileResponse(path, media_type=media_type)
+
+@router.get("/{song_id}/waveform")
+async def get_waveform(song_id: str):
+    """
+    Seek-bar waveform for a song: one byte (0-255) per bucket of the track, as raw
+    binary. Built on first request for songs uploaded before waveforms existed.
+    """
+    waveform = await Waveform.get(song_id)
+    if waveform is None:
+        song = await Song.get(song_id)
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        blob_id = song.blob_id or song.id
+        stored = storage.lookup(blob_id) or storage.lookup(song.id)
+        if not stored:
+            raise HTTPException(status_code=404, detail="Song not found")
+        waveform = await ingest.waveform(blob_id, stored.path)
+    if waveform is None:
+        raise HTTPException(status_code=404, detail="Waveform not available")
+    return Response(
+        content=waveform.peaks,
+        media_type="application/octet-stream",
+        # Peaks of a stored file never change
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
 
 @router.get("", response_model=List[Song])
 @router.get("/", response_model=List[Song], include_in_schema=False)
-async def list_songs(x_user_id: Optional[str] = Header(None)):
+async def list_songs(
+    request: Request,
+    x_user_id: Optional[str] = Header(None),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    moods: Optional[str] = None,
+    match: Literal["any", "all"] = "any"
+):
+    """
+    List songs oldest first, streamed from the database.
+    Pass `limit` to page (next page cursor in the X-Next-Cursor header), `fields`
+    to project (e.g. `fields=filename,artist,duration`) and `format=ndjson` for
+    one song per line. `moods=Happy,Chill` keeps songs with any of the moods,
+    or all of them with `match=all`. Carries a weak ETag from the library
+    version, so unchanged libraries revalidate with a 304; full responses are
+    served from the library cache until the next write.
+    """
+    version = await library.current_version(x_user_id)
+    headers = library_headers(weak_etag("songs", version))
+    if not_modified(request.headers, headers["ETag"]):
+        return not_modified_response(headers)
     # Filter by owner_id if provided
-    if x_user_id:
-        songs = await Song.find(Song.owner_id == x_user_id).to_list()
-    else:
-        # Fallback for older songs or global view (if needed)
-        songs = await Song.find_all().to_list()
-    return songs
+    # Fallback for older songs or global view (if needed)
+    query = mood_query(x_user_id, parse_moods(moods), match)
+    return await library_cache.respond(
+        library_cache.key(x_user_id, "songs", version, request),
+        lambda: list_documents(song_listing, query, limit=limit, cursor=cursor, fields=fields, format=format, headers=headers),
+    )
 
 @router.delete("/{id}", status_code=204)
 async def delete_song(id: str, x_user_id: Optional[str] = Header(None)):
@@ -87,17 +222,61 @@ async def delete_song(id: str, x_user_id: Optional[str] = Header(None)):
     #     raise HTTPException(status_code=403, detail="Not authorized to delete this song")
     
     await song.delete()
+    await remove_entry("song", id)
+    await library.record_change(song.owner_id, "song", id, deleted=True)
+
+
 
+@router.get("/cache/stats")
+async def library_cache_stats():
+    """
+    Hit/miss/eviction counters for the library response cache.
+    """
+    return library_cache.stats()
 
+@router.get("/moods/counts")
+async def get_mood_counts(request: Request, response: Response, x_user_id: Optional[str] = Header(None)):
+    """
+    Number of songs tagged with each of the eight moods, in one aggregation.
+    """
+    headers = library_headers(weak_etag("moods", await library.current_version(x_user_id)))
+    if not_modified(request.headers, headers["ETag"]):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+    return await mood_counts(x_user_id)
 
-@router.get("/moods/{mood}")
-async def get_songs_by_mood(mood: str, x_user_id: Optional[str] = Header(None)):
+@router.get("/moods/{mood}", response_model=List[Song])
+async def get_songs_by_mood(
+    mood: str,
+    request: Request,
+    x_user_id: Optional[str] = Header(None),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None
+):
     """
     Get all songs filtered by a specific mood.
+    Same as /api/songs?moods=<mood>, including paging.
     """
-    query = {"moods": mood}
-    if x_user_id:
-        query["owner_id"] = x_user_id
-    
-    songs = await Song.find(query).to_list()
-    return songs
+    headers = library_headers(weak_etag("songs", await library.current_version(x_user_id)))
+    if not_modified(request.headers, headers["ETag"]):
+        return not_modified_response(headers)
+    return await list_documents(song_listing, mood_query(x_user_id, [mood]), limit=limit, cursor=cursor, headers=headers)
+
+class UpdateMoods(BaseModel):
+    moods: List[str]
+
+@router.put("/{id}/moods", response_model=Song)
+async def update_song_moods(id: str, body: UpdateMoods, x_user_id: Optional[str] = Header(None)):
+    """
+    Replace a song's moods.
+    """
+    song = await Song.get(id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if song.owner_id and song.owner_id != x_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to modify this song")
+
+    song.moods = [m.strip() for m in body.moods if m.strip()]
+    await song.set({Song.moods: song.moods})
+    await library.record_change(song.owner_id, "song", id)
+    return song
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Query, Header, HTTPException, Response
+from typing import Optional
+from services.sync import changes_since, SYNC_PAGE_SIZE
+from services.listing import dumps
+
+router = APIRouter()
+
+@router.get("")
+async def sync_library(
+    since: int = Query(0, ge=0),
+    x_user_id: Optional[str] = Header(None),
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=5000)
+):
+    """
+    Changes to the caller's songs and playlists after library version `since`.
+    Returns the changed records in the same shape as /api/songs and /api/playlists,
+    ids under `deleted` for tombstones, and the `version` to pass next time.
+    Keep calling while `has_more`; on `reset`, reload the full lists instead.
+    """
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="X-User-ID header is required")
+    changes = await changes_since(x_user_id, since, limit=limit)
+    return Response(content=dumps(changes), media_type="application/json", headers={"Cache-Control": "no-store"})
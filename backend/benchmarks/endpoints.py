@@ -0,0 +1,329 @@
+"""
+Load-test the API in-process against a seeded database.
+
+Seeds synthetic libraries (songs, playlists with large song lists, listening
+history with its daily rollups, the search index and audio files for range
+reads), then drives the FastAPI app through httpx's ASGI transport at a fixed
+concurrency and reports latency percentiles, throughput and peak RSS per
+route. Results can be saved as a JSON baseline and compared with a later run.
+
+The database is a local mongod (`--mongodb-url`, seeded into its own
+`--database`, dropped first) or, with `--mongodb-url memory`, the in-memory
+mongomock-motor stand-in (pip install mongomock-motor). The stand-in is
+slow with large histories and lacks some operators the search route uses,
+so keep it for smoke runs.
+
+Usage: python -m benchmarks.endpoints [--mongodb-url mongodb://localhost:27017]
+           [--songs 5000] [--users 20] [--playlists 50] [--playlist-size 500]
+           [--plays 1000000] [--requests 500] [--concurrency 16]
+           [--routes songs,songs_page,search,stats,range,playlist] [--no-cache]
+           [--output baseline.json] [--compare baseline.json] [--threshold 0.1]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+WORDS = (
+    "midnight summer river neon echo golden broken silver ocean fire dream electric velvet "
+    "shadow crystal thunder paper wild lonely northern city highway rain morning starlight "
+    "honey desert violet ghost satellite"
+).split()
+ARTISTS = [f"{a} {b}".title() for a in WORDS[:12] for b in ("band", "collective", "trio")]
+INSERT_BATCH = 10000
+AUDIO_FILES = 20
+AUDIO_FILE_SIZE = 4 * 1024 * 1024
+RANGE_SIZE = 64 * 1024
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the all-time peak (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def connect(url: str, database: str):
+    from beanie import init_beanie
+    from db import document_models
+
+    if url == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(url)
+        await client.drop_database(database)
+    await init_beanie(database=client[database], document_models=document_models())
+    return client
+
+
+async def seed(args: argparse.Namespace, upload_dir: str) -> Dict[str, List[Any]]:
+    """Insert the synthetic library; returns ids for the request generators."""
+    from models.song import Song, MOODS
+    from models.playlist import Playlist
+    from models.history import ListeningHistory, ListeningRollup
+    from services.rollups import day_bucket
+    from services.search_index import rebuild_search_index
+    from services.storage import storage
+
+    rng = random.Random(args.seed)
+    users = [f"BENCH-{i:04d}" for i in range(args.users)]
+    now = datetime.now()
+
+    started = time.perf_counter()
+    songs, by_owner = [], {user: [] for user in users}
+    for i in range(args.songs):
+        owner = users[i % len(users)]
+        title = " ".join(rng.sample(WORDS, 3)).title()
+        song_id = f"bench-{i:07d}"
+        songs.append({
+            "_id": song_id,
+            "filename": f"{title}.mp3",
+            "original_filename": f"{song_id}.mp3",
+            "url": f"/api/songs/{song_id}",
+            "artist": rng.choice(ARTISTS),
+            "duration": rng.uniform(90, 420),
+            "owner_id": owner,
+            "blob_id": None,
+            "moods": rng.sample(MOODS, rng.randint(0, 3)),
+            "created_at": now - timedelta(seconds=args.songs - i),
+        })
+        by_owner[owner].append(songs[-1])
+    for start in range(0, len(songs), INSERT_BATCH):
+        await Song.get_motor_collection().insert_many(songs[start:start + INSERT_BATCH])
+
+    playlists = []
+    for i in range(args.playlists):
+        owner = users[i % len(users)]
+        picks = rng.sample(by_owner[owner], min(args.playlist_size, len(by_owner[owner])))
+        playlists.append({
+            "name": " ".join(rng.sample(WORDS, 2)).title(),
+            "description": None,
+            "songs": [
+                {"id": s["_id"], "filename": s["filename"], "title": s["filename"], "artist": s["artist"], "duration": s["duration"], "url": s["url"]}
+                for s in picks
+            ],
+            "owner_id": owner,
+            "version": 0,
+            "created_at": now - timedelta(seconds=args.playlists - i),
+        })
+    playlist_ids = []
+    if playlists:
+        inserted = await Playlist.get_motor_collection().insert_many(playlists)
+        playlist_ids = [(str(i), p["owner_id"]) for i, p in zip(inserted.inserted_ids, playlists)]
+    print(f"seeded {len(songs)} songs and {len(playlists)} playlists in {time.perf_counter() - started:.1f}s")
+
+    # Plays over the last 90 days, raw and rolled up, as the play buffer would have written them
+    started = time.perf_counter()
+    rollups: Counter = Counter()
+    batch = []
+    for i in range(args.plays):
+        song = songs[rng.randrange(len(songs))]
+        timestamp = now - timedelta(seconds=rng.randrange(90 * 86400))
+        batch.append({"song_id": song["_id"], "owner_id": song["owner_id"], "timestamp": timestamp})
+        rollups[(song["owner_id"], song["_id"], day_bucket(timestamp))] += 1
+        if len(batch) >= INSERT_BATCH or i == args.plays - 1:
+            await ListeningHistory.get_motor_collection().insert_many(batch)
+            batch = []
+    rows = [{"owner_id": o, "song_id": s, "day": d, "plays": n} for (o, s, d), n in rollups.items()]
+    for start in range(0, len(rows), INSERT_BATCH):
+        await ListeningRollup.get_motor_collection().insert_many(rows[start:start + INSERT_BATCH])
+    print(f"seeded {args.plays} plays ({len(rows)} rollups) in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    await rebuild_search_index()
+    print(f"built search index in {time.perf_counter() - started:.1f}s")
+
+    # A few real files for range reads; every song id maps onto one of them
+    audio = []
+    for i in range(min(AUDIO_FILES, len(songs))):
+        path = storage.path_for(songs[i]["_id"], ".mp3")
+        with open(path, "wb") as f:
+            f.write(os.urandom(AUDIO_FILE_SIZE))
+        storage.register(songs[i]["_id"], path)
+        audio.append(songs[i]["_id"])
+
+    return {"users": users, "songs": [s["_id"] for s in songs], "playlists": playlist_ids, "audio": audio}
+
+
+def routes(data: Dict[str, List[Any]], rng: random.Random) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    """Request generators per route: each call returns httpx request arguments."""
+    def user():
+        return {"X-User-ID": rng.choice(data["users"])}
+
+    def range_read():
+        start = rng.randrange(AUDIO_FILE_SIZE - RANGE_SIZE)
+        return {
+            "url": f"/api/songs/{rng.choice(data['audio'])}",
+            "headers": {"Range": f"bytes={start}-{start + RANGE_SIZE - 1}"},
+        }
+
+    def playlist():
+        playlist_id, owner = rng.choice(data["playlists"])
+        return {"url": f"/api/playlists/{playlist_id}", "headers": {"X-User-ID": owner}}
+
+    return {
+        "songs": lambda: {"url": "/api/songs", "headers": user()},
+        "songs_page": lambda: {"url": "/api/songs?limit=50", "headers": user()},
+        "search": lambda: {"url": f"/api/search/?query={rng.choice(WORDS)[:rng.randint(2, 5)]}", "headers": user()},
+        "stats": lambda: {"url": "/api/analytics/stats?window=30d", "headers": user()},
+        "range": range_read,
+        "playlist": playlist,
+    }
+
+
+async def run_route(client, make_request: Callable[[], Dict[str, Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    remaining = requests
+    peak = rss_bytes()
+    done = asyncio.Event()
+
+    async def sample_rss():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss_bytes())
+            await asyncio.sleep(0.01)
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            request = make_request()
+            started = time.perf_counter()
+            response = await client.get(request["url"], headers=request["headers"])
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code not in (200, 206):
+                errors[f"{response.status_code}: {response.text[:200]}"] += 1
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await sampler
+
+    import numpy as np
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": sum(errors.values()),
+        "first_error": next(iter(errors), None),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "peak_rss_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    """Print the change per route; True if any route got slower than `threshold` allows."""
+    regressed = False
+    for name, current in results["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if before is None:
+            print(f"{name:12} (not in baseline)")
+            continue
+        p95 = current["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps = current["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        worse = p95 > threshold or rps < -threshold
+        regressed |= worse
+        print(f"{name:12} p95 {p95:+.1%}  throughput {rps:+.1%}{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+async def main(args: argparse.Namespace) -> int:
+    upload_dir = tempfile.mkdtemp(prefix="nexus-bench-")
+    # Must be set before the app (and its storage singleton) is imported
+    os.environ["UPLOAD_DIR"] = upload_dir
+
+    import httpx
+    from main import app
+    from services.library_cache import library_cache
+
+    if args.no_cache:
+        library_cache.backend = None
+    await connect(args.mongodb_url, args.database)
+    data = await seed(args, upload_dir)
+
+    rng = random.Random(args.seed)
+    generators = routes(data, rng)
+    selected = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in generators]
+    if unknown:
+        raise SystemExit(f"Unknown routes: {', '.join(unknown)} (choose from {', '.join(generators)})")
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "started_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "memory" if args.mongodb_url == "memory" else "mongod",
+            "library_cache": not args.no_cache,
+            **{k: v for k, v in vars(args).items() if k not in ("output", "compare", "mongodb_url")},
+        },
+        "routes": {},
+    }
+    # Count unhandled app errors as 500s instead of aborting the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in selected:
+            # Warm up connections, caches and code paths before measuring
+            for _ in range(min(args.concurrency, args.requests)):
+                request = generators[name]()
+                await client.get(request["url"], headers=request["headers"])
+            result = await run_route(client, generators[name], args.requests, args.concurrency)
+            results["routes"][name] = result
+            print(
+                f"{name:12} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+                f"{result['throughput_rps']:8.1f} req/s  peak RSS {result['peak_rss_mb']:.0f} MB  errors {result['errors']}"
+            )
+            if result["first_error"]:
+                print(f"{'':12} first error: {result['first_error']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            return 1 if compare(results, json.load(f), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test API routes in-process against a seeded database.")
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"),
+                        help='mongod to seed, or "memory" for the mongomock-motor stand-in')
+    parser.add_argument("--database", default="nexus_bench", help="dropped and re-seeded on every run")
+    parser.add_argument("--songs", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--playlists", type=int, default=50)
+    parser.add_argument("--playlist-size", type=int, default=500)
+    parser.add_argument("--plays", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=500, help="per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--routes", default="songs,songs_page,search,stats,range,playlist")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the library response cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare with; exits 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed p95/throughput change")
+    sys.exit(asyncio.run(main(parser.parse_args())))
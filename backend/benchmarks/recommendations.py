@@ -0,0 +1,104 @@
+"""
+Benchmark the co-play recommender on synthetic listening history.
+
+Generates `--events` plays (default 1M) by `--users` listeners over `--songs`
+songs, with sessions of related songs and Zipf-like popularity, then times
+the offline build, folding in streamed play batches and per-request lookups.
+No database is needed.
+
+Usage: python -m benchmarks.recommendations [--events 1000000] [--songs 50000]
+                                            [--users 5000] [--requests 2000]
+"""
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from services.recommendations import Recommender, build_index
+
+GENRES = 200
+
+
+def synthetic_history(events: int, songs: int, users: int, seed: int = 0):
+    """Plays in sessions of 5-30 songs mostly from the listener's favourite genre."""
+    rng = np.random.default_rng(seed)
+    genre_of_user = rng.integers(0, GENRES, users)
+    owners, tracks, stamps = [], [], []
+    total, clock = 0, 0.0
+    while total < events:
+        size = int(rng.integers(5, 31))
+        user = int(rng.integers(0, users))
+        genre = np.where(rng.random(size) < 0.8, genre_of_user[user], rng.integers(0, GENRES, size))
+        # Songs of genre g are g, g + GENRES, g + 2*GENRES, ...; low ranks are the popular ones
+        rank = np.minimum(rng.zipf(1.3, size) - 1, songs // GENRES - 1)
+        tracks.append(genre + rank * GENRES)
+        owners.append(np.full(size, user))
+        stamps.append(clock + np.cumsum(rng.integers(120, 300, size)))
+        clock += 86400.0 / 10
+        total += size
+    return (
+        np.concatenate(owners)[:events].astype(np.int32),
+        np.concatenate(tracks)[:events].astype(np.int32),
+        np.concatenate(stamps)[:events],
+    )
+
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return f"p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms"
+
+
+def main(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    owners, songs, stamps = synthetic_history(args.events, args.songs, args.users)
+    print(f"generated {songs.size} plays in {time.perf_counter() - started:.1f}s")
+
+    recommender = Recommender()
+    started = time.perf_counter()
+    recommender.index = build_index(owners, songs, stamps, args.songs, recommender.k, recommender.window, recommender.gap)
+    build = time.perf_counter() - started
+    recommender.ids = [str(i) for i in range(args.songs)]
+    recommender.positions = {song_id: i for i, song_id in enumerate(recommender.ids)}
+    print(f"offline build: {build:.2f}s, {recommender.index.co_play_entries} co-play entries")
+
+    rng = np.random.default_rng(1)
+    popular = songs[rng.integers(0, songs.size, args.requests)]
+    timings = []
+    for song in popular:
+        started = time.perf_counter()
+        recommender.similar(str(song), 10)
+        timings.append(time.perf_counter() - started)
+    print(f"up next ({args.requests} requests): {percentiles(timings)}")
+
+    timings = []
+    for _ in range(args.requests):
+        seeds = [str(s) for s in songs[rng.integers(0, songs.size, 20)]]
+        started = time.perf_counter()
+        recommender.recommend(seeds, 20, weights=[1.0 / (r + 1) ** 0.5 for r in range(len(seeds))])
+        timings.append(time.perf_counter() - started)
+    print(f"for you, 20 seeds ({args.requests} requests): {percentiles(timings)}")
+
+    # One play-buffer flush worth of streamed plays (stand-ins for ListeningHistory)
+    now = datetime.now()
+    batch = [
+        SimpleNamespace(song_id=str(songs[i]), owner_id=str(owners[i]), timestamp=now + timedelta(seconds=int(i)))
+        for i in rng.integers(0, songs.size, 500)
+    ]
+    started = time.perf_counter()
+    recommender.observe(batch)
+    observe = time.perf_counter() - started
+    started = time.perf_counter()
+    asyncio.run(recommender.refresh())
+    print(f"incremental update of 500 plays: observe {observe * 1000:.1f} ms, fold {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the co-play recommender on synthetic history.")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--songs", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--requests", type=int, default=2_000)
+    main(parser.parse_args())
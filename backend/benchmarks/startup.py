@@ -0,0 +1,167 @@
+"""
+Profile the cold start: time from process start to the first successful
+/api/songs response.
+
+Each run launches `uvicorn main:app` with `-X importtime` in a fresh process,
+polls /api/songs until it answers 200, then reads the startup phases the app
+exports (startup_phase_seconds on /metrics) and stops the server. The report
+shows time to first response and first success, the import/startup phases,
+and the slowest top-level imports. Runs after the first find the OS file
+cache warm; pass --runs to see both.
+
+Usage: python -m benchmarks.startup [--mongodb-url mongodb://localhost:27017]
+                                    [--runs 3] [--timeout 60] [--top 15]
+                                    [--output startup.json]
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import statistics
+import subprocess
+import tempfile
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+PHASE_LINE = re.compile(r'^startup_phase_seconds\{phase="([^"]+)"\} (\S+)$')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(url: str) -> Optional[int]:
+    """Status code of `url`, or None while nothing is listening."""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+
+def parse_imports(stderr: str, top: int) -> Dict[str, Any]:
+    """`-X importtime` output -> total import time and the slowest top-level imports (ms)."""
+    top_level = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        # One leading space marks an import nothing else was importing at the time
+        if match and len(match.group(3)) == 1:
+            self_us, cumulative_us, _, name = match.groups()
+            top_level.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+    top_level.sort(key=lambda row: -row[2])
+    return {
+        "total_ms": round(sum(row[2] for row in top_level), 1),
+        "slowest": [{"module": name, "cumulative_ms": round(ms, 1), "self_ms": round(own, 1)} for name, own, ms in top_level[:top]],
+    }
+
+
+def run_once(args: argparse.Namespace) -> Dict[str, Any]:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    if args.mongodb_url:
+        env["MONGODB_URL"] = args.mongodb_url
+
+    with tempfile.TemporaryFile(mode="w+") as log:
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-X", "importtime", "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        first_response = first_success = None
+        status = None
+        try:
+            while time.perf_counter() - started < args.timeout:
+                if server.poll() is not None:
+                    break
+                status = get(base + "/api/songs")
+                elapsed = time.perf_counter() - started
+                if status is not None and first_response is None:
+                    first_response = elapsed
+                if status == 200:
+                    first_success = elapsed
+                    break
+                time.sleep(0.01)
+
+            phases: Dict[str, float] = {}
+            if first_response is not None:
+                with urllib.request.urlopen(base + "/metrics", timeout=5) as response:
+                    for line in response.read().decode().splitlines():
+                        match = PHASE_LINE.match(line)
+                        if match:
+                            phases[match.group(1)] = round(float(match.group(2)) * 1000, 1)
+        finally:
+            if server.poll() is None:
+                server.send_signal(signal.SIGINT)
+                try:
+                    server.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+        log.seek(0)
+        output = log.read()
+
+    result = {
+        "first_response_ms": round(first_response * 1000, 1) if first_response is not None else None,
+        "first_success_ms": round(first_success * 1000, 1) if first_success is not None else None,
+        "last_status": status,
+        "phases_ms": phases,
+        "imports": parse_imports(output, args.top),
+    }
+    if first_success is None:
+        # Show what the server said (minus the import timings) to explain the failure
+        result["log_tail"] = [line for line in output.splitlines() if not line.startswith("import time:")][-20:]
+    return result
+
+
+def main(args: argparse.Namespace) -> int:
+    runs = []
+    for number in range(1, args.runs + 1):
+        result = run_once(args)
+        runs.append(result)
+        phases = ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in result["phases_ms"].items())
+        print(
+            f"run {number}: first response {result['first_response_ms']} ms, "
+            f"first 200 from /api/songs {result['first_success_ms']} ms"
+            + (f" ({phases})" if phases else "")
+        )
+        if result["first_success_ms"] is None:
+            print(f"  no successful response (last status {result['last_status']}); server output:")
+            for line in result.get("log_tail", []):
+                print(f"    {line}")
+
+    imports = runs[-1]["imports"]
+    print(f"\nimports: {imports['total_ms']} ms in total; slowest top-level imports:")
+    for row in imports["slowest"]:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+
+    successes = [run["first_success_ms"] for run in runs if run["first_success_ms"] is not None]
+    if successes:
+        print(f"\nmedian time to first /api/songs success: {statistics.median(successes):.0f} ms over {len(successes)} run(s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"runs": runs, "median_first_success_ms": statistics.median(successes) if successes else None}, f, indent=2)
+        print(f"saved {args.output}")
+    return 0 if len(successes) == len(runs) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure process start to first successful /api/songs response.")
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL"))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a successful response")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--output", help="save the runs as JSON")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,188 @@
+"""
+Query-plan regression check.
+
+Builds every model's declared indexes (as init_db does at startup), then runs
+explain() on each query shape the API issues and fails if any winning plan
+contains a COLLSCAN. Shapes come from the same builders the endpoints use
+wherever one exists, so a new filter or sort shows up here without edits;
+a new endpoint with an inline query needs an entry in query_shapes() below.
+
+Needs a real mongod (explain isn't emulated by in-memory stand-ins); empty
+collections are fine, the planner only needs the indexes. It uses the
+scratch database nexus_query_plans by default; pass --drop to clean up
+(refused for databases whose names don't look like scratch ones).
+
+Usage: python check_query_plans.py [--mongodb-url mongodb://localhost:27017]
+                                   [--database nexus_query_plans] [--drop] [--verbose]
+"""
+import os
+import re
+import sys
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Type
+
+from beanie import Document, PydanticObjectId, init_beanie
+from bson import SON
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from db import document_models, ensure_retention_indexes
+from models.history import ListeningHistory, ListeningRollup
+from models.library import LibraryChange, LibraryVersion
+from models.playlist import Playlist
+from models.search import SearchEntry
+from models.song import Song
+from models.waveform import Waveform
+from services.analytics import WINDOWS, build_stats_pipeline
+from services.listing import SORT, after_cursor, encode_cursor
+from services.moods import build_mood_counts_pipeline, mood_query
+from services.playlists import _editable
+from services.rollups import day_bucket
+from services.search_index import build_search_pipeline, tokenize
+
+OWNER = "query-plan-check"
+SONG_ID = "00000000-0000-0000-0000-000000000000"
+PLAYLIST_ID = PydanticObjectId("000000000000000000000000")
+# --drop only touches databases named like this
+SCRATCH_DATABASE = re.compile(r"(scratch|test|tmp|query_plans)", re.IGNORECASE)
+
+
+class Shape(NamedTuple):
+    name: str
+    model: Type[Document]
+    filter: Optional[Dict[str, Any]] = None
+    sort: Optional[List[Any]] = None
+    pipeline: Optional[List[Dict[str, Any]]] = None
+    # Why a full scan is intended here, if it is
+    allow_collscan: Optional[str] = None
+
+
+def query_shapes(now: datetime) -> List[Shape]:
+    """Every find filter/sort and aggregation pipeline the API sends, per owner and unscoped."""
+    song_cursor = encode_cursor({"created_at": now, "_id": SONG_ID})
+    playlist_cursor = encode_cursor({"created_at": now, "_id": PLAYLIST_ID})
+    shapes: List[Shape] = []
+
+    for owner, scope in ((OWNER, "owner"), (None, "all")):
+        shapes += [
+            # /api/songs and /api/songs/moods/{mood}
+            Shape(f"songs list ({scope})", Song, mood_query(owner, []), SORT),
+            Shape(f"songs list page ({scope})", Song, after_cursor(mood_query(owner, []), song_cursor, False), SORT),
+            Shape(f"songs by mood ({scope})", Song, mood_query(owner, ["Chill"]), SORT),
+            Shape(f"songs by any mood ({scope})", Song, mood_query(owner, ["Chill", "Happy"]), SORT),
+            Shape(f"songs by all moods ({scope})", Song, mood_query(owner, ["Chill", "Happy"], "all"), SORT),
+            Shape(f"songs by mood page ({scope})", Song, after_cursor(mood_query(owner, ["Chill"]), song_cursor, False), SORT),
+            # /api/songs/moods/counts
+            Shape(f"mood counts ({scope})", Song, pipeline=build_mood_counts_pipeline(owner)),
+            # /api/playlists
+            Shape(f"playlists list ({scope})", Playlist, {"owner_id": owner} if owner else {}, SORT),
+            Shape(f"playlists list page ({scope})", Playlist, after_cursor({"owner_id": owner} if owner else {}, playlist_cursor, True), SORT),
+            # /api/search
+            *(
+                Shape(f"search {kind}s ({scope})", SearchEntry, pipeline=build_search_pipeline(kind, tokenize("mid night"), owner, 20))
+                for kind in ("song", "playlist")
+            ),
+        ]
+        for window, days in WINDOWS.items():
+            # /api/analytics/stats
+            shapes.append(Shape(
+                f"stats {window} ({scope})", ListeningRollup, pipeline=build_stats_pipeline(owner, window, 5, now),
+                allow_collscan="all-time stats for everyone aggregate every rollup" if owner is None and days is None else None,
+            ))
+
+    shapes += [
+        # Single-document reads and writes by id
+        Shape("song by id", Song, {"_id": SONG_ID}),
+        Shape("songs by ids (SongLoader, search hydration)", Song, {"_id": {"$in": [SONG_ID]}}),
+        Shape("song by blob (imports)", Song, {"blob_id": "yt-00000000000"}),
+        Shape("playlist by id", Playlist, {"_id": PLAYLIST_ID}),
+        Shape("playlist edit", Playlist, {**_editable(PLAYLIST_ID, OWNER), "songs.id": {"$ne": SONG_ID}}),
+        Shape("waveform by id", Waveform, {"_id": SONG_ID}),
+        Shape("library version", LibraryVersion, {"_id": OWNER}),
+        # /api/sync
+        Shape("sync change log", LibraryChange, {"owner_id": OWNER, "seq": {"$gt": 1}}, [("seq", 1)]),
+        Shape("sync songs", Song, {"_id": {"$in": [SONG_ID]}, "owner_id": OWNER}),
+        Shape("sync playlists", Playlist, {"_id": {"$in": [PLAYLIST_ID]}, "owner_id": OWNER}),
+        # Listening history and rollups
+        Shape("recent plays (recommendations)", ListeningHistory, {"owner_id": OWNER}, [("timestamp", -1)]),
+        Shape("history before (recommender rebuild)", ListeningHistory, {"_id": {"$lt": PydanticObjectId.from_datetime(now)}}),
+        Shape("history since (rollup rebuild)", ListeningHistory, {"timestamp": {"$gte": day_bucket(now) - timedelta(days=7)}}),
+        Shape("rollup upsert", ListeningRollup, {"owner_id": OWNER, "day": day_bucket(now), "song_id": SONG_ID}),
+    ]
+    return shapes
+
+
+def explain_command(collection: str, shape: Shape) -> SON:
+    if shape.pipeline is not None:
+        command = SON([("aggregate", collection), ("pipeline", shape.pipeline), ("cursor", {})])
+    else:
+        command = SON([("find", collection), ("filter", shape.filter or {})])
+        if shape.sort:
+            command["sort"] = SON(shape.sort)
+    return SON([("explain", command), ("verbosity", "queryPlanner")])
+
+
+def winning_stages(explain: Dict[str, Any]) -> List[str]:
+    """Stage names of every winning plan in an explain result, outermost first."""
+    stages: List[str] = []
+
+    def walk(node: Any, winning: bool) -> None:
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "rejectedPlans":
+                    continue
+                if key == "stage" and winning and isinstance(value, str):
+                    stages.append(value)
+                walk(value, winning or key == "winningPlan")
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, winning)
+
+    walk(explain, False)
+    return stages
+
+
+async def run(args: argparse.Namespace) -> int:
+    if args.drop and not SCRATCH_DATABASE.search(args.database):
+        print(f"Refusing to drop {args.database!r}: not a scratch database (name must contain scratch, test, tmp or query_plans)")
+        return 2
+    client = AsyncIOMotorClient(args.mongodb_url)
+    database = client[args.database]
+    # Same index build as db.init_db
+    await init_beanie(database=database, document_models=document_models())
+    await ensure_retention_indexes()
+
+    failures = 0
+    try:
+        for shape in query_shapes(datetime.now()):
+            explain = await database.command(explain_command(shape.model.get_motor_collection().name, shape))
+            stages = winning_stages(explain)
+            if "COLLSCAN" not in stages:
+                status = "ok"
+            elif shape.allow_collscan:
+                status = "allowed"
+            else:
+                status = "COLLSCAN"
+                failures += 1
+            if args.verbose or status != "ok":
+                reason = f" ({shape.allow_collscan})" if status == "allowed" else ""
+                print(f"{status:9} {shape.name}: {' > '.join(stages) or '?'}{reason}")
+    finally:
+        if args.drop:
+            await client.drop_database(args.database)
+
+    if failures:
+        print(f"{failures} query shape(s) plan a collection scan; declare an index on the model")
+        return 1
+    print("No unexpected collection scans")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if any API query shape plans a collection scan.")
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="nexus_query_plans")
+    parser.add_argument("--drop", action="store_true", help="drop the database afterwards (scratch databases only)")
+    parser.add_argument("--verbose", action="store_true", help="print every shape's plan")
+    sys.exit(asyncio.run(run(parser.parse_args())))
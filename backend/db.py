@@ -1,23 +1,116 @@
 import os
+import asyncio
+from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
+from pymongo.errors import OperationFailure
 from models.playlist import Playlist
 from models.song import Song
+from services.metrics import command_metrics, MONGO_COMMAND_METRICS
+
+# Connection pool bounds (pymongo's defaults are 100 and 0)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+# Idle pooled connections are closed after this long; 0 keeps them
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))
+# Connections opened during startup, so the first requests after a cold
+# start don't each pay for a TCP/TLS handshake and authentication
+MONGO_WARM_CONNECTIONS = int(os.getenv("MONGO_WARM_CONNECTIONS", "4"))
+
+# expireAfterSeconds meaning "keep forever" for an index that already has a
+# TTL: MongoDB can't drop the option in place, so it's set to its maximum
+TTL_NEVER = 2**31 - 1
+
+client: Optional[AsyncIOMotorClient] = None
+
+def document_models():
+    from models.history import ListeningHistory, ListeningRollup
+    from models.search import SearchEntry
+    from models.waveform import Waveform
+    from models.library import LibraryVersion, LibraryChange
+    return [Song, Playlist, ListeningHistory, ListeningRollup, SearchEntry, Waveform, LibraryVersion, LibraryChange]
 
 async def init_db():
+    global client
     # Use environment variable with local fallback for portability
     mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-    client = AsyncIOMotorClient(mongodb_url)
+    # Per-collection command timings for /metrics
+    listeners = [command_metrics] if MONGO_COMMAND_METRICS else []
+    client = AsyncIOMotorClient(
+        mongodb_url,
+        event_listeners=listeners,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS or None,
+    )
     
     # Safety check for Beanie/Motor compatibility
     # Ensure append_metadata is not treated as a callable if it's missing
     if not hasattr(client, 'append_metadata') or not callable(getattr(client, 'append_metadata', None)):
         client.append_metadata = lambda *args, **kwargs: None
     
-    # Initialize Beanie with the Nexus database and models
-    from models.history import ListeningHistory
-    
+    # Initialize Beanie with the Nexus database and models; this also builds
+    # every index declared in the models' Settings (existing ones are kept).
+    # `python check_query_plans.py` verifies no API query needs a collection scan.
     await init_beanie(
         database=client.nexus_db,
-        document_models=[Song, Playlist, ListeningHistory]
+        document_models=document_models()
     )
+    await ensure_retention_indexes()
+
+def retention_indexes():
+    """(model, index key, index name, seconds to keep or 0 for forever) per expiring collection."""
+    from models.history import ListeningHistory, HISTORY_TTL_KEY, HISTORY_RETENTION_DAYS
+    from models.library import LibraryChange, LIBRARY_CHANGES_TTL_KEY, LIBRARY_CHANGES_RETENTION_DAYS
+    return [
+        (ListeningHistory, HISTORY_TTL_KEY, "timestamp_retention", HISTORY_RETENTION_DAYS * 86400),
+        (LibraryChange, LIBRARY_CHANGES_TTL_KEY, "created_at_retention", LIBRARY_CHANGES_RETENTION_DAYS * 86400),
+    ]
+
+async def ensure_ttl_index(collection, keys, name: str, seconds: int):
+    """
+    Create the TTL index on `keys`, or move an existing index on the same
+    keys to `seconds` in place with collMod. Declared in Settings.indexes
+    instead, every retention change would be an IndexOptionsConflict from
+    init_beanie and stop the app from starting.
+    """
+    existing = None
+    async for index in collection.list_indexes():
+        if list(index["key"].items()) == list(keys):
+            existing = index
+    if existing is None:
+        await collection.create_index(keys, name=name, **({"expireAfterSeconds": seconds} if seconds else {}))
+        return
+    current = existing.get("expireAfterSeconds")
+    wanted = seconds or (TTL_NEVER if current is not None else None)
+    if wanted is None or current == wanted:
+        return
+    # Addressed by its own name: it may predate this one (e.g. "timestamp_-1")
+    await collection.database.command(
+        "collMod", collection.name, index={"name": existing["name"], "expireAfterSeconds": wanted}
+    )
+    print(f"{collection.name}: retention index {existing['name']} now expires after {wanted}s")
+
+async def ensure_retention_indexes():
+    for model, keys, name, seconds in retention_indexes():
+        collection = model.get_motor_collection()
+        try:
+            await ensure_ttl_index(collection, keys, name, seconds)
+        except OperationFailure as e:
+            # e.g. turning a plain index into a TTL needs MongoDB 5.1+; the index
+            # still serves queries, old documents just aren't expired
+            print(f"{collection.name}: could not apply retention to index on {keys}: {e}")
+
+async def warm_pool(connections: int = MONGO_WARM_CONNECTIONS):
+    """
+    Open up to `connections` pooled connections by pinging concurrently: each
+    in-flight command checks out its own connection. Failures are logged, not
+    raised; requests will just connect on demand.
+    """
+    connections = min(connections, MONGO_MAX_POOL_SIZE or connections)
+    if client is None or connections <= 0:
+        return
+    results = await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        print(f"MongoDB pool warm-up: {len(errors)} of {connections} pings failed: {errors[0]}")
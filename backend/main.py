@@ -1,43 +1,24 @@
-from fastapi import FastAPI
-import socket
-import dns.resolver
-
-# Robust DNS Patch: Fallback to Google DNS if system DNS fails
-# This fixes persistent [Errno -5] errors in Hugging Face Spaces
-old_getaddrinfo = socket.getaddrinfo
+import time
+# Start of the cold-start profile (see on_startup); kept above the imports it measures
+IMPORT_STARTED = time.perf_counter()
 
-def new_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
-    try:
-        # 1. Try system DNS first / existing IPv4 filter logic
-        responses = old_getaddrinfo(host, port, family, type, proto, flags)
-        return [response for response in responses if response[0] == socket.AF_INET]
-    except socket.gaierror:
-        # 2. If system fails, try Google DNS (8.8.8.8) via dnspython
-        try:
-            # Only attempt this for hostname lookups (not IPs)
-            if not host or host == '0.0.0.0' or host == 'localhost':
-                 raise
-                 
-            # print(f"DEBUG: System DNS failed for {host}, trying Google DNS...")
-            resolver = dns.resolver.Resolver()
-            resolver.nameservers = ['8.8.8.8']
-            answers = resolver.resolve(host, 'A')
-            ip = answers[0].to_text()
-            
-            # Construct a valid getaddrinfo response structure using the resolved IP
-            # (family, type, proto, canonname, sockaddr)
-            # sockaddr for AF_INET is (ip, port)
-            return [(socket.AF_INET, type, proto, '', (ip, port))]
-        except Exception:
-            # If fallback also fails, raise the original system error
-            raise
+from fastapi import FastAPI
+import asyncio
+import importlib
+import sys
+from services.resolver import resolver
 
-socket.getaddrinfo = new_getaddrinfo
+# Cached DNS for every outgoing connection (Mongo, YouTube), falling back to
+# public nameservers when system DNS fails; fixes persistent [Errno -5]
+# errors in Hugging Face Spaces. See services/resolver.py for the settings.
+resolver.install()
 
 
 from fastapi.middleware.cors import CORSMiddleware
 from api.endpoints import songs, playlists, search
-from db import init_db
+from db import init_db, warm_pool
+from services.storage import storage
+from services.metrics import MetricsMiddleware, StartupProfile
 
 app = FastAPI(title="Nexus Music Player API")
 
@@ -48,13 +29,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursors for /api/songs and /api/playlists, chosen rendition for /stream
+    expose_headers=["X-Next-Cursor", "Link", "X-Rendition"],
 )
+# Added last so it is outermost and times the whole request, CORS included
+app.add_middleware(MetricsMiddleware)
+
+async def start_recommender():
+    # numpy/scipy take a noticeable part of a cold start, so they load on a
+    # worker thread instead of holding up startup and the first requests
+    await asyncio.to_thread(importlib.import_module, "services.recommendations")
+    from services.recommendations import recommender
+    recommender.start()
 
 @app.on_event("startup")
 async def on_startup():
+    profile = StartupProfile(IMPORT_STARTED)
+    profile.mark("import")
     await init_db()
+    profile.mark("init_db")
+    # Open pooled connections now instead of on the first requests
+    await warm_pool()
+    profile.mark("warm_pool")
+    # Replay the song_id -> path index so file lookups don't touch the disk
+    storage.load()
+    # Rebuild the transcode cache's LRU order from disk
+    from services.transcode import transcoder
+    transcoder.load()
+    profile.mark("storage")
+    # One-time rollup backfill for databases that predate daily rollups
+    from services.rollups import ensure_rollups
+    app.state.rollup_backfill = asyncio.create_task(ensure_rollups())
+    # Same for the library search index
+    from services.search_index import ensure_search_index
+    app.state.search_backfill = asyncio.create_task(ensure_search_index())
+    # Co-play index for recommendations, built from history in the background
+    app.state.recommender_start = asyncio.create_task(start_recommender())
+    # Event-loop lag probe for /metrics
+    from services.metrics import loop_lag
+    loop_lag.start()
+    profile.mark("background")
+    profile.report()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    from services.imports import import_queue
+    from services.play_buffer import play_buffer
+    from services.ingest import ingest
+    from services.transcode import transcoder
+    from services.metrics import loop_lag
+    await import_queue.shutdown()
+    await ingest.shutdown()
+    await transcoder.shutdown()
+    # The recommender may still be importing numpy/scipy
+    app.state.recommender_start.cancel()
+    await asyncio.gather(app.state.recommender_start, return_exceptions=True)
+    recommender = getattr(sys.modules.get("services.recommendations"), "recommender", None)
+    if recommender is not None:
+        await recommender.shutdown()
+    await loop_lag.shutdown()
+    # Write out any buffered play events before the process exits
+    await play_buffer.close()
 
-from api.endpoints import songs, playlists, search, analytics, external
+from api.endpoints import songs, playlists, search, analytics, external, sync, recommendations, metrics
 
 from fastapi.staticfiles import StaticFiles
 import os
@@ -64,6 +101,9 @@ app.include_router(playlists.router, prefix="/api/playlists", tags=["playlists"]
 app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 app.include_router(external.router, prefix="/api/external", tags=["external"])
+app.include_router(sync.router, prefix="/api/sync", tags=["sync"])
+app.include_router(recommendations.router, prefix="/api/recommendations", tags=["recommendations"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 # Serve Static Files
 if os.path.exists("static"):
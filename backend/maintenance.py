@@ -0,0 +1,281 @@
+"""
+Library maintenance tasks, replacing fix_duration.py.
+
+  durations  read the length of every song that has no duration yet
+  playlists  fill missing fields of the song copies embedded in playlists
+             (duration, artist, filename, title, url) from the songs collection
+
+Collections are streamed with cursors, audio files are parsed in a process
+pool and writes go out as unordered bulk_write batches. Progress is saved to
+a checkpoint file after every batch, so an interrupted run picks up where it
+stopped; pass --restart to start over. --dry-run reads everything but writes
+nothing (not even the checkpoint).
+
+Usage: python maintenance.py [durations|playlists|all] [--dry-run] [--restart]
+                             [--workers N] [--batch-size N] [--root uploaded_songs]
+                             [--checkpoint maintenance-checkpoint.json]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne, UpdateMany
+
+from db import init_db
+from models.song import Song
+from models.playlist import Playlist
+from services.storage import SongStorage, UPLOAD_DIR
+from services import library
+
+TASKS = ("durations", "playlists")
+CHECKPOINT_FILE = "maintenance-checkpoint.json"
+# Files handed to a worker process at a time, to keep IPC overhead low
+PARSE_CHUNK = 32
+
+# Song fields copied into playlist SongRefs, keyed by SongRef field
+SONG_REF_FIELDS = {
+    "duration": "duration",
+    "artist": "artist",
+    "filename": "filename",
+    # The frontend uses the filename as the title when adding to a playlist
+    "title": "filename",
+    "url": "url",
+}
+
+
+def read_durations(paths: List[Optional[str]]) -> List[Optional[float]]:
+    """Runs in a worker process: the length in seconds of each file, or None."""
+    from mutagen import File as MutagenFile
+
+    durations = []
+    for path in paths:
+        duration = None
+        if path:
+            try:
+                audio = MutagenFile(path)
+                if audio is not None and audio.info is not None:
+                    duration = audio.info.length
+            except Exception as e:
+                print(f"Failed to read {path}: {e}")
+        durations.append(duration)
+    return durations
+
+
+class Checkpoint:
+    """Last processed _id per task, saved atomically as JSON."""
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.positions: Dict[str, Any] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.positions = json.load(f)
+
+    def get(self, task: str) -> Any:
+        return self.positions.get(task)
+
+    def save(self, task: str, position: Any) -> None:
+        if position is None:
+            self.positions.pop(task, None)
+        else:
+            self.positions[task] = position
+        if not self.enabled:
+            return
+        if not self.positions:
+            # Everything finished
+            self.clear()
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.positions, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        self.positions = {}
+        if self.enabled and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    def __init__(self, task: str):
+        self.task = task
+        self.started = time.perf_counter()
+        self.seen = 0
+        self.updated = 0
+
+    def add(self, seen: int, updated: int) -> None:
+        self.seen += seen
+        self.updated += updated
+        print(f"{self.task}: {self.seen} processed, {self.updated} updated ({self.rate():.0f}/s)")
+
+    def rate(self) -> float:
+        return self.seen / max(time.perf_counter() - self.started, 1e-9)
+
+    def summary(self, dry_run: bool) -> str:
+        elapsed = time.perf_counter() - self.started
+        verb = "would update" if dry_run else "updated"
+        return f"{self.task}: {self.seen} processed, {verb} {self.updated} in {elapsed:.1f}s ({self.rate():.0f}/s)"
+
+
+async def backfill_durations(store: SongStorage, pool: ProcessPoolExecutor, checkpoint: Checkpoint, batch_size: int, dry_run: bool) -> Progress:
+    collection = Song.get_motor_collection()
+    query: Dict[str, Any] = {"duration": None}
+    last_id = checkpoint.get("durations")
+    if last_id is not None:
+        print(f"durations: resuming after {last_id}")
+        query["_id"] = {"$gt": last_id}
+
+    loop = asyncio.get_running_loop()
+    progress = Progress("durations")
+    cursor = collection.find(query, {"_id": 1, "blob_id": 1, "filename": 1}).sort("_id", 1).batch_size(batch_size)
+
+    batch: List[Dict[str, Any]] = []
+
+    async def process(batch: List[Dict[str, Any]]) -> None:
+        paths = []
+        for song in batch:
+            stored = store.lookup(song["_id"]) or (song.get("blob_id") and store.lookup(song["blob_id"]))
+            if not stored:
+                print(f"File for song {song.get('filename')} (ID: {song['_id']}) not found on disk.")
+            paths.append(stored.path if stored else None)
+
+        chunks = [paths[i:i + PARSE_CHUNK] for i in range(0, len(paths), PARSE_CHUNK)]
+        results = await asyncio.gather(*(loop.run_in_executor(pool, read_durations, chunk) for chunk in chunks))
+        durations = [duration for chunk in results for duration in chunk]
+
+        operations = [
+            # Guarded so a duration set meanwhile (e.g. by a new upload path) isn't overwritten
+            UpdateOne({"_id": song["_id"], "duration": None}, {"$set": {"duration": duration}})
+            for song, duration in zip(batch, durations)
+            if duration is not None
+        ]
+        if operations and not dry_run:
+            await collection.bulk_write(operations, ordered=False)
+        checkpoint.save("durations", batch[-1]["_id"])
+        progress.add(len(batch), len(operations))
+
+    async for song in cursor:
+        batch.append(song)
+        if len(batch) >= batch_size:
+            await process(batch)
+            batch = []
+    if batch:
+        await process(batch)
+
+    checkpoint.save("durations", None)
+    return progress
+
+
+def build_song_ref_pipeline(after: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    One pass over all playlists: every song referenced with a missing field,
+    with the values to fill in, ordered by song id so the run can resume.
+    """
+    missing = {"$or": [{field: None} for field in SONG_REF_FIELDS]}
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {"songs": {"$elemMatch": missing}}},
+        {"$unwind": "$songs"},
+        {"$match": {"$or": [{f"songs.{field}": None} for field in SONG_REF_FIELDS]}},
+        {"$group": {"_id": "$songs.id"}},
+    ]
+    if after is not None:
+        pipeline.append({"$match": {"_id": {"$gt": after}}})
+    pipeline += [
+        {"$sort": {"_id": 1}},
+        {"$lookup": {"from": Song.get_motor_collection().name, "localField": "_id", "foreignField": "_id", "as": "song"}},
+        {"$unwind": "$song"},
+        {"$project": {field: f"$song.{source}" for field, source in SONG_REF_FIELDS.items()}},
+    ]
+    return pipeline
+
+
+def song_ref_update(song: Dict[str, Any]) -> Optional[UpdateMany]:
+    """Fill only the fields that are missing, in every playlist entry for this song."""
+    updates, array_filters, missing = {}, [], []
+    for i, field in enumerate(SONG_REF_FIELDS):
+        if song.get(field) is None:
+            continue
+        updates[f"songs.$[f{i}].{field}"] = song[field]
+        array_filters.append({f"f{i}.id": song["_id"], f"f{i}.{field}": None})
+        missing.append({field: None})
+    if not updates:
+        return None
+    return UpdateMany(
+        {"songs": {"$elemMatch": {"id": song["_id"], "$or": missing}}},
+        {"$set": updates, "$inc": {"version": 1}},
+        array_filters=array_filters,
+    )
+
+
+async def backfill_song_refs(checkpoint: Checkpoint, batch_size: int, dry_run: bool) -> Progress:
+    collection = Playlist.get_motor_collection()
+    last_id = checkpoint.get("playlists")
+    if last_id is not None:
+        print(f"playlists: resuming after song {last_id}")
+
+    progress = Progress("playlists")
+    cursor = collection.aggregate(build_song_ref_pipeline(last_id), allowDiskUse=True, batchSize=batch_size)
+
+    batch: List[Dict[str, Any]] = []
+
+    async def process(batch: List[Dict[str, Any]]) -> None:
+        operations = [op for op in map(song_ref_update, batch) if op is not None]
+        modified = len(operations)
+        if operations and not dry_run:
+            result = await collection.bulk_write(operations, ordered=False)
+            modified = result.modified_count
+        checkpoint.save("playlists", batch[-1]["_id"])
+        progress.add(len(batch), modified)
+
+    async for song in cursor:
+        batch.append(song)
+        if len(batch) >= batch_size:
+            await process(batch)
+            batch = []
+    if batch:
+        await process(batch)
+
+    checkpoint.save("playlists", None)
+    return progress
+
+
+async def run(args: argparse.Namespace) -> None:
+    await init_db()
+    checkpoint = Checkpoint(args.checkpoint, enabled=not args.dry_run)
+    if args.restart:
+        checkpoint.clear()
+
+    tasks = TASKS if args.task == "all" else (args.task,)
+    reports = []
+    # Durations first, so the playlist pass can copy the new values
+    if "durations" in tasks:
+        store = SongStorage(args.root)
+        store.load()
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            reports.append(await backfill_durations(store, pool, checkpoint, args.batch_size, args.dry_run))
+    if "playlists" in tasks:
+        reports.append(await backfill_song_refs(checkpoint, args.batch_size, args.dry_run))
+
+    if not args.dry_run and any(progress.updated for progress in reports):
+        # Cached library listings are stale now
+        await library.bump_all()
+    for progress in reports:
+        print(progress.summary(args.dry_run))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill song durations and playlist song fields.")
+    parser.add_argument("task", nargs="?", choices=TASKS + ("all",), default="all")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--root", default=os.getenv("UPLOAD_DIR", UPLOAD_DIR))
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    args = parser.parse_args()
+    asyncio.run(run(args))
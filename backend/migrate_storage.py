@@ -0,0 +1,57 @@
+"""
+One-shot migration from the flat `uploaded_songs/<id>.<ext>` layout to the
+sharded layout used by services.storage.
+
+Safe to re-run: files that are already sharded are left alone, and each move
+is recorded in the index sidecar as it happens, so an interrupted run can
+simply be started again. Stop the API (or run before it starts) so the index
+compaction at the end doesn't race with live uploads.
+
+Usage: python migrate_storage.py [--root uploaded_songs] [--dry-run]
+"""
+import argparse
+import os
+import time
+
+from services.storage import SongStorage, UPLOAD_DIR
+
+
+def migrate(root: str, dry_run: bool = False) -> int:
+    store = SongStorage(root)
+    store.load()
+
+    flat_files = store.unmigrated_files()
+    print(f"Found {len(flat_files)} unsharded files in {root}.")
+
+    started = time.perf_counter()
+    moved = 0
+    for name in flat_files:
+        song_id, extension = os.path.splitext(name)
+        source = os.path.join(root, name)
+        target = store.path_for(song_id, extension) if not dry_run else os.path.join(store.shard_dir(song_id, create=False), name)
+
+        if dry_run:
+            print(f"Would move {source} -> {target}")
+            moved += 1
+            continue
+
+        # Same filesystem, so this is a cheap rename rather than a copy
+        os.replace(source, target)
+        store.register(song_id, target)
+        moved += 1
+
+    if not dry_run and moved:
+        store.compact()
+
+    elapsed = time.perf_counter() - started
+    verb = "Would move" if dry_run else "Moved"
+    print(f"{verb} {moved} files in {elapsed:.1f}s.")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard a flat uploaded_songs directory.")
+    parser.add_argument("--root", default=os.getenv("UPLOAD_DIR", UPLOAD_DIR))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    migrate(args.root, dry_run=args.dry_run)
@@ -2,6 +2,15 @@ from beanie import Document
 from pydantic import Field
 from datetime import datetime
 from typing import Optional
+import os
+import pymongo
+from pymongo import IndexModel
+
+# Raw play events are kept this many days (0 keeps them forever); stats read
+# the daily rollups, which are never expired
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+# Key of the time-only index that expires raw plays
+HISTORY_TTL_KEY = [("timestamp", pymongo.DESCENDING)]
 
 class ListeningHistory(Document):
     song_id: str
@@ -10,3 +19,30 @@ class ListeningHistory(Document):
 
     class Settings:
         name = "listening_history"
+        indexes = [
+            # Stats windows: one user's plays in a time range
+            [("owner_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)],
+            # Anonymous/global scans filter on time only. That index doubles as
+            # the retention TTL, so db.ensure_retention_indexes creates it and
+            # applies HISTORY_RETENTION_DAYS changes in place
+        ]
+
+class ListeningRollup(Document):
+    """
+    Plays per user per song per day, kept up to date with $inc at ingest time.
+    """
+    owner_id: Optional[str] = None
+    song_id: str
+    day: datetime
+    plays: int = 0
+
+    class Settings:
+        name = "listening_rollups"
+        indexes = [
+            IndexModel(
+                [("owner_id", pymongo.ASCENDING), ("day", pymongo.DESCENDING), ("song_id", pymongo.ASCENDING)],
+                unique=True
+            ),
+            # Global (anonymous) stats windows
+            [("day", pymongo.DESCENDING)],
+        ]
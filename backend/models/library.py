@@ -0,0 +1,46 @@
+from beanie import Document
+from pydantic import Field
+from datetime import datetime
+import os
+import pymongo
+from pymongo import IndexModel
+
+# Change log entries are kept this many days; clients that sync less often
+# than that get a full resync instead
+LIBRARY_CHANGES_RETENTION_DAYS = int(os.getenv("LIBRARY_CHANGES_RETENTION_DAYS", "30"))
+# Key of the index that expires change log entries
+LIBRARY_CHANGES_TTL_KEY = [("created_at", pymongo.ASCENDING)]
+
+class LibraryVersion(Document):
+    """
+    Counter bumped by every write to an owner's songs or playlists, so
+    clients can revalidate cached library listings cheaply.
+    """
+    id: str = Field(alias="_id")  # owner id, or "*" for writes by anyone
+    version: int = 0
+    # Changes up to this version are not in the change log (bulk maintenance)
+    reset_after: int = 0
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "library_versions"
+
+class LibraryChange(Document):
+    """
+    One entry of an owner's change log: the song or playlist `ref_id` was
+    written (or deleted), taking the owner's library to version `seq`.
+    """
+    owner_id: str
+    seq: int
+    kind: str  # "song" or "playlist"
+    ref_id: str
+    deleted: bool = False
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "library_changes"
+        indexes = [
+            IndexModel([("owner_id", pymongo.ASCENDING), ("seq", pymongo.ASCENDING)], unique=True),
+            # The created_at TTL is created by db.ensure_retention_indexes, which
+            # applies LIBRARY_CHANGES_RETENTION_DAYS changes in place
+        ]
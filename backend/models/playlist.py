@@ -1,7 +1,8 @@
 from beanie import Document
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+from typing import List, Optional, Literal
 from datetime import datetime
+import pymongo
 
 class SongRef(BaseModel):
     id: str
@@ -16,7 +17,51 @@ class Playlist(Document):
     description: Optional[str] = None
     songs: List[SongRef] = []
     owner_id: Optional[str] = None
+    # Bumped by every edit, so clients can tell whether their copy is current
+    version: int = 0
     created_at: datetime = Field(default_factory=datetime.now)
 
     class Settings:
         name = "playlists"
+        indexes = [
+            # Keyset-paginated playlist listing
+            [("owner_id", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            # All owners' playlists (no X-User-ID)
+            [("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+        ]
+
+
+class PlaylistOperation(BaseModel):
+    """One edit of a playlist's song list: add a song, remove one, or move one to `position`."""
+    op: Literal["add", "remove", "move"]
+    song: Optional[SongRef] = None
+    song_id: Optional[str] = None
+    position: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def check_arguments(self):
+        if self.op == "add":
+            if self.song is None:
+                raise ValueError("add needs a song")
+            self.song_id = self.song.id
+        elif self.song_id is None:
+            raise ValueError(f"{self.op} needs a song_id")
+        if self.op == "move" and self.position is None:
+            raise ValueError("move needs a position")
+        return self
+
+class PlaylistDelta(BaseModel):
+    """What an edit changed: the operations that took effect and the playlist's new version."""
+    id: str
+    version: int
+    operations: List[PlaylistOperation] = []
+    # Whose change log the edit belongs to; not part of the response
+    _owner_id: Optional[str] = PrivateAttr(default=None)
+
+    def owned_by(self, owner_id: Optional[str]) -> "PlaylistDelta":
+        self._owner_id = owner_id
+        return self
+
+    @property
+    def owner_id(self) -> Optional[str]:
+        return self._owner_id
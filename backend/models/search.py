@@ -0,0 +1,27 @@
+from beanie import Document
+from pydantic import Field
+from typing import List, Optional
+import pymongo
+
+class SearchEntry(Document):
+    """
+    Search terms for one song or playlist, kept in sync by services.search_index.
+    """
+    id: str = Field(alias="_id")  # "<kind>:<ref_id>"
+    kind: str  # "song" | "playlist"
+    ref_id: str
+    owner_id: Optional[str] = None
+    # Normalized display text, used to rank prefix matches first
+    label: str = ""
+    # Whole words, for exact-word ranking
+    words: List[str] = []
+    # Edge n-grams of every word, so type-ahead prefixes hit the index
+    terms: List[str] = []
+
+    class Settings:
+        name = "search_index"
+        indexes = [
+            [("owner_id", pymongo.ASCENDING), ("kind", pymongo.ASCENDING), ("terms", pymongo.ASCENDING)],
+            # Unscoped (no X-User-ID) searches
+            [("kind", pymongo.ASCENDING), ("terms", pymongo.ASCENDING)],
+        ]
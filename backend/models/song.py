@@ -2,6 +2,10 @@ from typing import Optional, List
 from beanie import Document
 from pydantic import Field
 from datetime import datetime
+import pymongo
+
+# Moods offered by the UI; songs may carry others, but facets count these
+MOODS = ("Happy", "Sad", "Energetic", "Chill", "Romantic", "Angry", "Focused", "Party")
 
 class Song(Document):
     id: str = Field(alias="_id")
@@ -11,8 +15,21 @@ class Song(Document):
     artist: Optional[str] = None
     duration: Optional[float] = None
     owner_id: Optional[str] = None
+    # Stored file this song plays from when it is shared (e.g. a deduplicated import)
+    blob_id: Optional[str] = None
     moods: List[str] = []
     created_at: datetime = Field(default_factory=datetime.now)
 
     class Settings:
         name = "songs"
+        indexes = [
+            # Keyset-paginated library listing
+            [("owner_id", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            # Mood facets and mood-filtered listings (multikey on moods)
+            [("owner_id", pymongo.ASCENDING), ("moods", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            # Same two without an owner, for requests that send no X-User-ID
+            [("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            [("moods", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            # Imports look up an already-downloaded video's metadata by blob
+            [("blob_id", pymongo.ASCENDING)],
+        ]
@@ -0,0 +1,17 @@
+from beanie import Document
+from pydantic import Field
+from typing import Optional
+from datetime import datetime
+
+class Waveform(Document):
+    # Stored file the peaks were computed from: the song id for uploads, the
+    # blob id for imports, so songs sharing a blob share one waveform
+    id: str = Field(alias="_id")
+    # One unsigned byte per bucket: the loudest sample in it, scaled so the
+    # loudest bucket of the track is 255
+    peaks: bytes
+    duration: Optional[float] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "waveforms"
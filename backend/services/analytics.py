@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from models.history import ListeningRollup
+from services.rollups import day_bucket
+
+# Supported stats windows, in days (None = all-time)
+WINDOWS = {"7d": 7, "30d": 30, "all": None}
+# Daily activity always covers at least this many days (the all-time view
+# can't be charted day by day)
+DEFAULT_DAILY_DAYS = 7
+
+
+def build_stats_pipeline(owner_id: Optional[str], window: str, limit: int, now: datetime) -> List[Dict[str, Any]]:
+    """
+    One aggregation over the daily rollups that returns top songs, daily
+    buckets and the total in a single round trip. Its cost scales with days x
+    distinct songs rather than with the number of plays.
+    """
+    days = WINDOWS[window]
+    daily_days = days or DEFAULT_DAILY_DAYS
+    daily_start = day_bucket(now) - timedelta(days=daily_days - 1)
+
+    match: Dict[str, Any] = {}
+    if owner_id:
+        match["owner_id"] = owner_id
+    if days:
+        match["day"] = {"$gte": day_bucket(now) - timedelta(days=days - 1)}
+
+    return [
+        {"$match": match},
+        {"$facet": {
+            "top_songs": [
+                {"$group": {"_id": "$song_id", "plays": {"$sum": "$plays"}}},
+                {"$sort": {"plays": -1, "_id": 1}},
+                {"$limit": limit},
+                {"$lookup": {
+                    "from": "songs",
+                    "localField": "_id",
+                    "foreignField": "_id",
+                    "as": "song",
+                }},
+                {"$unwind": "$song"},
+                {"$project": {
+                    "_id": 0,
+                    "id": "$_id",
+                    "filename": "$song.filename",
+                    "artist": "$song.artist",
+                    "plays": 1,
+                }},
+            ],
+            "daily_activity": [
+                {"$match": {"day": {"$gte": daily_start}}},
+                {"$group": {"_id": "$day", "plays": {"$sum": "$plays"}}},
+            ],
+            "total": [{"$group": {"_id": None, "plays": {"$sum": "$plays"}}}],
+        }},
+    ]
+
+
+async def listening_stats(owner_id: Optional[str], window: str = "all", limit: int = 5) -> Dict[str, Any]:
+    now = datetime.now()
+    pipeline = build_stats_pipeline(owner_id, window, limit, now)
+    result = await ListeningRollup.aggregate(pipeline).to_list()
+    facets = result[0] if result else {"top_songs": [], "daily_activity": [], "total": []}
+
+    # Fill in days without plays so the chart always has every bucket
+    per_day = {bucket["_id"].date(): bucket["plays"] for bucket in facets["daily_activity"]}
+    daily_days = WINDOWS[window] or DEFAULT_DAILY_DAYS
+    daily_stats = []
+    for i in range(daily_days - 1, -1, -1):
+        day = (now - timedelta(days=i)).date()
+        daily_stats.append({
+            "name": day.strftime("%a"),
+            "date": day.isoformat(),
+            "plays": per_day.get(day, 0)
+        })
+
+    return {
+        "top_songs": facets["top_songs"],
+        "daily_activity": daily_stats,
+        "total_plays": facets["total"][0]["plays"] if facets["total"] else 0,
+        "window": window
+    }
@@ -0,0 +1,48 @@
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+from starlette.responses import Response
+
+# Library JSON is per user and changes whenever they edit it: cache, but always revalidate
+LIBRARY_CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(_opaque(tag) == _opaque(etag) for tag in if_none_match.split(","))
+
+
+def not_modified(request_headers: Mapping[str, str], etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    Whether a GET/HEAD can be answered with 304. If-None-Match wins over
+    If-Modified-Since when both are sent.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= int(parsedate_to_datetime(if_modified_since).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def library_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": LIBRARY_CACHE_CONTROL, "Vary": "X-User-ID"}
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,82 @@
+import os
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List
+
+from services.cache import TTLCache
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+
+
+def normalize_query(q: str) -> str:
+    # "  Daft  Punk " and "daft punk" are the same search
+    return " ".join(q.lower().split())
+
+
+def _default_client():
+    from ytmusicapi import YTMusic
+    return YTMusic()
+
+
+class ExternalSearch:
+    """
+    YouTube Music search with a long-lived client and a result cache.
+
+    The blocking ytmusicapi call runs in a worker thread, results are cached
+    by normalized query (LRU + TTL) and identical concurrent queries share one
+    upstream request. Pass `client_factory` to swap in a stub client.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any] = _default_client,
+        cache_size: int = SEARCH_CACHE_SIZE,
+        cache_ttl: float = SEARCH_CACHE_TTL,
+    ):
+        self._client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    @property
+    def client(self):
+        # Built once, on first use (in a worker thread), then reused
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    async def search(self, q: str) -> List[Dict[str, Any]]:
+        query = normalize_query(q)
+        return await self.cache.get_or_load(query, lambda: asyncio.to_thread(self._search, query))
+
+    def _search(self, query: str) -> List[Dict[str, Any]]:
+        results = self.client.search(query, filter="songs")
+
+        formatted_results = []
+        for entry in results:
+            # Safe extraction of artist
+            artists = entry.get('artists', [])
+            artist_name = artists[0]['name'] if artists else "Unknown Artist"
+
+            # Safe extraction of thumbnails
+            thumbnails = entry.get('thumbnails', [])
+            thumbnail_url = thumbnails[-1]['url'] if thumbnails else ""
+
+            formatted_results.append({
+                "id": entry.get('videoId'),
+                "title": entry.get('title'),
+                "thumbnails": [{"url": thumbnail_url}],
+                "duration": entry.get('duration', "0:00"),
+                "channel": artist_name,
+                "link": f"https://www.youtube.com/watch?v={entry.get('videoId')}"
+            })
+        return formatted_results
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+external_search = ExternalSearch()
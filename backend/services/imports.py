@@ -0,0 +1,465 @@
+import os
+import re
+import uuid
+import time
+import random
+import shutil
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from models.song import Song
+from services.storage import storage, PARTIAL_SUFFIXES
+from services.search_index import index_song
+from services.ingest import ingest
+from services.transcode import transcoder
+from services import library
+from services import metrics
+
+# How many yt-dlp downloads may run at once, and how many may wait for a slot
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "2"))
+IMPORT_QUEUE_SIZE = int(os.getenv("IMPORT_QUEUE_SIZE", "100"))
+# Finished jobs are kept around this long so clients can still read the result
+JOB_RETENTION_SECONDS = 3600
+
+# Backoff between client rotation attempts (seconds), awaited so the loop stays free
+RETRY_BACKOFF = (3.0, 7.0)
+
+VIDEO_ID_RE = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})")
+BARE_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+# Special markers for bot detection and cookie issues
+# We handle both straight (') and curly (’) quotes as both appear in different YouTube clients
+BOT_ERROR_MARKERS = [
+    "sign in to confirm you're not a bot",
+    "sign in to confirm you’re not a bot",
+    "bot detection",
+    "confirm you're human",
+    "confirm you’re human",
+    "cookies are no longer valid",
+    "rotated in the browser"
+]
+
+# Comprehensive client rotation for cloud environments
+COOKIE_CLIENTS = [
+    {'client': ['android'], 'ua': 'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36'},
+    {'client': ['mweb'], 'ua': 'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36'},
+    {'client': ['ios'], 'ua': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1'},
+    {'client': ['web'], 'ua': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'}
+]
+ANONYMOUS_CLIENTS = [
+    {'client': ['android'], 'ua': 'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36'},
+    {'client': ['ios'], 'ua': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1'},
+    {'client': ['tv_embedded'], 'ua': 'Mozilla/5.0 (SMART-TV; Linux; Tizen 6.0) AppleWebkit/537.36 (KHTML, like Gecko) SamsungBrowser/4.0 Chrome/88.0.4324.182 TV Safari/537.36'},
+    {'client': ['android_music'], 'ua': 'com.google.android.apps.youtube.music/6.41.52 (Linux; U; Android 14; en_US; Pixel 8 Pro; Build/UQ1A.240205.004)'}
+]
+
+
+class ImportFailed(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ImportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    video_url: str
+    owner_id: Optional[str] = None
+    moods: List[str] = []
+    status: str = "queued"  # queued -> running -> completed | failed
+    attempt: int = 0
+    progress: float = 0.0
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    song_id: Optional[str] = None
+    # True when this job reused another import's download of the same video
+    deduplicated: bool = False
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+
+    _song: Optional[Song] = PrivateAttr(default=None)
+    _changed: Optional[asyncio.Event] = PrivateAttr(default=None)
+    _done: Optional[asyncio.Event] = PrivateAttr(default=None)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def notify(self) -> None:
+        # Wake everyone waiting on the current event, then arm a fresh one
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        self._changed.set()
+        self._changed = asyncio.Event()
+        if self.finished:
+            self._done_event().set()
+
+    async def wait_for_change(self, timeout: float) -> None:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        waiter = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            waiter.cancel()
+
+    async def wait(self) -> Optional[Song]:
+        """Wait for the job to finish and return the Song, raising ImportFailed on error."""
+        await self._done_event().wait()
+        if self.status == "failed":
+            raise ImportFailed(self.status_code or 500, self.error or "Import failed")
+        return self._song
+
+    def _done_event(self) -> asyncio.Event:
+        if self._done is None:
+            self._done = asyncio.Event()
+        return self._done
+
+
+class ImportQueue:
+    """
+    Bounded worker pool for YouTube imports.
+
+    yt-dlp is blocking, so each download runs on a dedicated thread pool sized
+    to IMPORT_CONCURRENCY; the asyncio workers only await it, which keeps the
+    event loop (and every other request) responsive during imports.
+    """
+
+    def __init__(self, concurrency: int = IMPORT_CONCURRENCY, max_queued: int = IMPORT_QUEUE_SIZE):
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.jobs: Dict[str, ImportJob] = {}
+        # blob_id -> future resolving to the downloaded source, for single-flight
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._followers: Set[asyncio.Task] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="yt-import")
+
+    def submit(self, video_url: str, owner_id: Optional[str] = None, moods: Optional[List[str]] = None) -> ImportJob:
+        self._ensure_workers()
+        self._prune()
+        job = ImportJob(video_url=video_url, owner_id=owner_id, moods=moods or [])
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull()
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    async def shutdown(self) -> None:
+        tasks = self._workers + list(self._followers)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_workers(self) -> None:
+        # Started lazily so the queue binds to the running server loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def _prune(self) -> None:
+        now = datetime.now()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at and (now - job.finished_at).total_seconds() > JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                video_id = extract_video_id(job.video_url)
+                blob_id = f"yt-{video_id}" if video_id else str(uuid.uuid4())
+                inflight = self._inflight.get(blob_id)
+                if inflight is not None:
+                    # Someone is already downloading this video: wait for it
+                    # off the pool so we don't hold a download slot
+                    task = asyncio.create_task(self._execute(job, self._follow(job, blob_id, inflight)))
+                    self._followers.add(task)
+                    task.add_done_callback(self._followers.discard)
+                else:
+                    await self._execute(job, self._lead(job, blob_id))
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: ImportJob, run) -> None:
+        try:
+            job.status = "running"
+            job.notify()
+            job._song = await run
+            job.song_id = job._song.id
+            job.progress = 100.0
+            job.status = "completed"
+        except ImportFailed as e:
+            job.status = "failed"
+            job.status_code = e.status_code
+            job.error = e.detail
+        except asyncio.CancelledError:
+            # Shutdown: still finish the job so status/SSE clients stop waiting
+            job.status = "failed"
+            job.status_code = 503
+            job.error = "Import cancelled"
+            raise
+        except Exception as e:
+            print(f"Import job {job.id} crashed: {e}")
+            job.status = "failed"
+            job.status_code = 500
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            job.notify()
+
+    async def _follow(self, job: ImportJob, blob_id: str, inflight: asyncio.Future) -> Song:
+        job.deduplicated = True
+        try:
+            source = await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            if not inflight.cancelled():
+                # This job itself was cancelled
+                raise
+            raise ImportFailed(503, "The download this import was waiting on was cancelled, try again")
+        return await _create_song(job, blob_id, source)
+
+    async def _lead(self, job: ImportJob, blob_id: str) -> Song:
+        """
+        Import a video for the job's owner, sharing one download per video.
+
+        Concurrent jobs for the same video in this process wait on the leader's
+        future. Across worker processes the video's file lock is held for the
+        whole download: other workers importing it wait on the lock, then find
+        the finished blob (and the leader's Song metadata) and skip downloading.
+        The download goes to a private directory and is moved into its shard
+        only when complete.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[blob_id] = future
+        try:
+            async with storage.lock(blob_id):
+                source = await _existing_blob(blob_id)
+                if source is not None:
+                    job.deduplicated = True
+                else:
+                    incoming = storage.incoming_dir()
+                    try:
+                        downloaded = await self._download(job, blob_id, incoming)
+                        stored = storage.adopt(blob_id, downloaded['path'])
+                    finally:
+                        shutil.rmtree(incoming, ignore_errors=True)
+                    source = {**downloaded, 'path': stored.path}
+                    ingest.schedule_waveform(blob_id, source['path'])
+                    transcoder.schedule(blob_id, source['path'])
+                # Created under the lock so other processes find the metadata
+                song = await _create_song(job, blob_id, source)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved in case no followers were waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(source)
+            return song
+        finally:
+            self._inflight.pop(blob_id, None)
+
+    async def _download(self, job: ImportJob, blob_id: str, directory: str) -> dict:
+        """
+        Download audio from YouTube into `directory` with smart client rotation.
+        """
+        loop = asyncio.get_running_loop()
+        output_template = os.path.join(directory, f"{blob_id}.%(ext)s")
+
+        cookies_content = os.getenv("YOUTUBE_COOKIES")
+        cookie_file = None
+        if cookies_content:
+            cookie_file = "cookies.txt"
+            with open(cookie_file, "w") as f:
+                f.write(cookies_content)
+
+        clients_to_try = COOKIE_CLIENTS if cookie_file else ANONYMOUS_CLIENTS
+
+        def on_progress(d):
+            # Called from the download thread; hop back onto the loop to publish
+            loop.call_soon_threadsafe(_apply_progress, job, d)
+
+        last_error = None
+        for attempt, config in enumerate(clients_to_try):
+            if attempt > 0:
+                metrics.ytdlp_download_retries.inc()
+                await asyncio.sleep(random.uniform(*RETRY_BACKOFF))
+            job.attempt = attempt + 1
+            job.notify()
+
+            ydl_opts = {
+                'format': 'bestaudio/best',
+                'outtmpl': output_template,
+                'noplaylist': True,
+                'quiet': True,
+                'verbose': True,
+                'force_ipv4': True,
+                'nocheckcertificate': True,
+                'rm_cachedir': True,
+                'remote_components': ['ejs:github'],
+                'extractor_args': {
+                    'youtube': {
+                        'player_client': config['client'],
+                        # Use Deno (installed in Dockerfile) to solve player challenges (PO Token)
+                        'player_skip': ['web_safari', 'web_embedded_player_es6'],
+                    }
+                },
+                'allow_unplayable_formats': True,
+                'referer': 'https://www.youtube.com/',
+                'http_headers': {
+                    'User-Agent': config['ua'],
+                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                    'Accept-Language': 'en-US,en;q=0.5',
+                },
+                'progress_hooks': [on_progress],
+            }
+
+            if cookie_file:
+                ydl_opts['cookiefile'] = cookie_file
+
+            started = time.perf_counter()
+            try:
+                info = await loop.run_in_executor(self._executor, _download, ydl_opts, job.video_url)
+            except Exception as e:
+                metrics.ytdlp_download_duration.labels("failed").observe(time.perf_counter() - started)
+                last_error = e
+                error_msg = str(e).lower()
+                print(f"DEBUG: Attempt {attempt+1} ({config['client']}) failed: {error_msg}")
+
+                if any(marker in error_msg for marker in BOT_ERROR_MARKERS):
+                    # If we're hit with anything that suggests login/bot, we return 401 with instructions
+                    raise ImportFailed(
+                        401,
+                        "Import blocked: YouTube requested login OR cookies expired. Action Required: Provide fresh cookies from a real browser session. See walkthrough.md for instructions."
+                    )
+                continue
+
+            # The job's own directory only holds this download; find its final extension
+            path = _finished_file(directory, blob_id)
+            if not path:
+                metrics.ytdlp_download_duration.labels("missing").observe(time.perf_counter() - started)
+                continue
+            metrics.ytdlp_download_duration.labels("completed").observe(time.perf_counter() - started)
+            metrics.ytdlp_download_bytes.inc(os.path.getsize(path))
+
+            title = info.get('title', 'Unknown External Track')
+            return {
+                'path': path,
+                'filename': f"{title}.{path.split('.')[-1]}",
+                'artist': info.get('uploader', 'Unknown Artist'),
+                'duration': info.get('duration'),
+            }
+
+        # Final Failure Message
+        error_msg = str(last_error) if last_error else "All download methods exhausted."
+        user_hint = ""
+        if "requested format is not available" in str(error_msg).lower():
+            user_hint = " Your cookies might be expired or don't have enough permission for this specific video."
+
+        raise ImportFailed(500, f"Import blocked by YouTube: {error_msg}.{user_hint} Check walkthrough.md.")
+
+
+def extract_video_id(video_url: str) -> Optional[str]:
+    """YouTube video id from a watch/short/embed URL or a bare id."""
+    match = VIDEO_ID_RE.search(video_url)
+    if match:
+        return match.group(1)
+    if BARE_VIDEO_ID_RE.match(video_url):
+        return video_url
+    return None
+
+
+def _finished_file(directory: str, blob_id: str) -> Optional[str]:
+    for name in os.listdir(directory):
+        if name.startswith(blob_id) and not name.endswith(PARTIAL_SUFFIXES):
+            return os.path.join(directory, name)
+    return None
+
+
+async def _existing_blob(blob_id: str) -> Optional[dict]:
+    """Source details for a blob some earlier import already stored."""
+    stored = storage.lookup(blob_id)
+    if not stored:
+        return None
+    song = await Song.find_one(Song.blob_id == blob_id)
+    if not song:
+        # File without metadata (all owners deleted it); download again
+        return None
+    return {
+        'path': stored.path,
+        'filename': song.filename,
+        'artist': song.artist,
+        'duration': song.duration,
+    }
+
+
+async def _create_song(job: ImportJob, blob_id: str, source: dict) -> Song:
+    # Every owner gets their own Song; they all play the same stored blob
+    song_id = str(uuid.uuid4())
+    storage.register(song_id, source['path'])
+    new_song = Song(
+        _id=song_id,
+        filename=source['filename'],
+        original_filename=os.path.basename(source['path']),
+        url=f"/api/songs/{song_id}",
+        artist=source['artist'],
+        duration=source['duration'],
+        owner_id=job.owner_id,
+        moods=job.moods,
+        blob_id=blob_id
+    )
+    await new_song.create()
+    await index_song(new_song)
+    await library.record_change(job.owner_id, "song", song_id)
+    return new_song
+
+
+def _download(ydl_opts: dict, video_url: str) -> dict:
+    # Runs on the import thread pool; yt_dlp is imported here so it never loads on the loop
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(video_url, download=True)
+
+
+def _apply_progress(job: ImportJob, d: dict) -> None:
+    if d.get('status') != 'downloading':
+        return
+    downloaded = d.get('downloaded_bytes') or 0
+    total = d.get('total_bytes') or d.get('total_bytes_estimate')
+    progress = round(downloaded * 100.0 / total, 1) if total else job.progress
+    # yt-dlp fires this many times a second; only publish whole-percent steps
+    if int(progress) == int(job.progress) and job.total_bytes == total:
+        job.downloaded_bytes = downloaded
+        return
+    job.downloaded_bytes = downloaded
+    job.total_bytes = total
+    job.progress = progress
+    job.notify()
+
+
+import_queue = ImportQueue()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import asyncio
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, NamedTuple, Optional, Set
+
+from models.waveform import Waveform
+
+# Worker processes for parsing and decoding uploads
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Buckets per waveform, i.e. bytes stored per track
+WAVEFORM_PEAKS = int(os.getenv("WAVEFORM_PEAKS", "1000"))
+# Audio is decoded to mono at this rate for peaks; plenty for a seek bar
+WAVEFORM_SAMPLE_RATE = 8000
+DECODE_TIMEOUT = 300
+COPY_CHUNK = 1024 * 1024
+
+
+class Analysis(NamedTuple):
+    duration: Optional[float]
+    peaks: Optional[bytes]
+
+
+def read_duration(path: str) -> Optional[float]:
+    try:
+        from mutagen import File as MutagenFile
+        audio = MutagenFile(path)
+        if audio is not None and audio.info is not None:
+            return audio.info.length
+    except Exception as e:
+        print(f"Error extracting metadata: {e}")
+    return None
+
+
+def compute_peaks(samples, count: int = WAVEFORM_PEAKS) -> bytes:
+    """Loudest sample of each of `count` equal slices of `samples`, scaled to 0-255."""
+    import numpy as np
+
+    if samples.size == 0:
+        return b""
+    count = min(count, samples.size)
+    starts = np.linspace(0, samples.size, count + 1).astype(np.int64)[:-1]
+    peaks = np.maximum.reduceat(np.abs(samples.astype(np.int32)), starts)
+    loudest = peaks.max()
+    if loudest == 0:
+        return bytes(count)
+    return np.round(peaks * (255.0 / loudest)).astype(np.uint8).tobytes()
+
+
+def decode_samples(path: str, rate: int = WAVEFORM_SAMPLE_RATE):
+    """Decode any format ffmpeg understands to mono 16-bit samples, or None without ffmpeg."""
+    import numpy as np
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    result = subprocess.run(
+        [ffmpeg, "-v", "error", "-nostdin", "-i", path, "-ac", "1", "-ar", str(rate), "-f", "s16le", "-"],
+        capture_output=True,
+        timeout=DECODE_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors="replace").strip() or f"ffmpeg exited with {result.returncode}")
+    return np.frombuffer(result.stdout, dtype="<i2")
+
+
+def analyze(path: str, peaks: int = WAVEFORM_PEAKS) -> Analysis:
+    """Runs in a worker process: duration from the tags, peaks from one ffmpeg decode."""
+    duration = read_duration(path)
+    waveform = None
+    try:
+        samples = decode_samples(path)
+        if samples is not None:
+            waveform = compute_peaks(samples, peaks)
+            if duration is None and samples.size:
+                duration = samples.size / WAVEFORM_SAMPLE_RATE
+    except Exception as e:
+        print(f"Error computing waveform for {path}: {e}")
+    return Analysis(duration, waveform)
+
+
+def _copy(source: BinaryIO, path: str) -> None:
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, COPY_CHUNK)
+
+
+class Ingest:
+    """
+    Off-loop processing of new audio files.
+
+    File copies run in a thread; metadata parsing and the ffmpeg/NumPy
+    waveform pass run in a small process pool, so neither blocks the event
+    loop. Waveforms are stored per blob and built on demand for files that
+    predate them, with concurrent requests for the same blob sharing one build.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the server process has live threads and sockets
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def save_upload(self, source: BinaryIO, path: str) -> None:
+        await asyncio.to_thread(_copy, source, path)
+
+    async def duration(self, path: str) -> Optional[float]:
+        """Duration from the tags only (Mutagen), without decoding the audio."""
+        return await asyncio.get_running_loop().run_in_executor(self.pool, read_duration, path)
+
+    async def analyze(self, path: str) -> Analysis:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, analyze, path)
+
+    async def store_waveform(self, blob_id: str, analysis: Analysis) -> Optional[Waveform]:
+        if analysis.peaks is None:
+            return None
+        waveform = Waveform(_id=blob_id, peaks=analysis.peaks, duration=analysis.duration)
+        await waveform.save()
+        return waveform
+
+    async def waveform(self, blob_id: str, path: str) -> Optional[Waveform]:
+        """The stored waveform for a blob, building it from `path` if needed."""
+        existing = await Waveform.get(blob_id)
+        if existing is not None:
+            return existing
+
+        inflight = self._inflight.get(blob_id)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[blob_id] = future
+        try:
+            waveform = await self.store_waveform(blob_id, await self.analyze(path))
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()
+            raise
+        else:
+            future.set_result(waveform)
+            return waveform
+        finally:
+            self._inflight.pop(blob_id, None)
+
+    def schedule_waveform(self, blob_id: str, path: str) -> None:
+        """Build a waveform in the background, e.g. right after an import."""
+        task = asyncio.create_task(self.waveform(blob_id, path))
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Waveform build failed: {task.exception()}")
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+ingest = Ingest()
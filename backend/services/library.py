@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from models.library import LibraryVersion, LibraryChange
+from services.library_cache import library_cache
+
+# Listings without X-User-ID show every owner's songs, so they follow a
+# counter that every write bumps
+ALL_OWNERS = "*"
+
+
+async def _increment(key: str) -> int:
+    doc = await LibraryVersion.get_motor_collection().find_one_and_update(
+        {"_id": key},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["version"]
+
+
+async def bump(owner_id: Optional[str]) -> int:
+    """Record a write to `owner_id`'s library; returns their new version."""
+    if not owner_id:
+        return await _increment(ALL_OWNERS)
+    version, _ = await asyncio.gather(_increment(owner_id), _increment(ALL_OWNERS))
+    return version
+
+
+async def record_change(owner_id: Optional[str], kind: str, ref_id: str, deleted: bool = False) -> int:
+    """
+    Record a write to one song or playlist: bumps the versions and, when there
+    is an owner, appends it to their change log for /api/sync. Returns the
+    owner's new version.
+    """
+    # Taken before the version is, so a later seq never has an earlier time
+    changed_at = datetime.now()
+    version = await bump(owner_id)
+    await library_cache.invalidate(owner_id, ref_id if kind == "playlist" else None)
+    if owner_id:
+        await LibraryChange(
+            owner_id=owner_id, seq=version, kind=kind, ref_id=ref_id, deleted=deleted, created_at=changed_at
+        ).insert()
+    return version
+
+
+async def bump_all() -> None:
+    """
+    For bulk maintenance that touches everyone's library. The changes are not
+    logged, so clients that synced before this are told to resync fully.
+    """
+    await LibraryVersion.get_motor_collection().update_many({}, [
+        {"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}, "updated_at": datetime.now()}},
+        {"$set": {"reset_after": "$version"}},
+    ])
+    await library_cache.clear()
+
+
+async def current_version(owner_id: Optional[str]) -> int:
+    doc = await LibraryVersion.get_motor_collection().find_one({"_id": owner_id or ALL_OWNERS}, {"version": 1})
+    return doc["version"] if doc else 0
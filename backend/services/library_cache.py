@@ -0,0 +1,229 @@
+import os
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from services.cache import TTLCache, MISSING
+
+# Cached library responses per process; 0 disables the cache
+LIBRARY_CACHE_SIZE = int(os.getenv("LIBRARY_CACHE_SIZE", "1024"))
+# Total size of the cached responses per process; least recently used ones go first
+LIBRARY_CACHE_MAX_BYTES = int(os.getenv("LIBRARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LIBRARY_CACHE_TTL = float(os.getenv("LIBRARY_CACHE_TTL", "300"))
+# Larger responses are streamed as before and not cached
+LIBRARY_CACHE_MAX_ENTRY = int(os.getenv("LIBRARY_CACHE_MAX_ENTRY", str(1024 * 1024)))
+# Optional shared backend for multi-worker deployments, e.g. redis://localhost:6379/0
+LIBRARY_CACHE_URL = os.getenv("LIBRARY_CACHE_URL", "")
+
+ALL_OWNERS = "*"
+
+# (scope, kind, version, query string); scope is the owner, "*" or "playlist:<id>"
+Key = Tuple[str, str, Any, str]
+
+
+class CachedResponse(NamedTuple):
+    media_type: Optional[str]
+    headers: Dict[str, str]
+    body: bytes
+
+    def size(self) -> int:
+        """Approximate memory held: the body plus the header strings."""
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    def pack(self) -> bytes:
+        meta = json.dumps({"media_type": self.media_type, "headers": self.headers}).encode()
+        return meta + b"\n" + self.body
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "CachedResponse":
+        meta, body = data.split(b"\n", 1)
+        meta = json.loads(meta)
+        return cls(meta["media_type"], meta["headers"], body)
+
+
+class MemoryBackend:
+    """Per-process LRU + TTL; writes in this process drop the owner's entries at once."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = LIBRARY_CACHE_SIZE, ttl: float = LIBRARY_CACHE_TTL, maxbytes: int = LIBRARY_CACHE_MAX_BYTES):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes, sizeof=CachedResponse.size)
+
+    async def get(self, key: Key) -> Optional[CachedResponse]:
+        entry = self.cache.get(key)
+        return None if entry is MISSING else entry
+
+    async def set(self, key: Key, entry: CachedResponse) -> None:
+        self.cache.set(key, entry)
+
+    async def invalidate(self, scopes: Iterable[str]) -> None:
+        scopes = set(scopes)
+        self.cache.invalidate_where(lambda key: key[0] in scopes)
+
+    async def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+class RedisBackend:
+    """
+    Shared between workers (needs the `redis` package). Keys carry the library
+    version, which lives in MongoDB, so a write in any worker makes the old
+    entries unreachable everywhere; they then expire after `ttl`.
+    """
+
+    name = "redis"
+    prefix = "nexus:library:"
+
+    def __init__(self, url: str, ttl: float = LIBRARY_CACHE_TTL):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl = max(int(ttl), 1)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: Key) -> str:
+        return self.prefix + ":".join(str(part) for part in key)
+
+    async def get(self, key: Key) -> Optional[CachedResponse]:
+        data = await self.client.get(self._key(key))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse.unpack(data)
+
+    async def set(self, key: Key, entry: CachedResponse) -> None:
+        await self.client.set(self._key(key), entry.pack(), ex=self.ttl)
+
+    async def invalidate(self, scopes: Iterable[str]) -> None:
+        # Nothing to do: the version in the key has moved on
+        pass
+
+    async def clear(self) -> None:
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+async def _replay(chunks: List[bytes], rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
+
+class LibraryCache:
+    """
+    Read-through cache of serialized library responses (song and playlist
+    listings, single playlists), keyed by owner, library version and query.
+
+    Because the version is part of the key, a cached body can never outlive
+    the write that changed it; the write paths also invalidate the owner's
+    entries directly so memory goes to live data. Backend errors fall back
+    to the database.
+    """
+
+    def __init__(self, backend=None, max_entry: int = LIBRARY_CACHE_MAX_ENTRY):
+        self.backend = backend
+        self.max_entry = max_entry
+        self.too_large = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(scope: Optional[str], kind: str, version: Any, request: Optional[Request] = None) -> Key:
+        params = urlencode(sorted(request.query_params.multi_items())) if request is not None else ""
+        return (scope or ALL_OWNERS, kind, version, params)
+
+    async def respond(self, key: Key, build: Callable[[], Awaitable[Response]]) -> Response:
+        """The cached response for `key`, or `build()`'s, cached if it is small enough."""
+        if self.backend is None:
+            return await build()
+        try:
+            entry = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Library cache read failed: {e}")
+            entry = None
+        if entry is not None:
+            return Response(entry.body, media_type=entry.media_type, headers=entry.headers)
+
+        response = await build()
+        if response.status_code != 200:
+            return response
+        headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+        if isinstance(response, StreamingResponse):
+            chunks, size = [], 0
+            async for chunk in response.body_iterator:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.max_entry:
+                    # Too big to hold: pass the rest through as it streams
+                    self.too_large += 1
+                    return StreamingResponse(_replay(chunks, response.body_iterator), media_type=response.media_type, headers=headers)
+            body = b"".join(chunks)
+        else:
+            body = response.body
+            if len(body) > self.max_entry:
+                self.too_large += 1
+                return response
+
+        entry = CachedResponse(response.media_type, headers, body)
+        try:
+            await self.backend.set(key, entry)
+        except Exception as e:
+            self.errors += 1
+            print(f"Library cache write failed: {e}")
+        return Response(body, media_type=entry.media_type, headers=headers)
+
+    async def invalidate(self, owner_id: Optional[str], playlist_id: Optional[str] = None) -> None:
+        """Called on every library write: the owner's and the all-owners listings, and the playlist itself."""
+        if self.backend is None:
+            return
+        scopes = {owner_id or ALL_OWNERS, ALL_OWNERS}
+        if playlist_id:
+            scopes.add(f"playlist:{playlist_id}")
+        try:
+            await self.backend.invalidate(scopes)
+        except Exception as e:
+            self.errors += 1
+            print(f"Library cache invalidation failed: {e}")
+
+    async def clear(self) -> None:
+        if self.backend is not None:
+            await self.backend.clear()
+
+    def stats(self) -> dict:
+        if self.backend is None:
+            return {"backend": None}
+        return {
+            "backend": self.backend.name,
+            "max_entry_bytes": self.max_entry,
+            "too_large": self.too_large,
+            "errors": self.errors,
+            **self.backend.stats(),
+        }
+
+
+def _default_backend():
+    if LIBRARY_CACHE_URL:
+        return RedisBackend(LIBRARY_CACHE_URL)
+    if LIBRARY_CACHE_SIZE > 0:
+        return MemoryBackend()
+    return None
+
+
+library_cache = LibraryCache(_default_backend())
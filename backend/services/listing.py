@@ -0,0 +1,160 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+from uuid import UUID
+
+from beanie import Document, PydanticObjectId
+from beanie.odm.utils.pydantic import get_model_fields
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+# Keyset order for library listings; matches the ([owner_id,] created_at, _id) indexes
+SORT = [("created_at", 1), ("_id", 1)]
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Streamed responses are written in chunks of about this many bytes
+CHUNK_SIZE = 64 * 1024
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (ObjectId, UUID)):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(doc: Dict[str, Any]) -> bytes:
+    return json.dumps(doc, default=_json_default, separators=(",", ":")).encode()
+
+
+class ListingSchema:
+    """
+    Field names, order and plain defaults of a Document, so raw Motor documents
+    can be written out exactly like the model would serialize them, without
+    building and validating a model instance per row.
+    """
+
+    def __init__(self, model: Type[Document], object_ids: bool = False):
+        self.model = model
+        # Whether _id is an ObjectId (Beanie default) rather than our own string id
+        self.object_ids = object_ids
+        self.fields: List[Tuple[str, Any]] = []
+        for name, field in get_model_fields(model).items():
+            if name == "revision_id":
+                continue
+            default = field.default
+            if field.default_factory is not None or type(default).__name__ == "PydanticUndefinedType" or default is Ellipsis:
+                default = None
+            self.fields.append((field.alias or name, default))
+        self.names = {alias for alias, _ in self.fields}
+
+    def projection(self, fields: Optional[str]) -> Optional[Dict[str, int]]:
+        """Parse a `fields=a,b` query value; _id and created_at are always kept for the cursor."""
+        if not fields:
+            return None
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in self.names]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        return {name: 1 for name in set(requested) | {"_id", "created_at"}}
+
+    def serialize(self, doc: Dict[str, Any], projection: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        return {
+            alias: doc.get(alias, default)
+            for alias, default in self.fields
+            if projection is None or alias in projection
+        }
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    created_at = doc.get("created_at")
+    position = [created_at.isoformat() if created_at else None, str(doc["_id"])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str, object_ids: bool) -> Tuple[Optional[datetime], Any]:
+    try:
+        created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(created_at) if created_at else None
+        return created_at, PydanticObjectId(last_id) if object_ids else last_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(query: Dict[str, Any], cursor: Optional[str], object_ids: bool) -> Dict[str, Any]:
+    """Add the keyset condition for rows strictly after `cursor` to `query`."""
+    if not cursor:
+        return query
+    created_at, last_id = decode_cursor(cursor, object_ids)
+    later = {"created_at": {"$gt": created_at}} if created_at else {"created_at": {"$ne": None}}
+    return {**query, "$or": [{"created_at": created_at, "_id": {"$gt": last_id}}, later]}
+
+
+async def list_documents(
+    schema: ListingSchema,
+    query: Dict[str, Any],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = "json",
+    headers: Optional[Dict[str, str]] = None,
+) -> StreamingResponse:
+    """
+    Stream a listing straight from the Motor cursor.
+
+    `format=json` keeps the existing response shape (a JSON array) and, when
+    `limit` is given, reports the next page in `X-Next-Cursor` / `Link`;
+    `format=ndjson` writes one document per line. Either way only one batch
+    of documents is held in memory.
+    """
+    projection = schema.projection(fields)
+    query = after_cursor(query, cursor, schema.object_ids)
+
+    motor_cursor = schema.model.get_motor_collection().find(query, projection).sort(SORT)
+    headers = dict(headers or {})
+    page: Optional[List[Dict[str, Any]]] = None
+    if limit is not None:
+        # A page is small and bounded: fetch it (plus one row to detect a next
+        # page) up front so the cursor can go in the headers
+        page = await motor_cursor.limit(limit + 1).to_list(length=limit + 1)
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1])
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<?cursor={next_cursor}&limit={limit}>; rel="next"'
+
+    async def rows() -> AsyncIterator[Dict[str, Any]]:
+        if page is not None:
+            for doc in page:
+                yield schema.serialize(doc, projection)
+        else:
+            async for doc in motor_cursor:
+                yield schema.serialize(doc, projection)
+
+    ndjson = format == "ndjson"
+    media_type = NDJSON_MEDIA_TYPE if ndjson else "application/json"
+    return StreamingResponse(_encode(rows(), ndjson), media_type=media_type, headers=headers)
+
+
+async def _encode(rows: AsyncIterator[Dict[str, Any]], ndjson: bool) -> AsyncIterator[bytes]:
+    # Coalesce rows into ~64KB writes instead of one ASGI message per document
+    buffer = bytearray() if ndjson else bytearray(b"[")
+    first = True
+    async for row in rows:
+        if ndjson:
+            buffer += dumps(row) + b"\n"
+        else:
+            if not first:
+                buffer += b","
+            buffer += dumps(row)
+        first = False
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if not ndjson:
+        buffer += b"]"
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Set
+
+from models.song import Song
+
+# Ids per $in query; larger batches are split
+MAX_BATCH = 1000
+
+
+class SongLoader:
+    """
+    DataLoader-style Song lookups for one request.
+
+    Every `load`/`load_many` issued before the event loop gets to run again
+    is collected and fetched with a single `$in` query, and each id is
+    fetched at most once per loader, so code that resolves songs one at a
+    time (e.g. inside `asyncio.gather`) still costs one round trip. Failed
+    lookups are not memoized. Use a fresh loader per request: see
+    `song_loader`.
+    """
+
+    def __init__(self, max_batch: int = MAX_BATCH):
+        self.max_batch = max_batch
+        self._results: Dict[str, asyncio.Future] = {}
+        self._queue: List[str] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self.queries = 0
+
+    async def load(self, song_id: str) -> Optional[Song]:
+        future = self._results.get(song_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._results[song_id] = loop.create_future()
+            if not self._queue:
+                loop.call_soon(self._dispatch)
+            self._queue.append(song_id)
+        # A cancelled caller must not cancel the lookup others are waiting on
+        return await asyncio.shield(future)
+
+    async def load_many(self, song_ids: Iterable[str]) -> List[Optional[Song]]:
+        return list(await asyncio.gather(*(self.load(song_id) for song_id in song_ids)))
+
+    def prime(self, song: Song) -> None:
+        """Remember a song the request already has, e.g. one it just created."""
+        if song.id not in self._results:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(song)
+            self._results[song.id] = future
+
+    def _dispatch(self) -> None:
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), self.max_batch):
+            task = asyncio.create_task(self._fetch(queue[start:start + self.max_batch]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, song_ids: List[str]) -> None:
+        self.queries += 1
+        try:
+            songs = await Song.find({"_id": {"$in": song_ids}}).to_list()
+        except BaseException as e:
+            for song_id in song_ids:
+                future = self._results.pop(song_id)
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Don't warn about failures nobody waited for
+                    future.exception()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        by_id = {song.id: song for song in songs}
+        for song_id in song_ids:
+            future = self._results[song_id]
+            if not future.done():
+                future.set_result(by_id.get(song_id))
+
+
+def song_loader() -> SongLoader:
+    """
+    FastAPI dependency: `songs: SongLoader = Depends(song_loader)`. FastAPI
+    caches dependencies per request, so every user in one request shares it.
+    """
+    return SongLoader()
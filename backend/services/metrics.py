@@ -0,0 +1,407 @@
+import os
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Mount
+
+# Set to 0 to skip per-command MongoDB instrumentation (pymongo decodes every
+# reply for listeners, which costs a little on large cursors)
+MONGO_COMMAND_METRICS = os.getenv("MONGO_COMMAND_METRICS", "1") != "0"
+# How often the event-loop lag probe wakes up, in seconds; 0 disables it
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOWNLOAD_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Sequence[Tuple[str, Any]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, lock: threading.Lock, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bound plus +Inf; made cumulative only when scraped
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    """
+    One metric family: children per label values, created on first use.
+
+    Updates take a per-family lock because pymongo calls listeners from
+    Motor's worker threads; everything else updates from the event loop.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._child()
+        return child
+
+    def _child(self) -> Any:
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Sequence[Tuple[str, Any]], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, pairs, value in self.samples():
+            lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _child(self) -> _Value:
+        return _Value(self._lock)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self):
+        return [(self.name, list(zip(self.labelnames, values)), child.value) for values, child in list(self._children.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def reset(self) -> None:
+        for child in list(self._children.values()):
+            child.set(0.0)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self) -> _Buckets:
+        return _Buckets(self._lock, self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            pairs = list(zip(self.labelnames, values))
+            with self._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", pairs + [("le", _number(bound))], cumulative))
+            samples.append((f"{self.name}_sum", pairs, total))
+            samples.append((f"{self.name}_count", pairs, cumulative))
+        return samples
+
+
+class Registry:
+    """Metric families plus collectors that refresh gauges right before a scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, collect: Callable[[], None]) -> Callable[[], None]:
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency, to the last body byte", ("method", "route", "status")
+)
+http_requests_in_progress = registry.gauge(
+    "http_requests_in_progress", "HTTP requests being handled", ("method", "route")
+)
+mongo_command_duration = registry.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command round trips", ("command", "collection")
+)
+mongo_command_documents = registry.counter(
+    "mongodb_command_documents_total", "Documents returned, inserted, updated or deleted", ("command", "collection")
+)
+mongo_command_failures = registry.counter(
+    "mongodb_command_failures_total", "MongoDB commands that returned an error", ("command", "collection")
+)
+ytdlp_download_duration = registry.histogram(
+    "ytdlp_download_duration_seconds", "yt-dlp download attempts", ("outcome",), DOWNLOAD_BUCKETS
+)
+ytdlp_download_bytes = registry.counter(
+    "ytdlp_download_bytes_total", "Bytes stored by successful yt-dlp downloads"
+)
+ytdlp_download_retries = registry.counter(
+    "ytdlp_download_retries_total", "yt-dlp attempts after the first (client rotations)"
+)
+event_loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer", buckets=LAG_BUCKETS
+)
+event_loop_lag_last = registry.gauge(
+    "event_loop_lag_last_seconds", "Event loop lag at the latest probe"
+)
+startup_phase = registry.gauge(
+    "startup_phase_seconds", "Time spent in each cold-start phase", ("phase",)
+)
+
+
+def route_name(scope: dict) -> str:
+    """
+    The matched route's path template, so ids don't each get their own series.
+    Newer FastAPI versions leave the router prefix off the route's path, so
+    the prefix is whatever of the request path precedes the route's own part
+    (its template filled in with this request's parameters).
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    if isinstance(route, Mount):
+        return route.path + "/{path}"
+    template = getattr(route, "path_format", None)
+    if template is None:
+        return scope["path"]
+    convertors = getattr(route, "param_convertors", {})
+    try:
+        own_path = template.format(**{
+            name: convertors[name].to_string(value) if name in convertors else str(value)
+            for name, value in (scope.get("path_params") or {}).items()
+        })
+    except (KeyError, ValueError, AssertionError):
+        return template
+    path = scope["path"]
+    if not path.endswith(own_path):
+        return template
+    return path[:len(path) - len(own_path)] + template
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request by method, route and status.
+
+    Starlette stores the matched route in the scope while routing, so the
+    route is read once the response is done. In-flight requests are counted
+    per route at scrape time from the live scopes, which keeps the hot path
+    to two dict operations.
+    """
+
+    active: Dict[int, dict] = {}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        key = id(scope)
+        self.active[key] = scope
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            del self.active[key]
+            http_request_duration.labels(scope["method"], route_name(scope), str(status)).observe(time.perf_counter() - started)
+
+
+@registry.collector
+def _count_in_progress() -> None:
+    http_requests_in_progress.reset()
+    for scope in list(MetricsMiddleware.active.values()):
+        http_requests_in_progress.labels(scope["method"], route_name(scope)).inc()
+
+
+def _documents(command: str, reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if command in ("insert", "update", "delete"):
+        return reply.get("n", 0)
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Times MongoDB commands per collection and counts the documents they
+    return or write. Registered on the Motor client in db.init_db.
+
+    Called from Motor's worker threads; only successful and failed events
+    carry the duration, and only started events carry the collection, so
+    the collection is remembered per request id in between.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        name = event.command_name
+        target = event.command.get("collection") if name == "getMore" else event.command.get(name)
+        self._pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        documents = _documents(event.command_name, event.reply)
+        if documents:
+            mongo_command_documents.labels(event.command_name, collection).inc(documents)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        mongo_command_failures.labels(event.command_name, collection).inc()
+
+
+class LoopLagMonitor:
+    """
+    Sleeps `interval` at a time and records how late it woke up; a handler
+    that blocks the loop shows up as lag roughly as long as it blocked.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            event_loop_lag.observe(lag)
+            event_loop_lag_last.set(lag)
+
+
+class StartupProfile:
+    """Cold-start phase timings, printed once and exported as startup_phase_seconds."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """End `phase` now; it covers the time since the previous mark."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        startup_phase.labels(phase).set(now - self._last)
+        self._last = now
+
+    def report(self) -> None:
+        total = self._last - self.started
+        startup_phase.labels("total").set(total)
+        print(f"Startup took {total * 1000:.0f}ms: " + ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases))
+
+
+command_metrics = CommandMetrics()
+loop_lag = LoopLagMonitor()
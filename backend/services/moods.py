@@ -0,0 +1,40 @@
+from typing import Any, Dict, List, Optional
+
+from models.song import Song, MOODS
+
+
+def parse_moods(value: Optional[str]) -> List[str]:
+    """`moods=Happy,Chill` as a list, without blanks or repeats."""
+    if not value:
+        return []
+    return list(dict.fromkeys(m.strip() for m in value.split(",") if m.strip()))
+
+
+def mood_query(owner_id: Optional[str], moods: List[str], match: str = "any") -> Dict[str, Any]:
+    """Songs with any (or all) of `moods`; served by the (owner_id, moods, ...) index."""
+    query: Dict[str, Any] = {"owner_id": owner_id} if owner_id else {}
+    if moods:
+        query["moods"] = {"$all": moods} if match == "all" else {"$in": moods}
+    return query
+
+
+def build_mood_counts_pipeline(owner_id: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Songs per mood in one aggregation. Only songs tagged with one of the
+    known moods are read, straight from the index; each song counts once
+    per mood even if it lists the mood twice.
+    """
+    return [
+        {"$match": mood_query(owner_id, list(MOODS))},
+        {"$project": {"_id": 0, "moods": {"$setUnion": ["$moods", []]}}},
+        {"$unwind": "$moods"},
+        {"$match": {"moods": {"$in": list(MOODS)}}},
+        {"$group": {"_id": "$moods", "songs": {"$sum": 1}}},
+    ]
+
+
+async def mood_counts(owner_id: Optional[str]) -> Dict[str, int]:
+    counts = dict.fromkeys(MOODS, 0)
+    async for row in Song.get_motor_collection().aggregate(build_mood_counts_pipeline(owner_id)):
+        counts[row["_id"]] = row["songs"]
+    return counts
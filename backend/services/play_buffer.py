@@ -0,0 +1,171 @@
+import os
+import sys
+import asyncio
+from typing import List, Optional
+
+from models.history import ListeningHistory
+from services.rollups import apply_rollups
+
+PLAY_BUFFER_BATCH = int(os.getenv("PLAY_BUFFER_BATCH", "500"))
+PLAY_BUFFER_INTERVAL = float(os.getenv("PLAY_BUFFER_INTERVAL", "1.0"))
+PLAY_BUFFER_MAX_PENDING = int(os.getenv("PLAY_BUFFER_MAX_PENDING", "10000"))
+# What to do when the buffer is full: "block" waits for a flush, "drop" discards the event
+PLAY_BUFFER_POLICY = os.getenv("PLAY_BUFFER_POLICY", "block")
+# How long "block" waits for room (e.g. while MongoDB is down) before giving up
+PLAY_BUFFER_BLOCK_TIMEOUT = float(os.getenv("PLAY_BUFFER_BLOCK_TIMEOUT", "5"))
+
+
+class PlayBufferFull(Exception):
+    """The buffer stayed full for the whole block timeout; none of the events were queued."""
+
+
+class PlayEventBuffer:
+    """
+    In-process write buffer for play events.
+
+    Events accumulate in memory and are written with one insert_many per
+    batch, either when `max_batch` events are waiting or every
+    `flush_interval` seconds. At most `max_pending` events are held; beyond
+    that the configured policy applies backpressure (block, for at most
+    `block_timeout` seconds, then PlayBufferFull) or sheds load (drop).
+    Call `close()` on shutdown to flush whatever is left.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = PLAY_BUFFER_BATCH,
+        flush_interval: float = PLAY_BUFFER_INTERVAL,
+        max_pending: int = PLAY_BUFFER_MAX_PENDING,
+        policy: str = PLAY_BUFFER_POLICY,
+        block_timeout: float = PLAY_BUFFER_BLOCK_TIMEOUT,
+    ):
+        if policy not in ("block", "drop"):
+            raise ValueError(f"Unknown play buffer policy: {policy}")
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, max_batch)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._pending: List[ListeningHistory] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    async def add(self, *events: ListeningHistory) -> int:
+        """
+        Queue events for writing. Returns how many were accepted; under the
+        block policy raises PlayBufferFull, with nothing queued, if there is
+        still no room for them after `block_timeout`.
+        """
+        self._ensure_started()
+        if self.policy == "block":
+            await self._wait_for_room(min(len(events), self.max_pending))
+        accepted = 0
+        for event in events:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                continue
+            self._pending.append(event)
+            accepted += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return accepted
+
+    async def _wait_for_room(self, needed: int) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.block_timeout
+        while len(self._pending) + needed > self.max_pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.dropped += needed
+                raise PlayBufferFull()
+            self._wakeup.set()
+            self._space.clear()
+            waiter = asyncio.ensure_future(self._space.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=remaining)
+            finally:
+                waiter.cancel()
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                try:
+                    result = await ListeningHistory.insert_many(batch)
+                    # The models don't get their ids back; the recommender needs them
+                    for event, event_id in zip(batch, result.inserted_ids):
+                        event.id = event_id
+                    self.flushed += len(batch)
+                    # Only now is there room: a failed batch goes back in
+                    if self._space is not None:
+                        self._space.set()
+                except asyncio.CancelledError:
+                    # Shutdown interrupted the write; close() retries it
+                    self._pending[:0] = batch
+                    raise
+                except Exception as e:
+                    self.failed_flushes += 1
+                    print(f"Play buffer flush of {len(batch)} events failed: {e}")
+                    # Put the batch back in front for the next tick, within the memory bound
+                    room = max(self.max_pending - len(self._pending), 0)
+                    self._pending[:0] = batch[:room]
+                    self.dropped += len(batch) - min(room, len(batch))
+                    break
+
+                # Raw events are safely stored; a failed rollup is repaired by rebuild_rollups
+                try:
+                    await apply_rollups(batch)
+                except Exception as e:
+                    print(f"Play buffer rollup of {len(batch)} events failed: {e}")
+                # Not imported here: numpy/scipy load on a worker thread at startup.
+                # Plays stored before then are read from history by the first build
+                recommendations = sys.modules.get("services.recommendations")
+                recommender = getattr(recommendations, "recommender", None)
+                if recommender is not None:
+                    recommender.observe(batch)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._pending:
+            print(f"Play buffer closed with {len(self._pending)} unwritten events")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    def _ensure_started(self) -> None:
+        # Started lazily so the flusher binds to the running server loop
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            # asyncio.wait (unlike wait_for on 3.10/3.11) never swallows our cancellation
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.flush_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            await self.flush()
+
+
+play_buffer = PlayEventBuffer()
@@ -0,0 +1,191 @@
+from typing import Any, Dict, List, Optional
+
+from beanie import PydanticObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from models.playlist import Playlist, PlaylistDelta, PlaylistOperation, SongRef
+from services.loaders import SongLoader
+
+# Upper bound on operations accepted in one bulk edit
+MAX_OPERATIONS = 500
+# $slice count meaning "to the end of the array" (it must be positive)
+REST = 2 ** 31 - 1
+
+
+def object_id(playlist_id: str) -> PydanticObjectId:
+    try:
+        return PydanticObjectId(playlist_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+
+async def complete_refs(refs: List[SongRef], owner_id: Optional[str], songs: SongLoader) -> None:
+    """
+    Fill the fields a client left out of the songs it adds (artist, duration,
+    title) from the songs collection, with one query for all of them. Songs
+    owned by someone other than `owner_id` are left as sent.
+    """
+    for ref, song in zip(refs, await songs.load_many([ref.id for ref in refs])):
+        if song is None or (song.owner_id and song.owner_id != owner_id):
+            continue
+        if ref.artist is None:
+            ref.artist = song.artist
+        if ref.duration is None:
+            ref.duration = song.duration
+        if ref.title is None:
+            # Same fallback as the frontend and the maintenance backfill
+            ref.title = song.filename
+
+
+def _editable(playlist_id: PydanticObjectId, owner_id: Optional[str]) -> Dict[str, Any]:
+    # Same rule as the endpoints: playlists without an owner are editable by anyone
+    return {"_id": playlist_id, "$or": [{"owner_id": None}, {"owner_id": ""}, {"owner_id": owner_id}]}
+
+
+async def _current(playlist_id: PydanticObjectId, owner_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Called when a conditional update matched nothing: raise 404/403 if that is
+    why, otherwise return the playlist's version so the caller can decide.
+    """
+    doc = await Playlist.get_motor_collection().find_one({"_id": playlist_id}, {"owner_id": 1, "version": 1})
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    if doc.get("owner_id") and doc["owner_id"] != owner_id:
+        raise HTTPException(status_code=403, detail="Not authorized to modify this playlist")
+    return doc
+
+
+async def add_song(playlist_id: str, owner_id: Optional[str], song: SongRef, position: Optional[int] = None) -> PlaylistDelta:
+    """Insert `song` at `position` (default: the end) unless the playlist already has it."""
+    oid = object_id(playlist_id)
+    push: Dict[str, Any] = {"$each": [song.model_dump()]}
+    if position is not None:
+        push["$position"] = position
+    doc = await Playlist.get_motor_collection().find_one_and_update(
+        {**_editable(oid, owner_id), "songs.id": {"$ne": song.id}},
+        {"$push": {"songs": push}, "$inc": {"version": 1}},
+        projection={"version": 1, "owner_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        # Already in the playlist: nothing to do
+        current = await _current(oid, owner_id)
+        return PlaylistDelta(id=playlist_id, version=current.get("version", 0)).owned_by(current.get("owner_id"))
+    operation = PlaylistOperation(op="add", song=song, position=position)
+    return PlaylistDelta(id=playlist_id, version=doc["version"], operations=[operation]).owned_by(doc.get("owner_id"))
+
+
+async def remove_song(playlist_id: str, owner_id: Optional[str], song_id: str) -> PlaylistDelta:
+    oid = object_id(playlist_id)
+    doc = await Playlist.get_motor_collection().find_one_and_update(
+        {**_editable(oid, owner_id), "songs.id": song_id},
+        {"$pull": {"songs": {"id": song_id}}, "$inc": {"version": 1}},
+        projection={"version": 1, "owner_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        await _current(oid, owner_id)
+        raise HTTPException(status_code=404, detail="Song not found in playlist")
+    return PlaylistDelta(
+        id=playlist_id, version=doc["version"], operations=[PlaylistOperation(op="remove", song_id=song_id)]
+    ).owned_by(doc.get("owner_id"))
+
+
+def _insert_at(array: Any, items: Any, position: Optional[int]) -> Dict[str, Any]:
+    if position is None:
+        return {"$concatArrays": [array, items]}
+    if position == 0:
+        return {"$concatArrays": [items, array]}
+    return {"$concatArrays": [{"$slice": [array, position]}, items, {"$slice": [array, position, REST]}]}
+
+
+def _without(array: Any, song_id: str) -> Dict[str, Any]:
+    return {"$filter": {"input": array, "cond": {"$ne": ["$$this.id", {"$literal": song_id}]}}}
+
+
+def build_edit_pipeline(operations: List[PlaylistOperation]) -> List[Dict[str, Any]]:
+    """
+    Express a list of operations as one pipeline update, so the whole edit is
+    applied atomically on the server, in order, without sending the song list
+    either way. Adding a song that is present and removing or moving one that
+    is absent are no-ops, matching the single-song endpoints.
+    """
+    pipeline: List[Dict[str, Any]] = [{"$set": {"songs": {"$ifNull": ["$songs", []]}}}]
+    for operation in operations:
+        if operation.op == "add":
+            songs = {"$cond": [
+                {"$in": [{"$literal": operation.song_id}, "$songs.id"]},
+                "$songs",
+                _insert_at("$songs", {"$literal": [operation.song.model_dump()]}, operation.position),
+            ]}
+        elif operation.op == "remove":
+            songs = _without("$songs", operation.song_id)
+        else:
+            songs = {"$let": {
+                "vars": {
+                    "moved": {"$filter": {"input": "$songs", "cond": {"$eq": ["$$this.id", {"$literal": operation.song_id}]}}},
+                    "rest": _without("$songs", operation.song_id),
+                },
+                "in": _insert_at("$$rest", "$$moved", operation.position),
+            }}
+        pipeline.append({"$set": {"songs": songs}})
+    pipeline.append({"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}})
+    return pipeline
+
+
+async def edit_songs(
+    playlist_id: str,
+    owner_id: Optional[str],
+    operations: List[PlaylistOperation],
+    expected_version: Optional[int] = None,
+) -> PlaylistDelta:
+    """
+    Apply several add/remove/move operations in one atomic update.
+
+    With `expected_version` the edit only applies if nobody else changed the
+    playlist since the client read it, otherwise it fails with 409.
+    """
+    if len(operations) > MAX_OPERATIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_OPERATIONS} operations per edit")
+    oid = object_id(playlist_id)
+    if not operations:
+        current = await _current(oid, owner_id)
+        return PlaylistDelta(id=playlist_id, version=current.get("version", 0)).owned_by(current.get("owner_id"))
+
+    query = _editable(oid, owner_id)
+    if expected_version is not None:
+        # Documents from before versioning count as version 0
+        query["version"] = expected_version if expected_version else {"$in": [0, None]}
+    doc = await Playlist.get_motor_collection().find_one_and_update(
+        query,
+        build_edit_pipeline(operations),
+        projection={"version": 1, "owner_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        current = await _current(oid, owner_id)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Playlist changed: expected version {expected_version}, found {current.get('version', 0)}",
+        )
+    return PlaylistDelta(id=playlist_id, version=doc["version"], operations=operations).owned_by(doc.get("owner_id"))
+
+
+async def update_details(playlist_id: str, owner_id: Optional[str], changes: Dict[str, Any]) -> Playlist:
+    """Set name/description without rewriting (and racing edits to) the song list."""
+    oid = object_id(playlist_id)
+    collection = Playlist.get_motor_collection()
+    if changes:
+        doc = await collection.find_one_and_update(
+            _editable(oid, owner_id),
+            {"$set": changes, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+    else:
+        doc = await collection.find_one(_editable(oid, owner_id))
+    if doc is None:
+        await _current(oid, owner_id)
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    return Playlist.model_validate(doc)
@@ -0,0 +1,370 @@
+import os
+import time
+import asyncio
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+from scipy import sparse
+
+from models.history import ListeningHistory
+
+# Neighbours kept per song in the in-memory index
+RECOMMEND_NEIGHBOURS = int(os.getenv("RECOMMEND_NEIGHBOURS", "50"))
+# Plays further apart than this (seconds) belong to different sessions
+SESSION_GAP = int(os.getenv("RECOMMEND_SESSION_GAP", "1800"))
+# A play co-occurs with the next this many plays of its session, weighted 1/distance
+CO_PLAY_WINDOW = int(os.getenv("RECOMMEND_CO_PLAY_WINDOW", "5"))
+# How often (seconds) streamed plays are folded into the index
+RECOMMEND_REFRESH_INTERVAL = float(os.getenv("RECOMMEND_REFRESH_INTERVAL", "30"))
+# How often (seconds) the index is rebuilt from history; 0 only builds at startup
+RECOMMEND_REBUILD_INTERVAL = float(os.getenv("RECOMMEND_REBUILD_INTERVAL", "86400"))
+HISTORY_BATCH = 10000
+# A rebuild reads plays stored at least this long (seconds) before it started;
+# later ones reach the index through observe(), which runs shortly after the insert
+REBUILD_SCAN_MARGIN = 10
+# Streamed co-plays are kept in a separate delta matrix and merged into the
+# built one once they reach this fraction of its entries
+DELTA_MERGE_RATIO = float(os.getenv("RECOMMEND_DELTA_MERGE_RATIO", "0.1"))
+
+
+class Index(NamedTuple):
+    co_plays: sparse.csr_matrix
+    plays: np.ndarray
+    neighbours: np.ndarray
+    scores: np.ndarray
+    # Streamed co-plays not merged into `co_plays` yet; the counts are the sum
+    delta: Optional[sparse.csr_matrix] = None
+
+    @property
+    def co_play_entries(self) -> int:
+        return self.co_plays.nnz + (self.delta.nnz if self.delta is not None else 0)
+
+
+def co_play_pairs(
+    owners: np.ndarray,
+    songs: np.ndarray,
+    timestamps: np.ndarray,
+    window: int = CO_PLAY_WINDOW,
+    gap: float = SESSION_GAP,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Every pair of different songs played at most `window` plays apart in the
+    same session, in both directions, with weight 1/distance. The arrays must
+    be sorted by owner, then timestamp.
+    """
+    if songs.size == 0:
+        empty = np.zeros(0, np.int32)
+        return empty, empty, np.zeros(0, np.float32)
+    new_session = np.ones(songs.size, dtype=bool)
+    new_session[1:] = (owners[1:] != owners[:-1]) | (np.diff(timestamps) > gap)
+    session = np.cumsum(new_session)
+
+    rows, cols, weights = [], [], []
+    for distance in range(1, window + 1):
+        keep = (session[:-distance] == session[distance:]) & (songs[:-distance] != songs[distance:])
+        rows.append(songs[:-distance][keep])
+        cols.append(songs[distance:][keep])
+        weights.append(np.full(int(keep.sum()), 1.0 / distance, dtype=np.float32))
+    rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    return np.concatenate([rows, cols]), np.concatenate([cols, rows]), np.concatenate([weights, weights])
+
+
+def top_k(
+    co_plays: sparse.csr_matrix,
+    plays: np.ndarray,
+    k: int,
+    rows: Optional[np.ndarray] = None,
+    delta: Optional[sparse.csr_matrix] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The `k` most similar songs for each row (all, or just `rows`), by cosine
+    similarity of co-play counts (`co_plays` plus `delta`) normalised by play
+    counts. Rows with fewer neighbours are padded with -1.
+    """
+    norms = 1.0 / np.sqrt(np.maximum(plays, 1.0))
+    subset = co_plays if rows is None else co_plays[rows]
+    if delta is not None:
+        subset = subset + (delta if rows is None else delta[rows])
+    row_norms = norms if rows is None else norms[rows]
+    similarity = (sparse.diags(row_norms) @ subset @ sparse.diags(norms)).tocsr()
+
+    m = similarity.shape[0]
+    lengths = np.diff(similarity.indptr)
+    row_of = np.repeat(np.arange(m), lengths)
+    # Grouped by row, best first within a row
+    order = np.lexsort((-similarity.data, row_of))
+    rank = np.arange(order.size) - np.repeat(similarity.indptr[:-1], lengths)
+    keep = rank < k
+
+    neighbours = np.full((m, k), -1, dtype=np.int32)
+    scores = np.zeros((m, k), dtype=np.float32)
+    neighbours[row_of[keep], rank[keep]] = similarity.indices[order][keep]
+    scores[row_of[keep], rank[keep]] = similarity.data[order][keep]
+    return neighbours, scores
+
+
+def build_index(
+    owners: np.ndarray,
+    songs: np.ndarray,
+    timestamps: np.ndarray,
+    n_songs: int,
+    k: int = RECOMMEND_NEIGHBOURS,
+    window: int = CO_PLAY_WINDOW,
+    gap: float = SESSION_GAP,
+) -> Index:
+    """Offline build from integer-coded play events, in any order."""
+    order = np.lexsort((timestamps, owners))
+    rows, cols, weights = co_play_pairs(owners[order], songs[order], timestamps[order], window, gap)
+    co_plays = sparse.csr_matrix((weights, (rows, cols)), shape=(n_songs, n_songs), dtype=np.float32)
+    plays = np.bincount(songs, minlength=n_songs).astype(np.float64)
+    neighbours, scores = top_k(co_plays, plays, k)
+    return Index(co_plays, plays, neighbours, scores)
+
+
+def _grow(matrix: sparse.csr_matrix, n: int) -> sparse.csr_matrix:
+    """`matrix` as n x n, sharing its data; the added rows and columns are empty."""
+    if matrix.shape == (n, n):
+        return matrix
+    indptr = np.concatenate([matrix.indptr, np.full(n - matrix.shape[0], matrix.indptr[-1], dtype=matrix.indptr.dtype)])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(n, n), copy=False)
+
+
+def _fold(
+    index: Index,
+    n_songs: int,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    weights: np.ndarray,
+    plays: np.ndarray,
+    k: int,
+    merge_ratio: float = DELTA_MERGE_RATIO,
+) -> Index:
+    """
+    Add streamed co-plays to `index` and recompute the rows they touched.
+    They go into the small delta matrix, so the built matrix is only copied
+    when the delta is big enough to be merged into it.
+    """
+    co_plays = _grow(index.co_plays, n_songs)
+    delta = sparse.csr_matrix(
+        (np.concatenate([weights, weights]), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+        shape=(n_songs, n_songs), dtype=np.float32,
+    )
+    if index.delta is not None:
+        delta = delta + _grow(index.delta, n_songs)
+    if delta.nnz > merge_ratio * co_plays.nnz:
+        co_plays, delta = (co_plays + delta).tocsr(), None
+    total_plays = np.zeros(n_songs)
+    total_plays[:index.plays.size] = index.plays
+    total_plays += plays
+
+    touched = np.unique(np.concatenate([rows, cols]))
+    neighbours = np.full((n_songs, k), -1, dtype=np.int32)
+    scores = np.zeros((n_songs, k), dtype=np.float32)
+    neighbours[:index.neighbours.shape[0]] = index.neighbours
+    scores[:index.scores.shape[0]] = index.scores
+    if touched.size:
+        neighbours[touched], scores[touched] = top_k(co_plays, total_plays, k, touched, delta)
+    return Index(co_plays, total_plays, neighbours, scores, delta)
+
+
+class Recommender:
+    """
+    Item-item recommendations from co-plays.
+
+    Plays by one owner with less than `gap` seconds between them form a
+    session; songs played close together in a session co-occur. The sparse
+    co-occurrence matrix is built from the retained listening history at
+    startup (and every `rebuild_interval` seconds), and plays are folded in
+    as they are flushed from the play buffer, recomputing only the songs they
+    touched. Requests read a precomputed top-k neighbour table.
+    """
+
+    def __init__(
+        self,
+        k: int = RECOMMEND_NEIGHBOURS,
+        window: int = CO_PLAY_WINDOW,
+        gap: float = SESSION_GAP,
+        refresh_interval: float = RECOMMEND_REFRESH_INTERVAL,
+        rebuild_interval: float = RECOMMEND_REBUILD_INTERVAL,
+    ):
+        self.k = k
+        self.window = window
+        self.gap = gap
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.index = Index(
+            sparse.csr_matrix((0, 0), dtype=np.float32),
+            np.zeros(0),
+            np.full((0, k), -1, dtype=np.int32),
+            np.zeros((0, k), dtype=np.float32),
+        )
+        # Last few plays per owner, to pair with the next streamed play
+        self._recent: Dict[Optional[str], Deque[Tuple[str, float]]] = {}
+        # Streamed plays not folded in yet: (stored _id, song, [(earlier song, weight)])
+        self._pending: List[Tuple[Optional[ObjectId], str, List[Tuple[str, float]]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.events = 0
+        self.built_at: Optional[datetime] = None
+        self.rebuild_seconds: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def observe(self, events: Iterable[ListeningHistory]) -> None:
+        """Queue co-plays from freshly stored play events; cheap, runs on the loop."""
+        for event in events:
+            played_at = event.timestamp.timestamp()
+            recent = self._recent.get(event.owner_id)
+            if recent is None:
+                recent = self._recent[event.owner_id] = deque(maxlen=self.window)
+            elif recent and abs(played_at - recent[-1][1]) > self.gap:
+                recent.clear()
+            earlier = [
+                (song_id, 1.0 / distance)
+                for distance, (song_id, _) in enumerate(reversed(recent), 1)
+                if song_id != event.song_id
+            ]
+            self._pending.append((event.id, event.song_id, earlier))
+            recent.append((event.song_id, played_at))
+            self.events += 1
+
+    def _position(self, song_id: str) -> int:
+        position = self.positions.get(song_id)
+        if position is None:
+            position = self.positions[song_id] = len(self.ids)
+            self.ids.append(song_id)
+        return position
+
+    async def refresh(self) -> None:
+        """Fold queued co-plays into the matrix and index."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        pairs: Counter = Counter()
+        plays: Counter = Counter()
+        for _, song_id, earlier in pending:
+            plays[song_id] += 1
+            for other, weight in earlier:
+                pairs[(other, song_id)] += weight
+
+        rows = np.array([self._position(a) for a, _ in pairs], dtype=np.int32)
+        cols = np.array([self._position(b) for _, b in pairs], dtype=np.int32)
+        weights = np.fromiter(pairs.values(), dtype=np.float32, count=len(pairs))
+        play_counts = np.zeros(len(self.ids))
+        for song_id, count in plays.items():
+            play_counts[self._position(song_id)] = count
+
+        self.index = await asyncio.to_thread(_fold, self.index, len(self.ids), rows, cols, weights, play_counts, self.k)
+
+        # Forget sessions that have ended
+        cutoff = time.time() - self.gap
+        for owner_id in [o for o, recent in self._recent.items() if not recent or recent[-1][1] < cutoff]:
+            del self._recent[owner_id]
+
+    async def rebuild(self) -> None:
+        """Build the matrix and index from scratch from the stored history."""
+        started = time.perf_counter()
+        built_at = datetime.now()
+        # Bounded by insertion (_id) rather than play time: offline plays
+        # synced late carry old timestamps but are only counted via _pending
+        bound = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=REBUILD_SCAN_MARGIN))
+        ids: List[str] = []
+        positions: Dict[str, int] = {}
+        owner_codes: Dict[Optional[str], int] = {}
+        owners, songs, timestamps = [], [], []
+
+        cursor = ListeningHistory.get_motor_collection().find(
+            {"_id": {"$lt": bound}}, {"_id": 0, "owner_id": 1, "song_id": 1, "timestamp": 1}
+        ).batch_size(HISTORY_BATCH)
+        async for event in cursor:
+            song_id = event["song_id"]
+            position = positions.get(song_id)
+            if position is None:
+                position = positions[song_id] = len(ids)
+                ids.append(song_id)
+            songs.append(position)
+            owners.append(owner_codes.setdefault(event.get("owner_id"), len(owner_codes)))
+            timestamps.append(event["timestamp"].timestamp())
+
+        index = await asyncio.to_thread(
+            build_index,
+            np.array(owners, dtype=np.int32), np.array(songs, dtype=np.int32), np.array(timestamps),
+            len(ids), self.k, self.window, self.gap,
+        )
+        # Queued plays stored before the bound were also read from history, so
+        # drop them to count them once; the rest are folded in by refresh()
+        self._pending = [play for play in self._pending if play[0] is None or play[0] >= bound]
+        self.ids, self.positions, self.index = ids, positions, index
+        self.built_at = built_at
+        self.rebuild_seconds = time.perf_counter() - started
+        print(f"Recommendations: built from {len(songs)} plays of {len(ids)} songs in {self.rebuild_seconds:.1f}s")
+
+    async def _run(self) -> None:
+        try:
+            await self.rebuild()
+        except Exception as e:
+            print(f"Recommendations: build failed: {e}")
+        last_rebuild = time.monotonic()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if self.rebuild_interval and time.monotonic() - last_rebuild >= self.rebuild_interval:
+                    last_rebuild = time.monotonic()
+                    await self.rebuild()
+                await self.refresh()
+            except Exception as e:
+                print(f"Recommendations: refresh failed: {e}")
+
+    def similar(self, song_id: str, limit: int) -> List[Tuple[str, float]]:
+        """Songs most often played around `song_id`, best first."""
+        return self.recommend([song_id], limit)
+
+    def recommend(self, seeds: List[str], limit: int, weights: Optional[List[float]] = None, exclude: Set[str] = frozenset()) -> List[Tuple[str, float]]:
+        """Neighbours of all `seeds`, scores summed (times each seed's weight)."""
+        index = self.index
+        known = [(self.positions[s], w) for s, w in zip(seeds, weights or [1.0] * len(seeds))
+                 if self.positions.get(s, index.neighbours.shape[0]) < index.neighbours.shape[0]]
+        if not known:
+            return []
+        rows = np.array([position for position, _ in known])
+        neighbours = index.neighbours[rows]
+        scores = index.scores[rows] * np.array([w for _, w in known], dtype=np.float32)[:, None]
+        valid = neighbours >= 0
+        candidates, inverse = np.unique(neighbours[valid], return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[valid])
+
+        results = []
+        for position in np.argsort(-totals, kind="stable"):
+            song_id = self.ids[candidates[position]]
+            if song_id in exclude:
+                continue
+            results.append((song_id, float(totals[position])))
+            if len(results) >= limit:
+                break
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "songs": len(self.ids),
+            "co_play_entries": int(self.index.co_play_entries),
+            "delta_entries": int(self.index.delta.nnz) if self.index.delta is not None else 0,
+            "events_streamed": self.events,
+            "pending_plays": len(self._pending),
+            "built_at": self.built_at,
+            "rebuild_seconds": self.rebuild_seconds,
+        }
+
+
+recommender = Recommender()
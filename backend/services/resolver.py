@@ -0,0 +1,273 @@
+import os
+import time
+import socket
+import ipaddress
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from services.cache import TTLCache, MISSING
+from services.metrics import registry
+
+# Asked in order when the system resolver fails, comma-separated
+DNS_FALLBACK_NAMESERVERS = [ns.strip() for ns in os.getenv("DNS_FALLBACK_NAMESERVERS", "8.8.8.8").split(",") if ns.strip()]
+DNS_FALLBACK_TIMEOUT = float(os.getenv("DNS_FALLBACK_TIMEOUT", "3"))
+DNS_CACHE_SIZE = int(os.getenv("DNS_CACHE_SIZE", "1024"))
+# getaddrinfo doesn't report TTLs, so system answers are kept this long
+DNS_SYSTEM_TTL = float(os.getenv("DNS_SYSTEM_TTL", "60"))
+# Record TTLs from the fallback nameservers are clamped to this range
+DNS_MIN_TTL = float(os.getenv("DNS_MIN_TTL", "5"))
+DNS_MAX_TTL = float(os.getenv("DNS_MAX_TTL", "3600"))
+# Failed lookups are remembered this long before being retried
+DNS_NEGATIVE_TTL = float(os.getenv("DNS_NEGATIVE_TTL", "10"))
+
+# Resolved by the system only and never cached
+LOCAL_HOSTS = {"localhost", "0.0.0.0"}
+
+# The real resolver, captured before install() replaces socket.getaddrinfo
+_system_getaddrinfo = socket.getaddrinfo
+
+dns_lookups = registry.counter(
+    "dns_lookups_total", "Hostname lookups by cache outcome", ("result",)
+)
+dns_resolutions = registry.counter(
+    "dns_resolutions_total", "Lookups that reached a resolver", ("source", "outcome")
+)
+dns_resolution_duration = registry.histogram(
+    "dns_resolution_duration_seconds", "Time spent in each resolver", ("source",)
+)
+dns_cache_entries = registry.gauge(
+    "dns_cache_entries", "Cached hostnames, including failures"
+)
+
+
+class Answer(NamedTuple):
+    addresses: List[str]
+    ttl: float
+
+
+class SystemLookup:
+    """IPv4 addresses from the OS resolver (hosts file, resolv.conf, container DNS)."""
+
+    name = "system"
+
+    def __init__(self, ttl: float = DNS_SYSTEM_TTL, getaddrinfo: Callable = _system_getaddrinfo):
+        self.ttl = ttl
+        self._getaddrinfo = getaddrinfo
+
+    def __call__(self, host: str) -> Answer:
+        infos = self._getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
+        return Answer(list(dict.fromkeys(info[4][0] for info in infos)), self.ttl)
+
+
+class NameserverLookup:
+    """A records straight from the given nameservers via dnspython, with their TTLs."""
+
+    name = "fallback"
+
+    def __init__(self, nameservers: Sequence[str], timeout: float = DNS_FALLBACK_TIMEOUT):
+        self.nameservers = list(nameservers)
+        self.timeout = timeout
+        self._resolver = None
+
+    def __call__(self, host: str) -> Answer:
+        import dns.exception
+        import dns.resolver
+
+        if self._resolver is None:
+            # Built once and reused; configure=False skips reading resolv.conf
+            resolver = dns.resolver.Resolver(configure=False)
+            resolver.nameservers = self.nameservers
+            resolver.lifetime = self.timeout
+            self._resolver = resolver
+        try:
+            answer = self._resolver.resolve(host, "A", search=False)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        except dns.exception.DNSException as e:
+            raise socket.gaierror(socket.EAI_AGAIN, f"Temporary failure in name resolution: {e}")
+        return Answer([record.address for record in answer], answer.rrset.ttl)
+
+
+class StubLookup:
+    """
+    Fixed answers for tests and offline runs: hostname -> addresses, or an
+    exception to raise. Unknown names fail like NXDOMAIN.
+    """
+
+    name = "stub"
+
+    def __init__(self, records: Dict[str, Union[Sequence[str], BaseException]], ttl: float = DNS_SYSTEM_TTL):
+        self.records = {host.lower(): value for host, value in records.items()}
+        self.ttl = ttl
+        self.calls = 0
+
+    def __call__(self, host: str) -> Answer:
+        self.calls += 1
+        value = self.records.get(host)
+        if value is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        if isinstance(value, BaseException):
+            raise value
+        return Answer(list(value), self.ttl)
+
+
+def _ipv4_only(infos: List[tuple]) -> List[tuple]:
+    return [info for info in infos if info[0] == socket.AF_INET]
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class CachingResolver:
+    """
+    Drop-in `socket.getaddrinfo` that caches hostname -> IPv4 addresses.
+
+    Each lookup tries `lookups` in order (by default the system resolver,
+    then the fallback nameservers) and keeps the first answer for its TTL;
+    failures are cached for `negative_ttl`. Concurrent lookups of the same
+    name from any thread share one resolution. Only IPv4 results are
+    returned, as before. IP literals, localhost and calls asking for
+    anything the cache can't reproduce (IPv6, canonical names) go straight
+    to the system resolver.
+    """
+
+    def __init__(
+        self,
+        lookups: Sequence[Callable[[str], Answer]],
+        cache_size: int = DNS_CACHE_SIZE,
+        negative_ttl: float = DNS_NEGATIVE_TTL,
+        min_ttl: float = DNS_MIN_TTL,
+        max_ttl: float = DNS_MAX_TTL,
+        getaddrinfo: Callable = _system_getaddrinfo,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.lookups = list(lookups)
+        self.negative_ttl = negative_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self._getaddrinfo = getaddrinfo
+        self._cache = TTLCache(maxsize=cache_size, ttl=negative_ttl, clock=clock)
+        self._inflight: Dict[str, Future] = {}
+        # getaddrinfo is called from many threads (executors, yt-dlp, Motor)
+        self._lock = threading.Lock()
+
+    def getaddrinfo(self, host: Any, port: Any, family: int = 0, type: int = 0, proto: int = 0, flags: int = 0) -> List[tuple]:
+        name = host.decode("idna") if isinstance(host, bytes) else host
+        if (
+            not name
+            or name.lower() in LOCAL_HOSTS
+            or _is_ip(name)
+            or family not in (socket.AF_UNSPEC, socket.AF_INET)
+            or flags & socket.AI_CANONNAME
+        ):
+            return _ipv4_only(self._getaddrinfo(host, port, family, type, proto, flags))
+        infos: List[tuple] = []
+        for address in self.resolve(name):
+            # Numeric, so no network: just expands socket types and the port
+            infos.extend(self._getaddrinfo(address, port, socket.AF_INET, type, proto, flags | socket.AI_NUMERICHOST))
+        return infos
+
+    def resolve(self, host: str) -> List[str]:
+        """IPv4 addresses for `host`, from the cache when fresh; raises socket.gaierror."""
+        key = host.lower().rstrip(".")
+        with self._lock:
+            entry = self._cache.get(key)
+            future = None
+            if entry is MISSING:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                else:
+                    self._cache.coalesced += 1
+
+        if future is None:
+            if isinstance(entry, socket.gaierror):
+                dns_lookups.labels("negative_hit").inc()
+                raise socket.gaierror(*entry.args)
+            dns_lookups.labels("hit").inc()
+            return list(entry)
+        if not leader:
+            dns_lookups.labels("coalesced").inc()
+            try:
+                return list(future.result())
+            except socket.gaierror as e:
+                raise socket.gaierror(*e.args) from None
+
+        dns_lookups.labels("miss").inc()
+        try:
+            answer = self._lookup(key)
+        except socket.gaierror as e:
+            with self._lock:
+                self._cache.set(key, e, ttl=self.negative_ttl)
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        except BaseException as e:
+            # Not a DNS answer (e.g. interrupted): let the next caller retry
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        ttl = min(max(answer.ttl, self.min_ttl), self.max_ttl)
+        with self._lock:
+            self._cache.set(key, answer.addresses, ttl=ttl)
+            del self._inflight[key]
+        future.set_result(answer.addresses)
+        return list(answer.addresses)
+
+    def _lookup(self, host: str) -> Answer:
+        last_error: Optional[socket.gaierror] = None
+        for lookup in self.lookups:
+            source = getattr(lookup, "name", type(lookup).__name__)
+            started = time.perf_counter()
+            try:
+                answer = lookup(host)
+            except socket.gaierror as e:
+                last_error = e
+                dns_resolutions.labels(source, "error").inc()
+                continue
+            finally:
+                dns_resolution_duration.labels(source).observe(time.perf_counter() - started)
+            if answer.addresses:
+                dns_resolutions.labels(source, "ok").inc()
+                return answer
+            dns_resolutions.labels(source, "empty").inc()
+            last_error = socket.gaierror(socket.EAI_NONAME, "No address associated with hostname")
+        raise last_error or socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._cache.stats(), "inflight": len(self._inflight)}
+
+    def install(self) -> None:
+        """Route every socket.getaddrinfo call in the process through this resolver."""
+        socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self) -> None:
+        socket.getaddrinfo = _system_getaddrinfo
+
+
+def _default_lookups() -> List[Callable[[str], Answer]]:
+    lookups: List[Callable[[str], Answer]] = [SystemLookup()]
+    if DNS_FALLBACK_NAMESERVERS:
+        lookups.append(NameserverLookup(DNS_FALLBACK_NAMESERVERS))
+    return lookups
+
+
+resolver = CachingResolver(_default_lookups())
+
+
+@registry.collector
+def _count_cache_entries() -> None:
+    dns_cache_entries.set(resolver.stats()["size"])
@@ -0,0 +1,92 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+
+from models.history import ListeningHistory, ListeningRollup, HISTORY_RETENTION_DAYS
+
+
+def day_bucket(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def apply_rollups(events: Iterable[ListeningHistory]) -> int:
+    """
+    Fold a batch of play events into the daily rollups with one bulk write.
+    Plays of the same song on the same day collapse into a single $inc.
+    """
+    counts = Counter((e.owner_id, e.song_id, day_bucket(e.timestamp)) for e in events)
+    if not counts:
+        return 0
+    operations = [
+        UpdateOne(
+            {"owner_id": owner_id, "day": day, "song_id": song_id},
+            {"$inc": {"plays": plays}},
+            upsert=True
+        )
+        for (owner_id, song_id, day), plays in counts.items()
+    ]
+    await ListeningRollup.get_motor_collection().bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def rebuild_rollups(since: Optional[datetime] = None) -> None:
+    """
+    Recompute rollups from the raw events still on hand (all of them, or from
+    `since` on) and merge them over the existing rollup documents. Days whose
+    raw events have already expired, fully or partly, are left untouched.
+
+    Meant for backfills and repairs; plays ingested while it runs may be
+    counted twice for the current day, so run it during quiet hours.
+    """
+    start = day_bucket(since) if since is not None else None
+    if HISTORY_RETENTION_DAYS:
+        # The oldest day still on hand is being expired, so its count would come up short
+        first_whole_day = day_bucket(datetime.now() - timedelta(days=HISTORY_RETENTION_DAYS)) + timedelta(days=1)
+        start = max(start, first_whole_day) if start is not None else first_whole_day
+    pipeline = []
+    if start is not None:
+        pipeline.append({"$match": {"timestamp": {"$gte": start}}})
+    pipeline += [
+        {"$group": {
+            "_id": {
+                "owner_id": "$owner_id",
+                "song_id": "$song_id",
+                "day": {"$dateFromParts": {
+                    "year": {"$year": "$timestamp"},
+                    "month": {"$month": "$timestamp"},
+                    "day": {"$dayOfMonth": "$timestamp"},
+                }},
+            },
+            "plays": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "owner_id": "$_id.owner_id",
+            "song_id": "$_id.song_id",
+            "day": "$_id.day",
+            "plays": 1,
+        }},
+        {"$merge": {
+            "into": ListeningRollup.Settings.name,
+            "on": ["owner_id", "day", "song_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await ListeningHistory.aggregate(pipeline).to_list()
+
+
+async def ensure_rollups() -> None:
+    """Backfill rollups once for deployments that only have raw history."""
+    if await ListeningRollup.find_one() is not None:
+        return
+    if await ListeningHistory.find_one() is None:
+        return
+    print("Rollups: building daily rollups from existing listening history...")
+    try:
+        await rebuild_rollups()
+        print("Rollups: backfill finished.")
+    except Exception as e:
+        print(f"Rollups: backfill failed: {e}")
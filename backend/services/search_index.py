@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import ReplaceOne
+
+from models.search import SearchEntry
+from models.song import Song
+from models.playlist import Playlist
+
+# Longest prefix we index; longer query words are matched on this prefix and
+# ranked by the exact-word check
+MAX_TERM_LENGTH = 20
+KINDS = ("song", "playlist")
+# Matches scored and sorted per query, taken in index order; keeps one-letter
+# queries over a large library from ranking every entry
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "1000"))
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+def edge_ngrams(words: List[str]) -> List[str]:
+    terms = set()
+    for word in words:
+        for size in range(1, min(len(word), MAX_TERM_LENGTH) + 1):
+            terms.add(word[:size])
+    return sorted(terms)
+
+
+def _entry(kind: str, ref_id: str, owner_id: Optional[str], texts: List[Optional[str]]) -> SearchEntry:
+    words = []
+    for text in texts:
+        for word in tokenize(text):
+            if word not in words:
+                words.append(word)
+    return SearchEntry(
+        _id=f"{kind}:{ref_id}",
+        kind=kind,
+        ref_id=ref_id,
+        owner_id=owner_id,
+        label=" ".join(tokenize(texts[0])),
+        words=words,
+        terms=edge_ngrams(words),
+    )
+
+
+def song_entry(song: Song) -> SearchEntry:
+    # Stored filenames are "<title>.<ext>"; the extension is noise
+    title = os.path.splitext(song.filename)[0]
+    return _entry("song", song.id, song.owner_id, [title, song.artist])
+
+
+def playlist_entry(playlist: Playlist) -> SearchEntry:
+    return _entry("playlist", str(playlist.id), playlist.owner_id, [playlist.name])
+
+
+def _as_document(entry: SearchEntry) -> Dict[str, Any]:
+    return {
+        "_id": entry.id,
+        "kind": entry.kind,
+        "ref_id": entry.ref_id,
+        "owner_id": entry.owner_id,
+        "label": entry.label,
+        "words": entry.words,
+        "terms": entry.terms,
+    }
+
+
+async def index_song(song: Song) -> None:
+    await song_entry(song).save()
+
+
+async def index_playlist(playlist: Playlist) -> None:
+    await playlist_entry(playlist).save()
+
+
+async def remove_entry(kind: str, ref_id: str) -> None:
+    await SearchEntry.find({"_id": f"{kind}:{ref_id}"}).delete()
+
+
+def encode_cursor(positions: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Dict[str, Any]:
+    if not cursor:
+        return {}
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return positions if isinstance(positions, dict) else {}
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def build_search_pipeline(
+    kind: str,
+    tokens: List[str],
+    owner_id: Optional[str],
+    limit: int,
+    after: Optional[Tuple[float, str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Match every query word as an indexed prefix term, rank, and return one
+    page (plus one extra row to tell whether there is a next page).
+
+    Score: one point per query word, two more for each query word that is a
+    whole word of the entry, and three more if the entry's label starts with
+    the whole query. Only the first SEARCH_CANDIDATES matches are ranked.
+    """
+    match: Dict[str, Any] = {"kind": kind, "terms": {"$all": [t[:MAX_TERM_LENGTH] for t in tokens]}}
+    if owner_id:
+        match["owner_id"] = owner_id
+
+    phrase = " ".join(tokens)
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        {"$limit": SEARCH_CANDIDATES},
+        {"$project": {
+            "ref_id": 1,
+            "score": {"$add": [
+                len(tokens),
+                {"$multiply": [2, {"$size": {"$filter": {
+                    "input": "$words",
+                    "cond": {"$in": ["$$this", {"$literal": tokens}]},
+                }}}]},
+                {"$cond": [{"$eq": [{"$indexOfCP": ["$label", phrase]}, 0]}, 3, 0]},
+            ]},
+        }},
+    ]
+    if after is not None:
+        score, last_id = after
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "_id": {"$gt": last_id}},
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": limit + 1},
+    ]
+    return pipeline
+
+
+async def _search_kind(kind, tokens, owner_id, limit, after):
+    rows = await SearchEntry.aggregate(build_search_pipeline(kind, tokens, owner_id, limit, after)).to_list()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    ids = [row["ref_id"] for row in rows]
+    if kind == "song":
+        docs = await Song.find({"_id": {"$in": ids}}).to_list()
+        by_id = {doc.id: doc for doc in docs}
+    else:
+        docs = await Playlist.find({"_id": {"$in": [PydanticObjectId(i) for i in ids]}}).to_list()
+        by_id = {str(doc.id): doc for doc in docs}
+
+    # Keep ranking order; skip entries whose document vanished meanwhile
+    results = [by_id[i] for i in ids if i in by_id]
+    next_position = [rows[-1]["score"], rows[-1]["_id"]] if has_more else None
+    return results, next_position
+
+
+async def search_library(
+    query: str,
+    owner_id: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    kinds: Tuple[str, ...] = KINDS,
+) -> Dict[str, Any]:
+    """
+    Ranked, owner-scoped search over songs and playlists.
+
+    The cursor is opaque to clients and tracks the position in each result
+    list separately; a list that has been exhausted is omitted from it.
+    """
+    tokens = tokenize(query)
+    positions = decode_cursor(cursor)
+    response: Dict[str, Any] = {"songs": [], "playlists": []}
+    next_positions: Dict[str, Any] = {}
+
+    if tokens:
+        for kind in kinds:
+            if cursor and kind not in positions:
+                continue
+            after = positions.get(kind)
+            if after is not None and (not isinstance(after, list) or len(after) != 2):
+                raise ValueError("Invalid cursor")
+            results, next_position = await _search_kind(kind, tokens, owner_id, limit, after)
+            response[f"{kind}s"] = results
+            if next_position is not None:
+                next_positions[kind] = next_position
+
+    response["next_cursor"] = encode_cursor(next_positions) if next_positions else None
+    return response
+
+
+async def rebuild_search_index(batch_size: int = 500) -> int:
+    """Re-index every song and playlist, streaming them in batches."""
+    collection = SearchEntry.get_motor_collection()
+    indexed = 0
+    for model, make_entry in ((Song, song_entry), (Playlist, playlist_entry)):
+        operations = []
+        async for doc in model.find_all():
+            entry = make_entry(doc)
+            operations.append(ReplaceOne({"_id": entry.id}, _as_document(entry), upsert=True))
+            if len(operations) >= batch_size:
+                await collection.bulk_write(operations, ordered=False)
+                indexed += len(operations)
+                operations = []
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            indexed += len(operations)
+    return indexed
+
+
+async def ensure_search_index() -> None:
+    """Build the index once for libraries that predate it."""
+    if await SearchEntry.find_one() is not None:
+        return
+    if await Song.find_one() is None and await Playlist.find_one() is None:
+        return
+    print("Search: building library search index...")
+    try:
+        count = await rebuild_search_index()
+        print(f"Search: indexed {count} songs and playlists.")
+    except Exception as e:
+        print(f"Search: index build failed: {e}")
@@ -0,0 +1,234 @@
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to in-process coordination only
+    fcntl = None
+
+# Root directory for song blobs
+UPLOAD_DIR = "uploaded_songs"
+
+# Append-only sidecar holding the song_id -> path index
+INDEX_FILENAME = ".index.jsonl"
+
+# Cross-process locks, one file per locked key while it is held or awaited
+LOCK_DIRNAME = ".locks"
+
+# Private per-job directories for files still being written, kept on the same
+# filesystem as the shards so finished files move in atomically
+INCOMING_DIRNAME = ".incoming"
+
+# Names yt-dlp uses while a download is still in flight
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".temp", ".tmp")
+
+
+class StoredFile(NamedTuple):
+    path: str
+    size: int
+    # Modification time when indexed; None for entries written before it was recorded
+    mtime_ns: Optional[int] = None
+
+    def record(self, song_id: str, root: str) -> dict:
+        record = {"id": song_id, "path": os.path.relpath(self.path, root), "size": self.size}
+        if self.mtime_ns is not None:
+            record["mtime_ns"] = self.mtime_ns
+        return record
+
+
+async def _acquire(path: str, poll_interval: float) -> int:
+    """flock `path`, returning the locked fd once it is the file currently at `path`."""
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(poll_interval)
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+        except BaseException:
+            os.close(fd)
+            raise
+        if current == os.fstat(fd).st_ino:
+            return fd
+        # The previous holder removed the file on release: lock the one there now
+        os.close(fd)
+
+
+def _stored_file(path: str) -> StoredFile:
+    stat_result = os.stat(path)
+    return StoredFile(path=path, size=stat_result.st_size, mtime_ns=stat_result.st_mtime_ns)
+
+
+class SongStorage:
+    """
+    Sharded on-disk layout for song files.
+
+    Files live under two levels of hashed subdirectories
+    (`uploaded_songs/ab/cd/<song_id>.<ext>`) so no directory grows past a few
+    entries, and an in-memory index maps song_id -> (path, size) for O(1)
+    lookups. The index is persisted as an append-only JSONL sidecar and
+    replayed at startup; other workers' writes are picked up lazily because a
+    miss only has to look inside the song's own shard.
+    """
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILENAME)
+        self._index: Dict[str, StoredFile] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def shard_dir(self, song_id: str, create: bool = True) -> str:
+        digest = hashlib.sha1(song_id.encode("utf-8")).hexdigest()
+        path = os.path.join(self.root, digest[:2], digest[2:4])
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def path_for(self, song_id: str, extension: str) -> str:
+        """Where a new file for `song_id` should be written."""
+        return os.path.join(self.shard_dir(song_id), f"{song_id}{extension}")
+
+    def register(self, song_id: str, path: str) -> StoredFile:
+        """Record a file that has been written into its shard."""
+        entry = _stored_file(path)
+        with self._lock:
+            self._index[song_id] = entry
+            self._append(entry.record(song_id, self.root))
+        return entry
+
+    def incoming_dir(self) -> str:
+        """A fresh directory to write a file into before adopt() moves it into its shard."""
+        parent = os.path.join(self.root, INCOMING_DIRNAME)
+        os.makedirs(parent, exist_ok=True)
+        return tempfile.mkdtemp(dir=parent)
+
+    def adopt(self, song_id: str, path: str) -> StoredFile:
+        """Move a finished file into the song's shard and register it."""
+        final_path = self.path_for(song_id, os.path.splitext(path)[1])
+        os.replace(path, final_path)
+        return self.register(song_id, final_path)
+
+    def lookup(self, song_id: str) -> Optional[StoredFile]:
+        entry = self._index.get(song_id)
+        if entry is not None:
+            return entry
+
+        # Miss: the file may have been written by another worker, so check the
+        # song's shard (a handful of entries at most) and adopt what we find
+        shard = self.shard_dir(song_id, create=False)
+        if not os.path.isdir(shard):
+            return None
+        for name in os.listdir(shard):
+            if name.startswith(song_id) and not name.endswith(PARTIAL_SUFFIXES):
+                path = os.path.join(shard, name)
+                with self._lock:
+                    entry = _stored_file(path)
+                    self._index[song_id] = entry
+                return entry
+        return None
+
+    def remove(self, song_id: str, delete_file: bool = True) -> None:
+        with self._lock:
+            entry = self._index.pop(song_id, None)
+            self._append({"id": song_id, "deleted": True})
+        if delete_file and entry is not None:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def load(self) -> int:
+        """Replay the sidecar into memory. Returns the number of indexed songs."""
+        index: Dict[str, StoredFile] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash; the shard lookup recovers it
+                        continue
+                    if record.get("deleted"):
+                        index.pop(record["id"], None)
+                    else:
+                        index[record["id"]] = StoredFile(
+                            path=os.path.join(self.root, record["path"]),
+                            size=record["size"],
+                            mtime_ns=record.get("mtime_ns"),
+                        )
+        with self._lock:
+            self._index = index
+
+        flat = self.unmigrated_files()
+        if flat:
+            print(f"Storage: {len(flat)} files in {self.root} are not sharded yet, run migrate_storage.py")
+        return len(index)
+
+    def compact(self) -> None:
+        """Rewrite the sidecar with only live entries. Run while no workers are writing."""
+        tmp_path = self.index_path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for song_id, entry in self._index.items():
+                    f.write(json.dumps(entry.record(song_id, self.root)) + "\n")
+            os.replace(tmp_path, self.index_path)
+
+    def unmigrated_files(self):
+        """Files still sitting flat in the root directory (pre-sharding layout)."""
+        with os.scandir(self.root) as it:
+            return [e.name for e in it if e.is_file() and not e.name.startswith(".")]
+
+    @asynccontextmanager
+    async def lock(self, key: str, poll_interval: float = 0.25):
+        """
+        Exclusive lock on `key` shared by every worker process on this host.
+
+        Uses flock() on a lock file of the key's own, polling without blocking
+        the event loop, so only holders of the same key wait on each other.
+        The file is removed on release so the directory doesn't grow with the
+        library.
+        """
+        if fcntl is None:
+            yield
+            return
+
+        lock_dir = os.path.join(self.root, LOCK_DIRNAME)
+        os.makedirs(lock_dir, exist_ok=True)
+        path = os.path.join(lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+        fd = await _acquire(path, poll_interval)
+        try:
+            yield
+        finally:
+            # Unlinked while still held, so nobody can lock this file after us
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _append(self, record: dict) -> None:
+        # One short O_APPEND write per record keeps concurrent workers from
+        # interleaving partial lines
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+storage = SongStorage(os.getenv("UPLOAD_DIR", UPLOAD_DIR))
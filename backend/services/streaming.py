@@ -0,0 +1,203 @@
+import os
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from services.conditional import not_modified
+
+# Size of each read when we have to stream the file ourselves
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header can't be served (out of bounds or multi-range)."""
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a `Range: bytes=...` header into an inclusive (start, end) pair.
+
+    Returns None when the header should be ignored (unknown unit or malformed),
+    in which case the caller serves the whole file with a 200.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    # Multipart/byteranges responses aren't worth the complexity for audio
+    # players, which only ever ask for a single window.
+    if "," in spec:
+        raise RangeNotSatisfiable()
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Suffix range: the final N bytes
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def file_etag(size: int, mtime_ns: int) -> str:
+    # Strong validator from size + mtime; cheap and changes whenever the file does
+    return f'"{size:x}-{mtime_ns:x}"'
+
+
+def _if_range_matches(if_range: str, etag: str, stat_result: os.stat_result) -> bool:
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Weak validators never satisfy If-Range
+        return if_range == etag
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) >= int(stat_result.st_mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+class RangeFileResponse(Response):
+    """
+    File response with single byte-range support (206 Partial Content).
+
+    Honours Range / If-Range, rejects multi-range requests with a 416 and uses
+    the ASGI zero-copy extensions when the server advertises them, falling back
+    to chunked reads in a worker thread otherwise.
+
+    Answers If-None-Match / If-Modified-Since with a 304. Pass the `size` and
+    `mtime_ns` recorded in the storage index to do that without touching the
+    disk; the file is only stat()ed when a body has to be sent.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        media_type: Optional[str] = None,
+        headers: Optional[dict] = None,
+        size: Optional[int] = None,
+        mtime_ns: Optional[int] = None,
+    ):
+        self.path = path
+        self.indexed = (size, mtime_ns) if size is not None and mtime_ns is not None else None
+        self.status_code = 200
+        self.media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+        if self.indexed is not None:
+            size, mtime_ns = self.indexed
+            if await self._send_not_modified(send, request_headers, size, mtime_ns):
+                return
+
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            response = Response("Song not found", status_code=404)
+            await response(scope, receive, send)
+            return
+
+        size = stat_result.st_size
+        if await self._send_not_modified(send, request_headers, size, stat_result.st_mtime_ns):
+            return
+        etag = file_etag(size, stat_result.st_mtime_ns)
+
+        self.headers.setdefault("content-type", self.media_type)
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("last-modified", formatdate(stat_result.st_mtime, usegmt=True))
+        self.headers.setdefault("etag", etag)
+
+        start, end = 0, size - 1
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and size > 0 and (if_range is None or _if_range_matches(if_range, etag, stat_result)):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                response = Response(
+                    status_code=416,
+                    headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes"},
+                )
+                await response(scope, receive, send)
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        length = end - start + 1 if size > 0 else 0
+        self.headers["content-length"] = str(length)
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        await self._send_body(scope, send, start, length, size)
+
+    async def _send_not_modified(self, send: Send, request_headers: dict, size: int, mtime_ns: int) -> bool:
+        etag = file_etag(size, mtime_ns)
+        mtime = mtime_ns / 1e9
+        if not not_modified(request_headers, etag, mtime):
+            return False
+        self.status_code = 304
+        self.headers.setdefault("etag", etag)
+        self.headers.setdefault("last-modified", formatdate(mtime, usegmt=True))
+        await send({"type": "http.response.start", "status": 304, "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return True
+
+    async def _send_body(self, scope: Scope, send: Send, start: int, length: int, size: int) -> None:
+        extensions = scope.get("extensions") or {}
+
+        # Zero-copy: let the server sendfile() straight from the page cache
+        if "http.response.zerocopysend" in extensions and length > 0:
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": start,
+                    "count": length,
+                    "more_body": False,
+                })
+            return
+        if "http.response.pathsend" in extensions and start == 0 and length == size:
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        remaining = length
+        async with await anyio.open_file(self.path, "rb") as f:
+            if start:
+                await f.seek(start)
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+        # Empty file or file truncated underneath us: still close the body
+        if remaining > 0 or length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,102 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+
+from models.library import LibraryChange, LibraryVersion
+from models.playlist import Playlist
+from models.song import Song
+from services.listing import ListingSchema
+
+# Change log entries read per call; clients keep calling while `has_more`
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+# A write takes its seq before its log entry is inserted, so a lower seq can
+# show up after a higher one. Entries only count as delivered once they are
+# this old; anything newer is sent again on the next call.
+SETTLE_SECONDS = 5
+
+SCHEMAS = {
+    "song": ListingSchema(Song),
+    "playlist": ListingSchema(Playlist, object_ids=True),
+}
+
+
+def _response(version: int, reset: bool = False, has_more: bool = False) -> Dict[str, Any]:
+    return {
+        "version": version,
+        "reset": reset,
+        "has_more": has_more,
+        "songs": [],
+        "playlists": [],
+        "deleted": {"songs": [], "playlists": []},
+    }
+
+
+async def _hydrate(kind: str, owner_id: str, ref_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Current documents for `ref_ids`, plus the ids that are gone (or not the owner's)."""
+    if not ref_ids:
+        return [], []
+    schema = SCHEMAS[kind]
+    keys = [PydanticObjectId(ref_id) for ref_id in ref_ids] if schema.object_ids else ref_ids
+    docs = await schema.model.get_motor_collection().find({"_id": {"$in": keys}, "owner_id": owner_id}).to_list(length=None)
+    found = {str(doc["_id"]) for doc in docs}
+    return [schema.serialize(doc) for doc in docs], [ref_id for ref_id in ref_ids if ref_id not in found]
+
+
+async def changes_since(owner_id: str, since: int, limit: int = SYNC_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    What changed in `owner_id`'s library after version `since`: the current
+    songs and playlists that were created or edited, and the ids of those
+    deleted, each record once however often it changed.
+
+    `version` is what to pass as `since` next time. `reset` means the changes
+    can't be replayed (first sync, log expired, bulk maintenance): reload the
+    full lists, then sync from `version`.
+    """
+    state: Optional[Dict[str, Any]] = await LibraryVersion.get_motor_collection().find_one({"_id": owner_id})
+    current = state["version"] if state else 0
+    if since <= 0 or since > current or since < (state or {}).get("reset_after", 0):
+        return _response(current, reset=True)
+    if since == current:
+        return _response(current)
+
+    settled_before = datetime.now() - timedelta(seconds=SETTLE_SECONDS)
+    entries = await LibraryChange.get_motor_collection().find(
+        {"owner_id": owner_id, "seq": {"$gt": since}}
+    ).sort("seq", 1).limit(limit + 1).to_list(length=limit + 1)
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    if not entries:
+        # Missing entries are either still being written or expired/lost
+        if state["updated_at"] <= settled_before:
+            return _response(current, reset=True)
+        return _response(since)
+
+    # Advance over contiguous, settled entries only
+    version = since
+    for entry in entries:
+        if entry["seq"] > version + 1:
+            # Same rule for a gap anywhere: once the entry after it has
+            # settled, the missing ones aren't coming
+            if entry["created_at"] <= settled_before:
+                return _response(current, reset=True)
+            break
+        if entry["created_at"] > settled_before:
+            break
+        version = entry["seq"]
+
+    # Only the last change to each record matters
+    latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for entry in entries:
+        latest[(entry["kind"], entry["ref_id"])] = entry
+
+    response = _response(version, has_more=more and version == entries[-1]["seq"])
+    for kind, key in (("song", "songs"), ("playlist", "playlists")):
+        changed = [ref_id for (k, ref_id), entry in latest.items() if k == kind and not entry["deleted"]]
+        deleted = [ref_id for (k, ref_id), entry in latest.items() if k == kind and entry["deleted"]]
+        docs, gone = await _hydrate(kind, owner_id, changed)
+        response[key] = docs
+        response["deleted"][key] = deleted + gone
+    return response
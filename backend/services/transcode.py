@@ -0,0 +1,341 @@
+import os
+import time
+import shutil
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+# Where renditions are cached, and how many bytes they may take in total
+TRANSCODE_DIR = os.getenv("TRANSCODE_DIR", "transcoded")
+TRANSCODE_CACHE_BYTES = int(os.getenv("TRANSCODE_CACHE_BYTES", str(2 * 1024 ** 3)))
+# ffmpeg jobs running at once
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", "1"))
+TRANSCODE_TIMEOUT = 600
+HLS_SEGMENT_SECONDS = 6
+
+
+class Rendition(NamedTuple):
+    codec: str
+    bitrate: int  # kbit/s
+    extension: str
+    media_type: str
+
+
+# The ladder: a low and a high tier for each codec
+RENDITIONS: Dict[str, Rendition] = {
+    "opus-48": Rendition("libopus", 48, ".opus", "audio/ogg"),
+    "opus-96": Rendition("libopus", 96, ".opus", "audio/ogg"),
+    "aac-64": Rendition("aac", 64, ".m4a", "audio/mp4"),
+    "aac-128": Rendition("aac", 128, ".m4a", "audio/mp4"),
+}
+LADDER = {
+    ("opus", "low"): "opus-48",
+    ("opus", "high"): "opus-96",
+    ("aac", "low"): "aac-64",
+    ("aac", "high"): "aac-128",
+}
+# AAC is what every HLS client can play
+HLS_VARIANTS = ("aac-64", "aac-128")
+HLS_DIRNAME = "hls"
+MASTER_PLAYLIST = "master.m3u8"
+
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+
+# Network Information client hints that mean "keep it small"
+SLOW_ECT = {"slow-2g", "2g", "3g"}
+SLOW_DOWNLINK_MBPS = 1.0
+
+
+def choose_rendition(
+    codecs: Optional[str] = None,
+    accept: Optional[str] = None,
+    save_data: Optional[str] = None,
+    ect: Optional[str] = None,
+    downlink: Optional[str] = None,
+    quality: Optional[str] = None,
+) -> str:
+    """
+    Pick a rendition from client hints.
+
+    Codec: Opus if the client lists it in `codecs` (or accepts Ogg/WebM audio),
+    AAC otherwise. Tier: low when the client asks for it or signals
+    Save-Data, a slow effective connection type or a low downlink.
+    """
+    if codecs is not None:
+        wanted = {c.strip().lower() for c in codecs.split(",")}
+        codec = "opus" if "opus" in wanted else "aac"
+    else:
+        accept = (accept or "").lower()
+        codec = "opus" if ("audio/ogg" in accept or "audio/webm" in accept or "codecs=opus" in accept) else "aac"
+
+    if quality in ("low", "high"):
+        tier = quality
+    else:
+        tier = "high"
+        if (save_data or "").strip().lower() == "on" or (ect or "").strip().lower() in SLOW_ECT:
+            tier = "low"
+        try:
+            if downlink is not None and float(downlink) < SLOW_DOWNLINK_MBPS:
+                tier = "low"
+        except ValueError:
+            pass
+    return LADDER[(codec, tier)]
+
+
+def build_ffmpeg_args(ffmpeg: str, source: str, out_dir: str) -> List[str]:
+    """
+    One decode of `source`, fanned out to every rendition and HLS variant.
+    Creates `out_dir` and the variant directories, so call it off the loop.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    args = [ffmpeg, "-v", "error", "-nostdin", "-y", "-i", source]
+    for name, rendition in RENDITIONS.items():
+        args += ["-map", "0:a:0", "-c:a", rendition.codec, "-b:a", f"{rendition.bitrate}k"]
+        if rendition.extension == ".m4a":
+            # moov atom first, so playback can start before the download ends
+            args += ["-movflags", "+faststart"]
+        args.append(os.path.join(out_dir, name + rendition.extension))
+    for name in HLS_VARIANTS:
+        rendition = RENDITIONS[name]
+        variant_dir = os.path.join(out_dir, HLS_DIRNAME, name)
+        os.makedirs(variant_dir, exist_ok=True)
+        args += [
+            "-map", "0:a:0", "-c:a", rendition.codec, "-b:a", f"{rendition.bitrate}k",
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_filename", os.path.join(variant_dir, "%03d.ts"),
+            os.path.join(variant_dir, "index.m3u8"),
+        ]
+    return args
+
+
+def master_playlist() -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for name in HLS_VARIANTS:
+        rendition = RENDITIONS[name]
+        # Bitrate plus ~10% for container overhead
+        bandwidth = rendition.bitrate * 1100
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},CODECS="mp4a.40.2"')
+        lines.append(f"{name}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _subdirs(root: str, depth: int) -> List[str]:
+    dirs = [root] if os.path.isdir(root) else []
+    for _ in range(depth):
+        dirs = [os.path.join(d, name) for d in dirs for name in os.listdir(d) if os.path.isdir(os.path.join(d, name))]
+    return dirs
+
+
+class Transcoder:
+    """
+    Background transcoding of stored files into a small Opus/AAC ladder and
+    an HLS (AAC) variant set, with an on-disk LRU cache under a byte budget.
+
+    Outputs for one blob live in one directory
+    (`transcoded/ab/cd/<blob_id>/`), built under a temporary name and renamed
+    into place when complete, so a directory that exists is always whole.
+    Recency is tracked in memory and mirrored to the directory mtime, so the
+    LRU order survives restarts. Requests for a blob that isn't transcoded yet
+    schedule it and are served from the original meanwhile.
+    """
+
+    def __init__(self, root: str = TRANSCODE_DIR, budget: int = TRANSCODE_CACHE_BYTES, concurrency: int = TRANSCODE_CONCURRENCY):
+        self.root = root
+        self.budget = budget
+        self.concurrency = concurrency
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # blob_id -> bytes, oldest first
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loaded = False
+        # Resolved by load(); None disables transcoding
+        self.ffmpeg: Optional[str] = None
+        self.transcoded = 0
+        self.failed = 0
+        self.evicted = 0
+
+    def blob_dir(self, blob_id: str) -> str:
+        digest = hashlib.sha1(blob_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], blob_id)
+
+    def load(self) -> None:
+        """Rebuild the LRU order from what is on disk."""
+        self.ffmpeg = shutil.which("ffmpeg")
+        found = []
+        for shard in _subdirs(self.root, depth=2):
+            for blob_id in os.listdir(shard):
+                path = os.path.join(shard, blob_id)
+                if ".tmp-" in blob_id:
+                    # Left over from a run that died mid-transcode (recent ones may be live in another worker)
+                    if time.time() - os.path.getmtime(path) > TRANSCODE_TIMEOUT:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+                found.append((os.path.getmtime(path), blob_id, _tree_size(path)))
+        with self._lock:
+            self._entries = OrderedDict((blob_id, size) for _, blob_id, size in sorted(found))
+        self._loaded = True
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(self._entries.values())
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    async def rendition_path(self, blob_id: str, name: str) -> Optional[str]:
+        """Path of a finished rendition, marking it recently used; None if not cached."""
+        self._ensure_loaded()
+        path = os.path.join(self.blob_dir(blob_id), name + RENDITIONS[name].extension)
+        return path if await self._touch(blob_id, path) else None
+
+    async def hls_path(self, blob_id: str, name: str) -> Optional[str]:
+        """Path of an HLS playlist or segment; `name` is relative to the HLS directory."""
+        self._ensure_loaded()
+        hls_dir = os.path.join(self.blob_dir(blob_id), HLS_DIRNAME)
+        path = os.path.normpath(os.path.join(hls_dir, name))
+        if not path.startswith(hls_dir + os.sep):
+            return None
+        return path if await self._touch(blob_id, path) else None
+
+    async def _touch(self, blob_id: str, path: str) -> bool:
+        # Runs for every stream and HLS segment request: the LRU order is
+        # updated in memory, the stat/utime (and any size walk) on a thread
+        if not await asyncio.to_thread(self._mark_used, blob_id, path):
+            # Evicted, possibly by another worker: forget it
+            with self._lock:
+                self._entries.pop(blob_id, None)
+            return False
+        await self._touch_dir(blob_id)
+        return True
+
+    def _mark_used(self, blob_id: str, path: str) -> bool:
+        """Whether `path` exists; if so mirror the use to the directory mtime."""
+        if not os.path.isfile(path):
+            return False
+        try:
+            os.utime(self.blob_dir(blob_id))
+        except OSError:
+            pass
+        return True
+
+    def schedule(self, blob_id: str, source: str) -> None:
+        """Transcode `source` in the background unless it is cached or already queued."""
+        self._ensure_loaded()
+        if blob_id in self._entries or blob_id in self._jobs:
+            return
+        if self.ffmpeg is None:
+            return
+        task = asyncio.create_task(self._transcode(blob_id, source))
+        self._jobs[blob_id] = task
+        task.add_done_callback(lambda _: self._jobs.pop(blob_id, None))
+
+    async def _transcode(self, blob_id: str, source: str) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        final_dir = self.blob_dir(blob_id)
+        work_dir = f"{final_dir}.tmp-{os.getpid()}"
+        async with self._semaphore:
+            if os.path.isdir(final_dir):
+                # Another worker got there first
+                await self._touch_dir(blob_id)
+                return
+            started = time.perf_counter()
+            try:
+                args = await asyncio.to_thread(build_ffmpeg_args, self.ffmpeg, source, work_dir)
+                process = await asyncio.create_subprocess_exec(
+                    *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    _, stderr = await asyncio.wait_for(process.communicate(), TRANSCODE_TIMEOUT)
+                except BaseException:
+                    process.kill()
+                    await process.wait()
+                    raise
+                if process.returncode != 0:
+                    raise RuntimeError(stderr.decode(errors="replace").strip() or f"ffmpeg exited with {process.returncode}")
+                with open(os.path.join(work_dir, HLS_DIRNAME, MASTER_PLAYLIST), "w") as f:
+                    f.write(master_playlist())
+                size = await asyncio.to_thread(_tree_size, work_dir)
+                try:
+                    os.replace(work_dir, final_dir)
+                except OSError:
+                    # Another worker renamed its copy into place first; keep theirs
+                    shutil.rmtree(work_dir, ignore_errors=True)
+            except asyncio.CancelledError:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                raise
+            except Exception as e:
+                self.failed += 1
+                shutil.rmtree(work_dir, ignore_errors=True)
+                print(f"Transcode of {blob_id} failed: {e}")
+                return
+
+        with self._lock:
+            self._entries[blob_id] = size
+            self._entries.move_to_end(blob_id)
+        self.transcoded += 1
+        print(f"Transcoded {blob_id} ({size / 1024 ** 2:.1f} MB) in {time.perf_counter() - started:.1f}s")
+        await asyncio.to_thread(self.evict)
+
+    async def _touch_dir(self, blob_id: str) -> None:
+        with self._lock:
+            if blob_id in self._entries:
+                self._entries.move_to_end(blob_id)
+                return
+        # Transcoded by another worker
+        size = await asyncio.to_thread(_tree_size, self.blob_dir(blob_id))
+        with self._lock:
+            self._entries.setdefault(blob_id, size)
+            self._entries.move_to_end(blob_id)
+
+    def evict(self) -> int:
+        """Delete least recently used outputs until the cache fits the budget."""
+        removed = 0
+        while True:
+            with self._lock:
+                if sum(self._entries.values()) <= self.budget or len(self._entries) <= 1:
+                    # Never evict the newest entry, even if it alone is over budget
+                    break
+                blob_id, _ = self._entries.popitem(last=False)
+            shutil.rmtree(self.blob_dir(blob_id), ignore_errors=True)
+            removed += 1
+        self.evicted += removed
+        return removed
+
+    async def shutdown(self) -> None:
+        for task in list(self._jobs.values()):
+            task.cancel()
+        await asyncio.gather(*self._jobs.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "used_bytes": self.used_bytes,
+            "budget_bytes": self.budget,
+            "queued": len(self._jobs),
+            "transcoded": self.transcoded,
+            "failed": self.failed,
+            "evicted": self.evicted,
+        }
+
+
+transcoder = Transcoder()
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from services.cache import TTLCache
+from services.external_search import ExternalSearch
+
+
+class StubYTMusic:
+    """Stands in for ytmusicapi.YTMusic: counts searches and can hold them until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def search(self, query, filter=None):
+        self.calls.append(query)
+        self.release.wait(5)
+        return [{
+            "videoId": "dQw4w9WgXcQ",
+            "title": query.title(),
+            "artists": [{"name": "Stub Artist"}],
+            "thumbnails": [{"url": "small"}, {"url": "large"}],
+            "duration": "3:33",
+        }]
+
+
+def make_search(stub, ttl=60.0, clock=None):
+    search = ExternalSearch(client_factory=lambda: stub)
+    if clock is not None:
+        search.cache = TTLCache(maxsize=8, ttl=ttl, clock=clock)
+    return search
+
+
+def test_concurrent_identical_queries_share_one_upstream_call():
+    stub = StubYTMusic()
+    search = make_search(stub)
+
+    async def run():
+        # Hold the first call upstream until every request is waiting on it
+        stub.release.clear()
+        requests = [asyncio.create_task(search.search(q)) for q in ["Daft Punk", "daft punk", "  DAFT   punk "] * 4]
+        await asyncio.sleep(0.1)
+        stub.release.set()
+        return await asyncio.gather(*requests)
+
+    results = asyncio.run(run())
+
+    assert stub.calls == ["daft punk"]
+    assert all(result == results[0] for result in results)
+    assert results[0][0]["channel"] == "Stub Artist"
+    assert results[0][0]["thumbnails"] == [{"url": "large"}]
+    assert search.stats()["coalesced"] == 11
+
+
+def test_cached_result_is_reused_until_the_ttl_expires(clock):
+    stub = StubYTMusic()
+    search = make_search(stub, ttl=60.0, clock=clock)
+
+    async def run():
+        await search.search("daft punk")
+        clock.now = 59.0
+        await search.search("daft punk")
+        assert stub.calls == ["daft punk"]
+        clock.now = 61.0
+        await search.search("daft punk")
+
+    asyncio.run(run())
+
+    assert stub.calls == ["daft punk", "daft punk"]
+    assert search.stats()["hits"] == 1
+
+
+def test_failed_searches_are_not_cached():
+    stub = StubYTMusic()
+    search = make_search(stub)
+    failures = [RuntimeError("upstream down")]
+
+    def flaky(query, filter=None):
+        if failures:
+            raise failures.pop()
+        return StubYTMusic.search(stub, query, filter)
+
+    stub.search = flaky
+
+    async def run():
+        try:
+            await search.search("daft punk")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("the upstream error should propagate")
+        return await search.search("daft punk")
+
+    assert asyncio.run(run())[0]["id"] == "dQw4w9WgXcQ"
+    assert stub.calls == ["daft punk"]
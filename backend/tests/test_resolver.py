@@ -0,0 +1,126 @@
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.resolver import CachingResolver, StubLookup
+
+
+class SlowStub(StubLookup):
+    """A StubLookup whose lookups wait until released, to overlap concurrent callers."""
+
+    def __init__(self, records, **kwargs):
+        super().__init__(records, **kwargs)
+        self.release = threading.Event()
+
+    def __call__(self, host):
+        self.release.wait(5)
+        return super().__call__(host)
+
+
+def make_resolver(clock, *lookups, **kwargs):
+    return CachingResolver(list(lookups), clock=clock, **kwargs)
+
+
+def test_answers_are_cached(clock):
+    stub = StubLookup({"mongo.example.com": ["10.0.0.1", "10.0.0.2"]})
+    resolver = make_resolver(clock, stub)
+
+    assert resolver.resolve("mongo.example.com") == ["10.0.0.1", "10.0.0.2"]
+    assert resolver.resolve("MONGO.example.com.") == ["10.0.0.1", "10.0.0.2"]
+    assert stub.calls == 1
+
+
+def test_getaddrinfo_expands_cached_addresses_without_lookups(clock):
+    stub = StubLookup({"mongo.example.com": ["127.0.0.2"]})
+    resolver = make_resolver(clock, stub)
+
+    infos = resolver.getaddrinfo("mongo.example.com", 27017, type=socket.SOCK_STREAM)
+
+    assert [(info[0], info[4]) for info in infos] == [(socket.AF_INET, ("127.0.0.2", 27017))]
+    resolver.getaddrinfo("mongo.example.com", 443)
+    assert stub.calls == 1
+
+
+def test_concurrent_lookups_of_one_name_share_a_resolution(clock):
+    stub = SlowStub({"mongo.example.com": ["10.0.0.1"]})
+    resolver = make_resolver(clock, stub)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(resolver.resolve, "mongo.example.com") for _ in range(8)]
+        # Let every thread reach the resolver before the first lookup finishes
+        while resolver.stats()["coalesced"] < 7:
+            threading.Event().wait(0.01)
+        stub.release.set()
+        results = [future.result(timeout=5) for future in futures]
+
+    assert results == [["10.0.0.1"]] * 8
+    assert stub.calls == 1
+    assert resolver.stats()["inflight"] == 0
+
+
+def test_coalesced_callers_share_a_failure(clock):
+    stub = SlowStub({})
+    resolver = make_resolver(clock, stub)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(resolver.resolve, "missing.example.com") for _ in range(4)]
+        while resolver.stats()["coalesced"] < 3:
+            threading.Event().wait(0.01)
+        stub.release.set()
+        for future in futures:
+            with pytest.raises(socket.gaierror):
+                future.result(timeout=5)
+
+    assert stub.calls == 1
+
+
+def test_failures_are_cached_for_the_negative_ttl(clock):
+    stub = StubLookup({})
+    resolver = make_resolver(clock, stub, negative_ttl=10)
+
+    for _ in range(3):
+        with pytest.raises(socket.gaierror) as error:
+            resolver.resolve("missing.example.com")
+        assert error.value.args[0] == socket.EAI_NONAME
+    assert stub.calls == 1
+
+    clock.now = 11
+    stub.records["missing.example.com"] = ["10.0.0.9"]
+    assert resolver.resolve("missing.example.com") == ["10.0.0.9"]
+    assert stub.calls == 2
+
+
+def test_answers_expire_after_their_clamped_ttl(clock):
+    stub = StubLookup({"mongo.example.com": ["10.0.0.1"]}, ttl=1)
+    resolver = make_resolver(clock, stub, min_ttl=30, max_ttl=60)
+
+    resolver.resolve("mongo.example.com")
+    clock.now = 29
+    resolver.resolve("mongo.example.com")
+    assert stub.calls == 1
+
+    # The 1s record TTL was raised to min_ttl
+    clock.now = 31
+    stub.records["mongo.example.com"] = ["10.0.0.2"]
+    assert resolver.resolve("mongo.example.com") == ["10.0.0.2"]
+    assert stub.calls == 2
+
+
+def test_falls_back_to_the_next_lookup(clock):
+    broken = StubLookup({"mongo.example.com": socket.gaierror(socket.EAI_AGAIN, "Temporary failure")})
+    fallback = StubLookup({"mongo.example.com": ["10.0.0.3"]})
+    resolver = make_resolver(clock, broken, fallback)
+
+    assert resolver.resolve("mongo.example.com") == ["10.0.0.3"]
+    assert (broken.calls, fallback.calls) == (1, 1)
+
+
+def test_ip_literals_and_localhost_skip_the_lookups(clock):
+    stub = StubLookup({})
+    resolver = make_resolver(clock, stub)
+
+    assert resolver.getaddrinfo("127.0.0.1", 80)[0][4] == ("127.0.0.1", 80)
+    resolver.getaddrinfo("localhost", 80)
+    assert stub.calls == 0
@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
 import { Button } from './ui/Button';
 import axios from 'axios';
-import { usePlayerStore } from '../store/usePlayerStore';
+import { usePlayerStore, applyPlaylistDelta } from '../store/usePlayerStore';
 import { X, ListMusic, Check } from 'lucide-react';
 
 import { API_URL } from '../config';
@@ -26,7 +26,8 @@ export default function AddToPlaylistModal({ isOpen, onClose, songToAdd }) {
             const res = await axios.post(`${API_URL}/api/playlists/${playlistId}/songs`, songRef, {
                 headers: { 'X-User-ID': usePlayerStore.getState().userId }
             });
-            updatePlaylist(res.data);
+            const playlist = playlists.find(p => (p._id || p.id) === playlistId);
+            if (playlist) updatePlaylist(applyPlaylistDelta(playlist, res.data));
             onClose();
         } catch (err) {
             console.error("Failed to add to playlist:", err);
@@ -12,7 +12,7 @@ const MOODS = [
     { name: 'Party', emoji: '🎉', color: '#F39C12' }
 ];
 
-export default function MoodSelector({ selectedMoods = [], onMoodToggle, compact = false }) {
+export default function MoodSelector({ selectedMoods = [], onMoodToggle, compact = false, counts = {} }) {
     return (
         <div className={`flex flex-wrap gap-2 ${compact ? 'gap-1.5' : 'gap-2'}`}>
             {MOODS.map((mood) => {
@@ -37,6 +37,7 @@ export default function MoodSelector({ selectedMoods = [], onMoodToggle, compact
                     >
                         <span className={compact ? 'text-sm' : 'text-base'}>{mood.emoji}</span>
                         <span className="tracking-wide">{mood.name}</span>
+                        {counts[mood.name] > 0 && <span className="opacity-60">{counts[mood.name]}</span>}
                     </motion.button>
                 );
             })}
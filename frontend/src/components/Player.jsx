@@ -1,10 +1,12 @@
 import React, { useEffect, useRef, useState } from 'react';
-import { Howl } from 'howler';
+import { Howl, Howler } from 'howler';
+import axios from 'axios';
 import { usePlayerStore } from '../store/usePlayerStore';
 import { API_URL } from '../config';
 import { Play, Pause, SkipBack, SkipForward, Volume2, Repeat, Heart, ListMusic, Maximize2, Minimize2, ChevronDown, List, Trash2, Layout, MoreHorizontal, User, Wand2, Shuffle, Square, Rewind, FastForward } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Button } from './ui/Button';
+import Waveform from './Waveform';
 
 export default function Player() {
     const {
@@ -55,7 +57,15 @@ export default function Player() {
 
             // Determine format from original_filename
             const extension = currentSong.original_filename?.split('.').pop()?.toLowerCase();
-            const formatHint = extension ? [extension] : [];
+            let formatHint = extension ? [extension] : [];
+
+            // Local songs: ask for a transcoded rendition in a codec this browser plays;
+            // the server picks the bitrate from Save-Data/connection hints
+            const codecs = ['opus', 'm4a'].filter(codec => Howler.codecs(codec));
+            if (songUrl.startsWith(`${API_URL}/api/songs/`) && codecs.length > 0) {
+                songUrl = `${songUrl}/stream?codecs=${codecs.map(c => c === 'm4a' ? 'aac' : c).join(',')}`;
+                formatHint = [codecs[0]];
+            }
 
             try {
                 soundRef.current = new Howl({
@@ -121,6 +131,19 @@ export default function Player() {
 
     const [seek, setSeek] = useState(0);
     const [duration, setDuration] = useState(0);
+    const [peaks, setPeaks] = useState(null);
+
+    useEffect(() => {
+        // A few hundred bytes of precomputed peaks instead of decoding the track
+        setPeaks(null);
+        const id = currentSong?._id || currentSong?.id;
+        if (!id) return;
+        const controller = new AbortController();
+        axios.get(`${API_URL}/api/songs/${id}/waveform`, { responseType: 'arraybuffer', signal: controller.signal })
+            .then(res => setPeaks(new Uint8Array(res.data)))
+            .catch(() => {}); // No waveform: keep the plain progress bar
+        return () => controller.abort();
+    }, [currentSong]);
 
     useEffect(() => {
         let interval;
@@ -274,12 +297,16 @@ export default function Player() {
                                 <span className="text-[10px] font-mono text-white/50 w-10 text-right">
                                     {formatTime(seek)}
                                 </span>
-                                <div className="relative flex-1 h-1.5 bg-white/5 rounded-full overflow-hidden cursor-pointer" onClick={handleProgressBarClick}>
-                                    <div
-                                        className="absolute inset-y-0 left-0 bg-gradient-to-r from-[#268168] to-emerald-400 group-hover:from-emerald-400 group-hover:to-emerald-300 transition-all shadow-[0_0_10px_rgba(38,129,104,0.5)]"
-                                        style={{ width: `${(seek / (duration || 1)) * 100}%` }}
-                                    />
-                                </div>
+                                {peaks ? (
+                                    <Waveform peaks={peaks} progress={seek / (duration || 1)} onClick={handleProgressBarClick} />
+                                ) : (
+                                    <div className="relative flex-1 h-1.5 bg-white/5 rounded-full overflow-hidden cursor-pointer" onClick={handleProgressBarClick}>
+                                        <div
+                                            className="absolute inset-y-0 left-0 bg-gradient-to-r from-[#268168] to-emerald-400 group-hover:from-emerald-400 group-hover:to-emerald-300 transition-all shadow-[0_0_10px_rgba(38,129,104,0.5)]"
+                                            style={{ width: `${(seek / (duration || 1)) * 100}%` }}
+                                        />
+                                    </div>
+                                )}
                                 <span className="text-[10px] font-mono text-white/50 w-10">
                                     {formatTime(duration)}
                                 </span>
@@ -7,6 +7,7 @@ import axios from 'axios';
 import PlaylistModal from './PlaylistModal';
 import UploadModal from './UploadModal';
 import InstallGuideModal from './InstallGuideModal';
+import { MOODS } from './MoodSelector';
 import { motion, AnimatePresence } from 'framer-motion';
 
 import { API_URL } from '../config';
@@ -15,16 +16,18 @@ export default function Sidebar() {
     const {
         setCurrentSong,
         playlists,
-        setPlaylists,
         addPlaylist,
-        setSongs,
+        syncLibrary,
         isMobileMenuOpen,
         setIsMobileMenuOpen,
         deferredPrompt,
         setDeferredPrompt,
         userId,
         currentMoodFilter,
-        setMoodFilter
+        setMoodFilter,
+        songs,
+        moodCounts,
+        fetchMoodCounts
     } = usePlayerStore();
     const fileInputRef = useRef(null);
     const [isPlaylistModalOpen, setIsPlaylistModalOpen] = useState(false);
@@ -33,21 +36,17 @@ export default function Sidebar() {
     const [showAll, setShowAll] = useState(false);
     const location = useLocation();
 
-    // Fetch playlists on mount
+    // Sync the library (songs and playlists) on mount
     useEffect(() => {
-        const fetchPlaylists = async () => {
-            if (!userId) return; // Ensure userId is available before fetching
-            try {
-                const res = await axios.get(`${API_URL}/api/playlists`, {
-                    headers: { 'X-User-ID': userId }
-                });
-                setPlaylists(res.data);
-            } catch (err) {
-                console.error("Failed to fetch playlists:", err);
-            }
-        };
-        fetchPlaylists();
-    }, [setPlaylists, userId]); // Added userId to dependencies
+        if (!userId) return; // Ensure userId is available before fetching
+        syncLibrary();
+    }, [syncLibrary, userId]); // Added userId to dependencies
+
+    // Songs per mood for the filter buttons; revalidated with the library ETag
+    useEffect(() => {
+        if (!userId) return;
+        fetchMoodCounts();
+    }, [fetchMoodCounts, songs, userId]);
 
     const handleCreatePlaylist = async (data) => {
         if (!userId) {
@@ -58,11 +57,8 @@ export default function Sidebar() {
             await axios.post(`${API_URL}/api/playlists`, data, {
                 headers: { 'X-User-ID': userId }
             });
-            // Refetch playlists instead of adding manually to avoid duplicates
-            const res = await axios.get(`${API_URL}/api/playlists`, {
-                headers: { 'X-User-ID': userId }
-            });
-            setPlaylists(res.data);
+            // Sync instead of adding manually to avoid duplicates
+            await syncLibrary();
             setIsPlaylistModalOpen(false);
         } catch (err) {
             console.error("Failed to create playlist:", err);
@@ -89,10 +85,7 @@ export default function Sidebar() {
                     'X-User-ID': userId
                 },
             });
-            const songsRes = await axios.get(`${API_URL}/api/songs/`, {
-                headers: { 'X-User-ID': userId }
-            });
-            setSongs(songsRes.data);
+            await syncLibrary();
         } catch (error) {
             console.error("Error uploading file:", error);
         }
@@ -165,18 +158,9 @@ export default function Sidebar() {
             <div className="mt-8 pt-6 border-t border-[#268168]/10">
                 <p className="text-[10px] text-emerald-100/40 uppercase font-black tracking-[0.2em] mb-4">Filter by Mood</p>
                 <div className="flex flex-wrap gap-2">
-                    {['Happy', 'Sad', 'Energetic', 'Chill', 'Romantic', 'Angry', 'Focused', 'Party'].map((mood) => {
-                        const moodEmojis = {
-                            'Happy': '😊',
-                            'Sad': '😢',
-                            'Energetic': '⚡',
-                            'Chill': '😌',
-                            'Romantic': '💕',
-                            'Angry': '😤',
-                            'Focused': '🎯',
-                            'Party': '🎉'
-                        };
+                    {MOODS.map(({ name: mood, emoji }) => {
                         const isActive = currentMoodFilter === mood;
+                        const count = moodCounts[mood];
 
                         return (
                             <button
@@ -194,8 +178,9 @@ export default function Sidebar() {
                                     }
                                 `}
                             >
-                                <span>{moodEmojis[mood]}</span>
+                                <span>{emoji}</span>
                                 <span>{mood}</span>
+                                {count > 0 && <span className="opacity-60">{count}</span>}
                             </button>
                         );
                     })}
@@ -274,10 +259,8 @@ export default function Sidebar() {
                 isOpen={isPlaylistModalOpen}
                 onClose={() => {
                     setIsPlaylistModalOpen(false);
-                    // Refetch playlists when modal closes
-                    axios.get(`${API_URL}/api/playlists`, {
-                        headers: { 'X-User-ID': userId }
-                    }).then(res => setPlaylists(res.data));
+                    // Pick up the new playlist when modal closes
+                    syncLibrary();
                 }}
                 onAction={handleCreatePlaylist}
                 userId={userId}
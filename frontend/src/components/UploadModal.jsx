@@ -11,7 +11,7 @@ export default function UploadModal({ isOpen, onClose, onSuccess }) {
     const [selectedMoods, setSelectedMoods] = useState([]);
     const [isUploading, setIsUploading] = useState(false);
     const fileInputRef = useRef(null);
-    const { userId, setSongs } = usePlayerStore();
+    const { userId, setSongs, moodCounts } = usePlayerStore();
 
     if (!isOpen) return null;
 
@@ -80,6 +80,7 @@ export default function UploadModal({ isOpen, onClose, onSuccess }) {
                         <MoodSelector
                             selectedMoods={selectedMoods}
                             onMoodToggle={handleMoodToggle}
+                            counts={moodCounts}
                         />
                     </div>
 
@@ -0,0 +1,36 @@
+import React, { useEffect, useRef } from 'react';
+
+const BAR_WIDTH = 2;
+const BAR_GAP = 1;
+
+// Seek bar drawn from the precomputed peaks served by /api/songs/{id}/waveform
+export default function Waveform({ peaks, progress, onClick }) {
+    const canvasRef = useRef(null);
+
+    useEffect(() => {
+        const canvas = canvasRef.current;
+        if (!canvas || !peaks?.length) return;
+
+        const { width, height } = canvas.getBoundingClientRect();
+        const ratio = window.devicePixelRatio || 1;
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+        const ctx = canvas.getContext('2d');
+        ctx.scale(ratio, ratio);
+
+        // Each bar shows the loudest peak of its slice of the track
+        const bars = Math.max(1, Math.floor(width / (BAR_WIDTH + BAR_GAP)));
+        const perBar = peaks.length / bars;
+        for (let i = 0; i < bars; i++) {
+            const start = Math.floor(i * perBar);
+            const end = Math.max(start + 1, Math.floor((i + 1) * perBar));
+            let peak = 0;
+            for (let j = start; j < end && j < peaks.length; j++) peak = Math.max(peak, peaks[j]);
+            const barHeight = Math.max(1, (peak / 255) * height);
+            ctx.fillStyle = i / bars < progress ? '#268168' : 'rgba(255, 255, 255, 0.15)';
+            ctx.fillRect(i * (BAR_WIDTH + BAR_GAP), (height - barHeight) / 2, BAR_WIDTH, barHeight);
+        }
+    }, [peaks, progress]);
+
+    return <canvas ref={canvasRef} className="flex-1 h-8 cursor-pointer" onClick={onClick} />;
+}
@@ -3,7 +3,7 @@ import { createRoot } from 'react-dom/client'
 import './index.css'
 import App from './App.jsx'
 import { registerSW } from 'virtual:pwa-register'
-import { usePlayerStore } from './store/usePlayerStore'
+import { usePlayerStore, flushPendingPlays } from './store/usePlayerStore'
 
 // Register service worker for PWA
 const updateSW = registerSW({
@@ -27,6 +27,11 @@ window.addEventListener('beforeinstallprompt', (e) => {
   setDeferredPrompt(e);
 });
 
+// Sync plays recorded while offline as soon as the connection comes back
+window.addEventListener('online', () => {
+  flushPendingPlays(usePlayerStore.getState().userId);
+});
+
 createRoot(document.getElementById('root')).render(
   <StrictMode>
     <App />
@@ -21,16 +21,7 @@ export default function Home() {
         fetchSongs();
     }, []);
 
-    const fetchSongs = async () => {
-        try {
-            const response = await axios.get(`${API_URL}/api/songs`, {
-                headers: { 'X-User-ID': usePlayerStore.getState().userId }
-            });
-            setSongs(response.data);
-        } catch (error) {
-            console.error("Error fetching songs:", error);
-        }
-    };
+    const fetchSongs = () => usePlayerStore.getState().syncLibrary();
 
     const handleStartListening = () => {
         if (songs.length > 0) {
@@ -3,7 +3,7 @@ import { useParams, Link, useNavigate } from 'react-router-dom';
 import { Button } from '../components/ui/Button';
 import { Play, Pause, Music, MoreHorizontal, ListMusic, Trash2, Edit2, XCircle } from 'lucide-react';
 import axios from 'axios';
-import { usePlayerStore } from '../store/usePlayerStore';
+import { usePlayerStore, applyPlaylistDelta } from '../store/usePlayerStore';
 import EditPlaylistModal from '../components/EditPlaylistModal';
 
 import { API_URL } from '../config';
@@ -60,8 +60,9 @@ export default function PlaylistDetail() {
             const response = await axios.delete(`${API_URL}/api/playlists/${id}/songs/${songId}`, {
                 headers: { 'X-User-ID': usePlayerStore.getState().userId }
             });
-            setPlaylist(response.data);
-            updatePlaylist(response.data);
+            const updated = applyPlaylistDelta(playlist, response.data);
+            setPlaylist(updated);
+            updatePlaylist(updated);
         } catch (error) {
             console.error("Error removing song:", error);
             alert("Failed to remove song. Are you the owner?");
@@ -32,7 +32,9 @@ export default function SearchPage() {
         setIsLoading(true);
         try {
             // Local search
-            const localRes = await axios.get(`${API_URL}/api/search/?query=${encodeURIComponent(query)}`);
+            const localRes = await axios.get(`${API_URL}/api/search/?query=${encodeURIComponent(query)}`, {
+                headers: { 'X-User-ID': usePlayerStore.getState().userId }
+            });
             setResults(localRes.data);
 
             // External search (YouTube)
@@ -13,18 +13,106 @@ const generateUserId = () => {
     return result;
 };
 
+// Plays that couldn't be sent (e.g. offline) are kept here and synced in one batch later
+const PENDING_PLAYS_KEY = 'nexus-pending-plays';
+const MAX_PENDING_PLAYS = 1000;
+
+const readPendingPlays = () => {
+    try {
+        return JSON.parse(localStorage.getItem(PENDING_PLAYS_KEY)) || [];
+    } catch {
+        return [];
+    }
+};
+
+const writePendingPlays = (plays) => {
+    localStorage.setItem(PENDING_PLAYS_KEY, JSON.stringify(plays.slice(-MAX_PENDING_PLAYS)));
+};
+
+// The flush in progress, so the online handler and trackPlay never send the same batch twice
+let pendingFlush = null;
+
+export const flushPendingPlays = (userId) => {
+    if (pendingFlush) return pendingFlush;
+    pendingFlush = (async () => {
+        const batch = readPendingPlays();
+        if (batch.length === 0) return;
+        // Taken out before sending, so plays queued while the request is in flight stay queued
+        localStorage.removeItem(PENDING_PLAYS_KEY);
+        let unsent = [];
+        try {
+            const { data } = await axios.post(`${API_URL}/api/analytics/track/batch`, { events: batch }, {
+                headers: { 'X-User-ID': userId }
+            });
+            // The server queues a prefix of the batch when its buffer fills up
+            unsent = batch.slice(data?.accepted ?? batch.length);
+        } catch (err) {
+            console.error("Failed to sync offline plays:", err);
+            const status = err.response?.status;
+            // Offline or a server-side problem: try again later. Any other
+            // 4xx would be rejected the same way next time, so drop the batch
+            if (!status || status >= 500) unsent = batch;
+        }
+        if (unsent.length > 0) writePendingPlays([...unsent, ...readPendingPlays()]);
+    })().finally(() => {
+        pendingFlush = null;
+    });
+    return pendingFlush;
+};
+
 const trackPlay = async (song, userId) => {
     if (!song) return;
+    const id = song._id || song.id;
     try {
-        const id = song._id || song.id;
         await axios.post(`${API_URL}/api/analytics/track?song_id=${id}`, {}, {
             headers: { 'X-User-ID': userId }
         });
+        flushPendingPlays(userId);
     } catch (err) {
         console.error("Failed to track play:", err);
+        writePendingPlays([...readPendingPlays(), { song_id: id, timestamp: new Date().toISOString() }]);
     }
 };
 
+// Playlist edits return only what changed; replay it on our copy of the playlist
+export const applyPlaylistDelta = (playlist, delta) => {
+    let songs = [...(playlist.songs || [])];
+    const insertAt = (items, position) => {
+        if (position === null || position === undefined) return [...songs, ...items];
+        return [...songs.slice(0, position), ...items, ...songs.slice(position)];
+    };
+    for (const operation of delta.operations) {
+        if (operation.op === 'add') {
+            if (!songs.some(s => s.id === operation.song_id)) songs = insertAt([operation.song], operation.position);
+        } else if (operation.op === 'remove') {
+            songs = songs.filter(s => s.id !== operation.song_id);
+        } else if (operation.op === 'move') {
+            const moved = songs.filter(s => s.id === operation.song_id);
+            songs = songs.filter(s => s.id !== operation.song_id);
+            songs = insertAt(moved, operation.position);
+        }
+    }
+    return { ...playlist, songs, version: delta.version };
+};
+
+// Replace records by id, append new ones and drop tombstoned ones
+const mergeRecords = (records, changed, deleted) => {
+    const id = (r) => r._id || r.id;
+    const updates = new Map(changed.map(r => [id(r), r]));
+    const gone = new Set(deleted);
+    const merged = records
+        .filter(r => !gone.has(id(r)))
+        .map(r => {
+            const update = updates.get(id(r));
+            updates.delete(id(r));
+            return update || r;
+        });
+    return [...merged, ...updates.values()];
+};
+
+// One sync at a time: components mounting together share it
+let librarySync = null;
+
 export const usePlayerStore = create(
     persist(
         (set, get) => ({
@@ -40,9 +128,13 @@ export const usePlayerStore = create(
             isMobileMenuOpen: false,
             currentMoodFilter: null,
             deferredPrompt: null,
+            // Library version songs/playlists are at; 0 means never synced
+            libraryVersion: 0,
+            // Songs per mood, from /api/songs/moods/counts
+            moodCounts: {},
 
             setUserName: (name) => set({ userName: name }),
-            setUserId: (id) => set({ userId: id }),
+            setUserId: (id) => set({ userId: id, libraryVersion: 0 }),
             setIsMobileMenuOpen: (isOpen) => set({ isMobileMenuOpen: isOpen }),
             setDeferredPrompt: (prompt) => set({ deferredPrompt: prompt }),
             togglePlay: () => set((state) => {
@@ -55,6 +147,36 @@ export const usePlayerStore = create(
                 trackPlay(song, get().userId);
             },
             setSongs: (songs) => set({ songs }),
+            // Fetch only what changed since the last sync (full lists the first time)
+            syncLibrary: () => {
+                if (!librarySync) {
+                    librarySync = (async () => {
+                        const headers = { 'X-User-ID': get().userId };
+                        let since = get().libraryVersion;
+                        for (;;) {
+                            const { data } = await axios.get(`${API_URL}/api/sync`, { params: { since }, headers });
+                            if (data.reset) {
+                                const [songsRes, playlistsRes] = await Promise.all([
+                                    axios.get(`${API_URL}/api/songs`, { headers }),
+                                    axios.get(`${API_URL}/api/playlists`, { headers }),
+                                ]);
+                                set({ songs: songsRes.data, playlists: playlistsRes.data, libraryVersion: data.version });
+                                return;
+                            }
+                            set((state) => ({
+                                songs: mergeRecords(state.songs, data.songs, data.deleted.songs),
+                                playlists: mergeRecords(state.playlists, data.playlists, data.deleted.playlists),
+                                libraryVersion: data.version,
+                            }));
+                            if (!data.has_more) return;
+                            since = data.version;
+                        }
+                    })()
+                        .catch((err) => console.error("Failed to sync library:", err))
+                        .finally(() => { librarySync = null; });
+                }
+                return librarySync;
+            },
             setPlaylists: (playlists) => set({ playlists }),
             addPlaylist: (playlist) => set((state) => ({ playlists: [...state.playlists, playlist] })),
             updatePlaylist: (updatedPlaylist) => set((state) => ({
@@ -107,6 +229,16 @@ export const usePlayerStore = create(
             }),
 
             setMoodFilter: (mood) => set({ currentMoodFilter: mood }),
+            fetchMoodCounts: async () => {
+                try {
+                    const res = await axios.get(`${API_URL}/api/songs/moods/counts`, {
+                        headers: { 'X-User-ID': get().userId }
+                    });
+                    set({ moodCounts: res.data });
+                } catch (err) {
+                    console.error("Failed to fetch mood counts:", err);
+                }
+            },
         }),
         {
             name: 'nexus-player-storage',